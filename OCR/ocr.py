@@ -1,6 +1,23 @@
+import functools
+
 import pytesseract
 from PIL import Image
 
+OCR_LANG = "pan"  # Tesseract language model
+
+
+@functools.lru_cache(maxsize=1)
+def engine_version() -> str:
+    """
+    Tesseract version and language, identifying the OCR output of a given image.
+    """
+    try:
+        version = str(pytesseract.get_tesseract_version())
+    except Exception:
+        version = "unknown"
+    return f"tesseract-{version}-{OCR_LANG}"
+
+
 def read_image(image_path):
     """
     Reads an image from a given path using the Pillow library.
@@ -22,6 +39,6 @@ def image_to_text(image):
     """
 
     # Use Tesseract to do OCR on the image
-    text = pytesseract.image_to_string(image, lang="pan")
+    text = pytesseract.image_to_string(image, lang=OCR_LANG)
 
     return text
\ No newline at end of file
@@ -1,29 +1,116 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
-from typing import List, Dict, Any
-import hashlib
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+import xxhash
+
+from utils import logger
 
 
 LANGUAGES = ["punjabi", "hindi", "english"]
-CHUNK_SIZE = 400
-CHUNK_OVERLAP = 100
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "128"))  # tokens, well inside the input limits of e5 (512) and IndicTrans2 (256)
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))  # tokens, always whole sentences
+SPLITTER_TOKENIZER = os.getenv("SPLITTER_TOKENIZER", "intfloat/multilingual-e5-small")
+FALLBACK_CHARS_PER_TOKEN = 3.0  # used when the tokenizer cannot be loaded
+MAX_CHARS_PER_TOKEN = 8
+MAX_OVERLAP_CHARS = CHUNK_OVERLAP * MAX_CHARS_PER_TOKEN  # upper bound of an overlap in characters
+
+# Sentence ends: danda, double danda, ASCII pipes OCR'd from dandas, and Latin punctuation,
+# followed by whitespace. "॥੧॥" verse numbers stay with their verse. Blank lines end paragraphs.
+SENTENCE_BOUNDARY = re.compile(r"(?<=[\u0964\u0965|.?!])\s+|\n\s*\n\s*")
+WORD_BOUNDARY = re.compile(r"(?<=\S)\s+")
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(name: str = SPLITTER_TOKENIZER):
+    """Fast tokenizer used to size chunks, loaded once per process. None if it is unavailable."""
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(name, use_fast=True)
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer {name}, estimating token counts from characters: {e}")
+        return None
+
+
+def _spans(text: str, boundary: re.Pattern, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the pieces of text[start:end] between boundary matches, whitespace excluded."""
+    end = len(text) if end is None else end
+    spans, piece_start = [], start
+    for match in boundary.finditer(text, start, end):
+        if text[piece_start:match.start()].strip():
+            spans.append((piece_start, match.start()))
+        piece_start = match.end()
+    if text[piece_start:end].strip():
+        spans.append((piece_start, end))
+    return spans
+
 
 class MultilingualTextSplitter:
-    """Custom text splitter that maintains parallel chunks across languages."""
+    """
+    Splits OCR text into chunks of at most `chunk_size` tokens along sentence boundaries.
+
+    Sentences are detected for Gurmukhi/Devanagari (danda, double danda) and Latin punctuation and
+    packed into chunks by their token count under the embedder's tokenizer. Consecutive chunks
+    share up to `chunk_overlap` tokens of whole sentences. Chunk texts are exact slices of the
+    input, so the overlap can be found again when neighbouring chunks are merged into a context.
+    """
     
-    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, tokenizer_name=SPLITTER_TOKENIZER):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        # Base splitter for creating initial chunks
-        self.base_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", "।", ".", "!", "?"]
-        )
+        self.tokenizer_name = tokenizer_name
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token counts of several texts, tokenized in one batch."""
+        if not texts:
+            return []
+        tokenizer = load_tokenizer(self.tokenizer_name)
+        if tokenizer is None:
+            return [int(len(text) / FALLBACK_CHARS_PER_TOKEN) + 1 for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=False, return_attention_mask=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _sentences(self, text: str) -> List[Tuple[int, int, int]]:
+        """(start, end, tokens) of each sentence; sentences over the budget are split at word boundaries."""
+        spans = _spans(text, SENTENCE_BOUNDARY)
+        counts = self.count_tokens([text[start:end] for start, end in spans])
+        sentences = []
+        for (start, end), tokens in zip(spans, counts):
+            if tokens <= self.chunk_size:
+                sentences.append((start, end, tokens))
+                continue
+            words = _spans(text, WORD_BOUNDARY, start, end)
+            word_counts = self.count_tokens([text[s:e] for s, e in words])
+            sentences.extend((s, e, n) for (s, e), n in zip(words, word_counts))
+        return sentences
+
+    def split_text(self, text: str) -> List[str]:
+        """Split one text into chunks of at most chunk_size tokens."""
+        sentences = self._sentences(text)
+        chunks = []
+        first = 0
+        while first < len(sentences):
+            last, tokens = first, sentences[first][2]
+            while last + 1 < len(sentences) and tokens + sentences[last + 1][2] <= self.chunk_size:
+                last += 1
+                tokens += sentences[last][2]
+            chunks.append(text[sentences[first][0]:sentences[last][1]])
+            if last + 1 >= len(sentences):
+                break
+
+            # Start the next chunk with the trailing sentences that fit in the overlap
+            next_first, overlap = last + 1, 0
+            while next_first - 1 > first and overlap + sentences[next_first - 1][2] <= self.chunk_overlap:
+                next_first -= 1
+                overlap += sentences[next_first][2]
+            first = next_first
+        return chunks
     
     def generate_chunk_id(self, text: str, doc_id: str, idx: int) -> str:
         """Generate a deterministic ID for a chunk based on content and position."""
-        content_hash = hashlib.md5(text.encode()).hexdigest()[:10]
+        content_hash = xxhash.xxh64_hexdigest(text.encode())[:10]
         return f"{doc_id}_{idx}_{content_hash}"
     
     def split_documents(self, document: str, doc_uuid: str) -> Dict[str, List[Dict]]:
@@ -43,15 +130,15 @@ class MultilingualTextSplitter:
         punjabi_chunks = []
         # for doc_idx, doc_text in enumerate(document):
         doc_id = f"doc_{doc_uuid}"
-        chunks = self.base_splitter.create_documents([document])
+        chunks = self.split_text(document)
             
         for chunk_idx, chunk in enumerate(chunks):
-            chunk_id = self.generate_chunk_id(chunk.page_content, doc_id, chunk_idx)
+            chunk_id = self.generate_chunk_id(chunk, doc_id, chunk_idx)
             punjabi_chunks.append({
                 "doc_id": doc_id,
                 "chunk_id": chunk_id,
                 "chunk_idx": chunk_idx,
-                "text": chunk.page_content
+                "text": chunk
             })
         
         # Store Punjabi chunks
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import tracing
+from metrics import Histogram, time_stage
+from utils import logger
+
+# === Micro-batching of concurrent query embeddings ===
+
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))  # how long a batch collects queries
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))  # a full batch is encoded without waiting
+
+batch_sizes = Histogram(
+    "pdl_query_embed_batch_size",
+    "Queries embedded per batched encode.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+def embed_queries(embedder, queries: List[str]) -> np.ndarray:
+    """Embed several queries in one encode, for embedders that support it, otherwise one by one."""
+    batched = getattr(embedder, "embed_queries", None)
+    if batched is not None:
+        return np.asarray(batched(queries))
+    return np.stack([np.asarray(embedder.embed_query(query)) for query in queries])
+
+
+class QueryEmbeddingBatcher:
+    """
+    Collects embed_query calls from concurrent requests and encodes them together.
+
+    A query that arrives alone is encoded right away. When other queries are already pending,
+    the batch waits up to `window_ms` for more to join (less if it fills up), then the whole
+    batch runs as one encode in a worker thread. Queries arriving while a batch is encoding
+    form the next batch, so only one encode runs at a time and a busy
+    process naturally batches more. Only queries for the same embedder are batched together.
+    """
+
+    def __init__(self, get_embedder: Callable, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch: int = EMBED_MAX_BATCH, model_name: str = ""):
+        """
+        Args:
+            get_embedder: Returns the embedder for queries submitted without one, looked up per batch
+            window_ms: Time a batch of concurrent queries collects more before it is encoded
+            max_batch: Largest number of queries per encode
+            model_name: Model label for the query_embed_batch stage metrics
+        """
+        self.get_embedder = get_embedder
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.model_name = model_name
+        self._pending: List[Tuple[str, object, asyncio.Future]] = []
+        self._full = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def embed(self, query: str, embedder=None) -> np.ndarray:
+        """
+        Embedding of one query, computed as part of a batch.
+
+        Args:
+            query: Query text
+            embedder: Embedder to use, e.g. that of the served index the query will search;
+                get_embedder() at encode time if None
+        """
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and self._loop is not loop and self._loop.is_closed():
+            # The loop the last batch ran on was closed mid-batch, its callers are gone
+            self._worker, self._pending = None, []
+        if self._worker is not None and self._loop is not loop:
+            # Batches belong to one event loop; callers on another loop (e.g. Streamlit's) embed directly
+            vectors = await tracing.to_thread(embed_queries, embedder or self.get_embedder(), [query])
+            return vectors[0]
+
+        future = loop.create_future()
+        self._pending.append((query, embedder, future))
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        if self._worker is None:
+            self._loop = loop
+            self._full = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        # Runs in the context of the request that started it, so encodes keep that request's trace
+        try:
+            while self._pending:
+                # A lone query does not wait: under low load the window would only add latency
+                if 1 < len(self._pending) < self.max_batch and self.window > 0:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                # The oldest query's embedder, with the other queries for it (a generation swap
+                # can leave queries for the old and the new embedder pending at the same time)
+                embedder = self._pending[0][1]
+                batch = [entry for entry in self._pending if entry[1] is embedder][:self.max_batch]
+                taken = {id(entry) for entry in batch}
+                self._pending = [entry for entry in self._pending if id(entry) not in taken]
+                self._full.clear()
+                if len(self._pending) >= self.max_batch:
+                    self._full.set()
+
+                queries = [query for query, _, _ in batch]
+                try:
+                    vectors = await tracing.to_thread(self._encode, queries, embedder)
+                except Exception as e:
+                    logger.error(f"Batched query embedding failed: {e}")
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), vector in zip(batch, vectors):
+                    if not future.done():  # the caller may have gone away
+                        future.set_result(vector)
+        finally:
+            self._worker = None
+
+    def _encode(self, queries: List[str], embedder=None) -> np.ndarray:
+        batch_sizes.observe(len(queries))
+        with time_stage("query_embed_batch", model=self.model_name, items=len(queries)):
+            return embed_queries(embedder or self.get_embedder(), queries)
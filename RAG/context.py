@@ -0,0 +1,168 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain.schema import Document
+
+from RAG.TextSplitter import MAX_OVERLAP_CHARS
+
+MAX_CONTEXT_TOKENS = 1500
+CHARS_PER_TOKEN = 3.5  # Rough average for gemma tokenizers on mixed Gurmukhi/Devanagari/Latin text
+MIN_OVERLAP_CHARS = 8  # Shorter matches are likely to be coincidence, not splitter overlap
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate used when no tokenizer for the LLM is available in-process.
+    """
+    if not text:
+        return 0
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def find_overlap(previous: str, following: str, max_overlap: int = MAX_OVERLAP_CHARS) -> int:
+    """
+    Length of the longest suffix of `previous` that is also a prefix of `following`.
+
+    Args:
+        previous: Text of the earlier chunk
+        following: Text of the chunk that comes right after it in the document
+        max_overlap: Largest overlap to look for, in characters
+
+    Returns:
+        Number of overlapping characters, 0 if none was found
+    """
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+class ContextBuilder:
+    """
+    Builds the LLM context from retrieved chunks.
+
+    Chunks that are neighbours in the same document (consecutive `chunk_idx` for one `doc_id`)
+    are merged into a single passage with the splitter overlap removed, and passages are then
+    packed in retrieval order until the token budget is used up.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = MAX_CONTEXT_TOKENS,
+        max_overlap: int = MAX_OVERLAP_CHARS,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.max_overlap = max_overlap
+        self.count_tokens = token_counter or estimate_tokens
+
+    def merge_neighbours(self, documents: List[Document]) -> List[str]:
+        """
+        Merge adjacent chunks of the same document, keeping the order of the best-ranked chunk.
+
+        Args:
+            documents: Retrieved documents, most relevant first
+
+        Returns:
+            List of passage texts, most relevant first
+        """
+        runs: List[Tuple[int, List[Document]]] = []
+        by_doc: Dict[str, List[Tuple[int, Document]]] = {}
+        for rank, doc in enumerate(documents):
+            doc_id = doc.metadata.get("doc_id")
+            if doc_id is None or doc.metadata.get("chunk_idx") is None:
+                runs.append((rank, [doc]))
+                continue
+            by_doc.setdefault(doc_id, []).append((rank, doc))
+
+        for ranked_docs in by_doc.values():
+            ranked_docs.sort(key=lambda item: item[1].metadata["chunk_idx"])
+            run_rank, run = ranked_docs[0][0], [ranked_docs[0][1]]
+            for rank, doc in ranked_docs[1:]:
+                gap = doc.metadata["chunk_idx"] - run[-1].metadata["chunk_idx"]
+                if gap == 0:
+                    # Same chunk retrieved twice, keep the better rank only
+                    run_rank = min(run_rank, rank)
+                    continue
+                if gap == 1:
+                    run.append(doc)
+                    run_rank = min(run_rank, rank)
+                    continue
+                runs.append((run_rank, run))
+                run_rank, run = rank, [doc]
+            runs.append((run_rank, run))
+
+        runs.sort(key=lambda item: item[0])
+        return [self._join_run(run) for _, run in runs]
+
+    def _join_run(self, run: List[Document]) -> str:
+        text = run[0].page_content
+        for doc in run[1:]:
+            following = doc.page_content
+            overlap = find_overlap(text, following, self.max_overlap)
+            if overlap:
+                text += following[overlap:]
+            else:
+                text += "\n" + following
+        return text
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """Cut text down to roughly `budget` tokens, preferring to stop at a sentence end."""
+        end = int(len(text) * budget / max(self.count_tokens(text), 1))
+        while end > 0 and self.count_tokens(text[:end]) > budget:
+            end = int(end * 0.9)
+        cut = text[:end]
+        boundary = max(cut.rfind(sep) for sep in ("।", ".", "\n"))
+        if boundary > len(cut) // 2:
+            cut = cut[:boundary + 1]
+        return cut
+
+    def build(self, documents: List[Document]) -> Tuple[str, Dict[str, int]]:
+        """
+        Build the context string for the prompt.
+
+        Args:
+            documents: Retrieved documents, most relevant first
+
+        Returns:
+            Tuple of the context string and stats about the packing:
+            naive_tokens (what plain concatenation would have cost), context_tokens,
+            tokens_saved, chunks, passages and passages_dropped
+        """
+        naive_tokens = sum(
+            self.count_tokens(f"Document {i+1}:\n{doc.page_content}\n\n")
+            for i, doc in enumerate(documents)
+        )
+
+        context_str = ""
+        used_tokens = 0
+        packed = 0
+        passages = self.merge_neighbours(documents)
+        for passage in passages:
+            header = f"Document {packed+1}:\n"
+            entry = f"{header}{passage}\n\n"
+            entry_tokens = self.count_tokens(entry)
+            remaining = self.max_tokens - used_tokens
+            if entry_tokens > remaining:
+                # Fill what is left of the budget with the start of this passage, then stop
+                text_budget = remaining - self.count_tokens(header) - 1
+                if text_budget > 0:
+                    partial = self._truncate(passage, text_budget)
+                    if partial:
+                        entry = f"{header}{partial}\n\n"
+                        context_str += entry
+                        used_tokens += self.count_tokens(entry)
+                        packed += 1
+                break
+            context_str += entry
+            used_tokens += entry_tokens
+            packed += 1
+
+        stats = {
+            "chunks": len(documents),
+            "passages": len(passages),
+            "passages_dropped": len(passages) - packed,
+            "naive_tokens": naive_tokens,
+            "context_tokens": used_tokens,
+            "tokens_saved": max(naive_tokens - used_tokens, 0),
+        }
+        return context_str, stats
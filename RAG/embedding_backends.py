@@ -0,0 +1,164 @@
+import json
+import os
+import platform
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from filelock import FileLock, Timeout
+from sentence_transformers import SentenceTransformer
+
+from utils import logger
+
+# === Embedding model backends and batch size calibration ===
+
+BACKENDS = ("torch", "int8", "onnx")
+CALIBRATION_DIR = os.getenv("EMBEDDING_CALIBRATION_DIR", "calibration")
+CALIBRATION_FILE = os.path.join(CALIBRATION_DIR, "embedding_calibration.json")
+CALIBRATION_LOCK_TIMEOUT = 600  # seconds to wait for another process calibrating the same host
+BATCH_SIZE_CANDIDATES = (1, 4, 8, 16, 32, 64, 128)
+DEFAULT_BATCH_SIZE = 32  # SentenceTransformer's own default
+CALIBRATION_TEXTS = 256
+CALIBRATION_TEXT_CHARS = 500  # about one chunk
+
+
+def load_model(model_name: str, backend: str = "torch") -> SentenceTransformer:
+    """
+    Load a SentenceTransformer on one of the CPU backends.
+
+    Args:
+        model_name: Hugging Face model name or local path
+        backend: "torch" (fp32), "int8" (torch dynamic quantization of the Linear layers)
+            or "onnx" (ONNX Runtime, needs `pip install optimum[onnxruntime]`)
+
+    Returns:
+        The loaded model; encode() works the same for every backend
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(model_name, backend="onnx")
+        except ImportError as e:
+            raise RuntimeError("The onnx embedding backend needs `pip install optimum[onnxruntime]`") from e
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def sample_texts(count: int = CALIBRATION_TEXTS, chars: int = CALIBRATION_TEXT_CHARS) -> List[str]:
+    """Deterministic Gurmukhi-like texts about the size of a chunk, for calibration and benchmarks."""
+    rng = np.random.default_rng(0)
+    letters = [chr(c) for c in range(0x0A15, 0x0A39)] + ["ਾ", "ਿ", "ੀ", "ੁ", "ੇ", "ੋ"]
+    texts = []
+    for _ in range(count):
+        words = ["".join(rng.choice(letters, size=rng.integers(2, 7))) for _ in range(chars // 5)]
+        texts.append(" ".join(words)[:chars])
+    return texts
+
+
+def measure_throughput(model: SentenceTransformer, texts: Sequence[str], batch_size: int) -> float:
+    """Texts per second encoding `texts` with the given batch size (after one warm-up batch)."""
+    model.encode(list(texts[:batch_size]), batch_size=batch_size, show_progress_bar=False)
+    start = time.perf_counter()
+    model.encode(list(texts), batch_size=batch_size, show_progress_bar=False)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def calibrate_batch_size(model: SentenceTransformer, texts: Optional[Sequence[str]] = None,
+                         candidates: Sequence[int] = BATCH_SIZE_CANDIDATES) -> Dict:
+    """
+    Find the batch size with the highest encode throughput on this CPU.
+
+    Candidates are tried in increasing order and the search stops once throughput has dropped
+    below 90% of the best for two sizes in a row, since larger batches only add padding from there.
+
+    Returns:
+        {"batch_size": best, "texts_per_s": {batch size: throughput}}
+    """
+    texts = list(texts) if texts is not None else sample_texts()
+    throughput: Dict[int, float] = {}
+    best, worse = 0, 0
+    for batch_size in candidates:
+        throughput[batch_size] = round(measure_throughput(model, texts, batch_size), 1)
+        if not best or throughput[batch_size] > throughput[best]:
+            best, worse = batch_size, 0
+        elif throughput[batch_size] < 0.9 * throughput[best]:
+            worse += 1
+            if worse == 2:
+                break
+    logger.info(f"Calibrated embedding batch size {best}: {throughput}")
+    return {"batch_size": best, "texts_per_s": throughput}
+
+
+def _host_key(model_name: str, backend: str) -> str:
+    return f"{model_name}|{backend}|{platform.machine()}|{os.cpu_count()}"
+
+
+def calibrated_batch_size(model: SentenceTransformer, model_name: str, backend: str,
+                          path: str = CALIBRATION_FILE) -> int:
+    """
+    Batch size for this model, backend and host, calibrated once and cached in `path`.
+
+    Calibration runs under a file lock next to `path`, so processes starting together neither
+    skew each other's measurements nor overwrite each other's results; the cache is replaced
+    atomically through a unique temporary file. Falls back to DEFAULT_BATCH_SIZE if
+    calibration fails or the lock cannot be taken.
+    """
+    key = _host_key(model_name, backend)
+    cache = _read_calibration(path)
+    if key in cache:
+        return cache[key]["batch_size"]
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with FileLock(f"{path}.lock", timeout=CALIBRATION_LOCK_TIMEOUT):
+            # Another process may have calibrated while this one waited for the lock
+            cache = _read_calibration(path)
+            if key in cache:
+                return cache[key]["batch_size"]
+            result = calibrate_batch_size(model)
+            cache[key] = result
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".calibration-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(cache, f, indent=2)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+    except Timeout:
+        logger.error(f"Timed out waiting for embedding batch size calibration, using {DEFAULT_BATCH_SIZE}")
+        return DEFAULT_BATCH_SIZE
+    except Exception as e:
+        logger.error(f"Embedding batch size calibration failed, using {DEFAULT_BATCH_SIZE}: {e}")
+        return DEFAULT_BATCH_SIZE
+    return result["batch_size"]
+
+
+def _read_calibration(path: str) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Row-wise cosine similarity between embeddings of the same texts from two backends.
+
+    Returns:
+        Mean and minimum cosine similarity
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {"mean_cosine": round(float(cosines.mean()), 5), "min_cosine": round(float(cosines.min()), 5)}
@@ -1,82 +1,467 @@
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+import faiss
 import numpy as np
 import os
 import shutil
 import json
-from sentence_transformers import SentenceTransformer
-from typing import Dict, List
-from utils import logger  
+import tempfile
+import heapq
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+from utils import logger, log_event
 from langchain.schema import Document
 from langchain.embeddings.base import Embeddings
 from utils import DATA_DIR
+from metrics import time_stage
+from resources import governor
+from RAG.embedding_backends import calibrated_batch_size, load_model
+from RAG.filters import SearchFilter, filtered_search, metadata_index
+from RAG.index_manifest import (collect_garbage, manifest_stamp, read_manifest, versioned_dir_name,
+                                write_manifest, writer_lock)
 
 from RAG.TextSplitter import MultilingualTextSplitter
 
 LANGUAGES = ["punjabi", "hindi", "english"]
 MODEL_NAME = "intfloat/multilingual-e5-small"  
 EMBEDDING_DIR = "faiss_indexes"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch", "int8" or "onnx"
+EMBEDDING_BATCH_SIZE = os.getenv("EMBEDDING_BATCH_SIZE", "32")  # a number, or "auto" to calibrate once per host
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))  # shards per language for new indexes
+SHARD_BY = os.getenv("SHARD_BY", "doc_id")  # "doc_id" (hash) or "collection"
+DELTA_MAX_VECTORS = int(os.getenv("INDEX_DELTA_MAX_VECTORS", "10000"))  # a shard's delta is merged at this size
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+RELOAD_CHECK_INTERVAL = 1.0  # seconds between checks for an index version published by another process
 
 os.makedirs(EMBEDDING_DIR, exist_ok=True)
 
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="faiss-search")
+
 class MultilingualEmbedder(Embeddings):
 
-    def __init__(self, model_name=MODEL_NAME):
+    def __init__(self, model_name=MODEL_NAME, backend: str = EMBEDDING_BACKEND, batch_size: str = EMBEDDING_BATCH_SIZE):
         """
         Initializes the SentenceTransformer model for multilingual embeddings.
+
+        Args:
+            model_name: SentenceTransformer model
+            backend: "torch" (fp32), "int8" or "onnx", see RAG.embedding_backends
+            batch_size: Encode batch size, or "auto" to use the size calibrated for this host
         """
-        logger.info(f"Loading SentenceTransformer model: {model_name}")
-        self.model = SentenceTransformer(model_name)
-        logger.info(f"Model loaded successfully: {model_name}")
+        logger.info(f"Loading SentenceTransformer model: {model_name} ({backend})")
+        self.backend = backend
+        self.model = load_model(model_name, backend)
+        if str(batch_size) == "auto":
+            self.batch_size = calibrated_batch_size(self.model, model_name, backend)
+        else:
+            self.batch_size = int(batch_size)
+        logger.info(f"Model loaded successfully: {model_name}, batch size {self.batch_size}")
     
     def embed_documents(self, texts: List[str]) -> np.ndarray:
         """
         Embeds a list of Document objects using the SentenceTransformer model.
         """
         texts = ["passage: " + text for text in texts]  # Prepend 'passage: ' to each text
-        return self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+        with governor.pinned("embedding"):
+            return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=True)
     
     def embed_query(self, query: str) -> np.ndarray:
         """
         Embeds a single query using the SentenceTransformer model.
         """
-        query = "query: " + query  # Prepend 'query: ' to the query
-        return self.model.encode([query], convert_to_numpy=True, show_progress_bar=True)[0]
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embeds several queries in one batched encode.
+        """
+        queries = ["query: " + query for query in queries]
+        with governor.pinned("embedding"):
+            return self.model.encode(queries, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+def shard_key(doc: Dict, shard_by: Optional[str] = None) -> str:
+    """Value that decides which shard a chunk (or its metadata) belongs to, by `shard_by` (SHARD_BY by default)."""
+    if (shard_by or SHARD_BY) == "collection" and doc.get("collection"):
+        return f"collection:{doc['collection']}"
+    return doc["doc_id"]
+
+
+def shard_names(language: str, num_shards: int) -> List[str]:
+    """Store names of a language's shards. A single shard keeps the plain language name."""
+    if num_shards == 1:
+        return [language]
+    return [f"{language}_{shard}" for shard in range(num_shards)]
+
+
+def delta_name(shard: str) -> str:
+    """Store name of the small index a shard's new chunks are appended to until it is merged."""
+    return f"{shard}_delta"
+
+
+def store_names(language: str, num_shards: int) -> List[str]:
+    """Every store of a language: each shard followed by its delta."""
+    return [name for shard in shard_names(language, num_shards) for name in (shard, delta_name(shard))]
+
+
+class ServingIndex:
+    """
+    One consistent view of the served index: every shard's store, the shard layout (count and
+    SHARD_BY key, None for indexes written before the key was recorded), and the embedder,
+    model, encoder backend and generation that produced the vectors. The backend is kept here
+    rather than read from the embedder, since stand-in embedders (benchmarks) have none. Never modified, a new version or
+    generation replaces the whole object, so a query that embeds with `embedder` and searches
+    `vector_stores` of the same ServingIndex never mixes two generations.
+    """
+
+    FIELDS = ("vector_stores", "embedder", "model_name", "backend", "num_shards", "shard_by", "generation")
+
+    def __init__(self, vector_stores: Dict[str, Optional[FAISS]], embedder: "MultilingualEmbedder",
+                 model_name: str, backend: str, num_shards: int, shard_by: Optional[str], generation: int):
+        self.vector_stores = vector_stores
+        self.embedder = embedder
+        self.model_name = model_name
+        self.backend = backend
+        self.num_shards = num_shards
+        self.shard_by = shard_by
+        self.generation = generation
+
+    def replace(self, **changes) -> "ServingIndex":
+        fields = {name: getattr(self, name) for name in self.FIELDS}
+        fields.update(changes)
+        return ServingIndex(**fields)
+
+    def same_layout(self, other: "ServingIndex") -> bool:
+        """Whether vectors embedded and routed for `other` can be written into this index."""
+        return (self.generation == other.generation and self.embedder is other.embedder
+                and self.num_shards == other.num_shards and self.shard_by == other.shard_by)
+
+    def language_stores(self, language: str) -> List[FAISS]:
+        """Non-empty stores (shards and their deltas) of a language."""
+        stores = (self.vector_stores.get(name) for name in store_names(language, self.num_shards))
+        return [store for store in stores if store is not None]
+
+
+def _serving_field(name: str) -> property:
+    # Reads one field of the served ServingIndex; assigning swaps in a copy with that field changed
+    def get(self):
+        return getattr(self._serving, name)
+
+    def set(self, value):
+        self._serving = self._serving.replace(**{name: value})
+
+    return property(get, set, doc=f"{name} of the served index (see ServingIndex)")
+
 
 class FaissEmbeddingStore:
-    def __init__(self, model_name=MODEL_NAME, persist_dir=EMBEDDING_DIR):
+    vector_stores = _serving_field("vector_stores")
+    embedder = _serving_field("embedder")
+    model_name = _serving_field("model_name")
+    backend = _serving_field("backend")
+    num_shards = _serving_field("num_shards")
+    shard_by = _serving_field("shard_by")
+    generation = _serving_field("generation")
+
+    def __init__(self, model_name=MODEL_NAME, persist_dir=EMBEDDING_DIR, num_shards: int = INDEX_SHARDS):
         """
         Initializes the FaissEmbeddingStore with a multilingual embedder and FAISS indexes for each language.
+
+        Each language can be split into several shards (by doc_id hash, or by collection when
+        SHARD_BY=collection; the key is recorded in the manifest and the recorded one wins for
+        existing data, change it with RAG.reembed). Searches fan out to all shards of a language in
+        parallel, writes and deletes only rebuild the shards they touch. New chunks go to a small
+        delta store per shard, searched alongside it and merged into it once it holds
+        DELTA_MAX_VECTORS, so a write copies the delta rather than the whole shard.
+
+        The indexes on disk are shared by every process using the same persist_dir (uvicorn workers,
+        the Streamlit app). Writers publish a new index version through the manifest, readers pick
+        it up on their next search.
         """
         self.persist_dir = persist_dir
-        self.embedder = MultilingualEmbedder(model_name)
-        self.vector_stores = {}
+        # The model of the published index generation wins over the configured one: queries have
+        # to be embedded by the model that embedded the chunks (switch with RAG.reembed)
+        manifest = read_manifest(persist_dir)
+        backend = manifest.get("backend") or EMBEDDING_BACKEND
+        if manifest.get("model_name") and (manifest["model_name"], backend) != (model_name, EMBEDDING_BACKEND):
+            logger.warning(f"Index generation {manifest.get('generation', 0)} in {persist_dir} was embedded with "
+                           f"{manifest['model_name']} ({backend}), using that instead of the configured {model_name}")
+            model_name = manifest["model_name"]
+        self._serving = ServingIndex({}, MultilingualEmbedder(model_name, backend), model_name, backend,
+                                     max(1, num_shards), SHARD_BY, manifest.get("generation", 0))
+        self._previous: Optional[Dict] = manifest.get("previous")
+        self.version = -1
+        self._store_dirs: Dict[str, Optional[str]] = {}
+        self._failed_loads: Set[str] = set()  # shards of the served version that could not be loaded
+        self._manifest_stamp = None
+        self._last_reload_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._write_lock = threading.Lock()
 
-        for lang in LANGUAGES:
-            self.vector_stores[lang] = None
-            self._load_vector_store(lang)
+        self.refresh(force=True)
 
-    def _get_store_path(self, language: str) -> str:
-        """Get the file path for a language's vector store."""
-        return os.path.join(self.persist_dir, f"{language}_index")
-    
-    def _load_vector_store(self, language: str) -> None:
-        """Load a vector store for a specific language if it exists."""
-        store_path = self._get_store_path(language)
-        if os.path.exists(store_path):
-            try:
-                self.vector_stores[language] = FAISS.load_local(
-                    store_path,
-                    self.embedder,
-                    allow_dangerous_deserialization=True
-                )
-                logger.info(f"Loaded existing vector store for {language}")
-            except Exception as e:
-                logger.error(f"Error loading vector store for {language}: {e}")
-    
-    def add_documents(self, chunked_docs: Dict[str, List[Dict]]):
+    def _shard_names(self, language: str, num_shards: Optional[int] = None) -> List[str]:
+        """Store names of a language's shards, in the served layout unless `num_shards` is given."""
+        return shard_names(language, num_shards or self.num_shards)
+
+    def _shard_for(self, language: str, doc: Dict, num_shards: Optional[int] = None,
+                   shard_by: Optional[str] = None) -> str:
+        """Store name of the shard a chunk (or a document's metadata) is written to, in the served layout by default."""
+        names = self._shard_names(language, num_shards)
+        if len(names) == 1:
+            return names[0]
+        key = shard_key(doc, shard_by or self.shard_by)
+        return names[zlib.crc32(key.encode("utf-8")) % len(names)]
+
+    def _language_stores(self, language: str) -> List[FAISS]:
+        """Non-empty shards of a language in the served index."""
+        return self._serving.language_stores(language)
+
+    def serving(self) -> ServingIndex:
+        """
+        The served index, after picking up a version published by another process. Queries embed
+        with its embedder and search its stores, so a generation swap in between cannot mix them.
+        """
+        self.refresh()
+        return self._serving
+
+    def _get_store_path(self, name: str) -> Optional[str]:
+        """Get the directory of the loaded vector store version for a language or shard."""
+        store_dir = self._store_dirs.get(name)
+        return os.path.join(self.persist_dir, store_dir) if store_dir else None
+
+    def _load_vector_store(self, store_dir: str, name: str, embedder: Optional[Embeddings] = None):
+        """Load one shard's vector store from a directory under persist_dir, None if that fails."""
+        try:
+            store = FAISS.load_local(
+                os.path.join(self.persist_dir, store_dir),
+                embedder or self.embedder,
+                allow_dangerous_deserialization=True
+            )
+            logger.info(f"Loaded vector store for {name} from {store_dir}")
+            return store
+        except Exception as e:
+            logger.error(f"Error loading vector store for {name}: {e}")
+            return None
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reload the indexes if another process published a newer version.
+
+        Checks the manifest at most every RELOAD_CHECK_INTERVAL seconds unless forced. Only shards
+        whose index changed are loaded, and the new set replaces the old one in a single assignment,
+        so concurrent searches see either the old or the new version, never a mix.
+
+        If a shard of the new version cannot be loaded, the current version keeps being served and
+        the manifest is not marked as seen, so the next call retries. (Before any version was
+        served, the shards that did load are served and the failed ones retried.)
+
+        Returns:
+            True if a new version was loaded
+        """
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < RELOAD_CHECK_INTERVAL:
+            return False
+        if not self._reload_lock.acquire(blocking=force):
+            return False  # another thread is already reloading, keep serving the current version
+        try:
+            self._last_reload_check = now
+            stamp = manifest_stamp(self.persist_dir)
+            if stamp is not None and stamp == self._manifest_stamp:
+                return False
+            manifest = read_manifest(self.persist_dir)
+            store_dirs = manifest.get("stores", {})
+            if manifest["version"] == self.version and store_dirs == self._store_dirs and not self._failed_loads:
+                self._manifest_stamp = stamp
+                return False
+
+            # The layout of existing data wins over the configured shard count and key
+            num_shards = manifest.get("shards", 1) if store_dirs else self.num_shards
+            if num_shards != self.num_shards:
+                logger.warning(f"Index in {self.persist_dir} has {num_shards} shards per language, "
+                               f"using that instead of the configured {self.num_shards}")
+            shard_by = manifest.get("shard_by") if store_dirs else self.shard_by
+            if num_shards > 1 and shard_by != self.shard_by and shard_by != SHARD_BY:
+                logger.warning(f"Index in {self.persist_dir} is sharded by {shard_by or 'an unrecorded key'}, "
+                               f"using that instead of the configured SHARD_BY={SHARD_BY}")
+
+            # Another process swapped in a generation embedded by a different model
+            model_name, embedder = self.model_name, self.embedder
+            backend = manifest.get("backend") or self.backend
+            if manifest.get("model_name") and (manifest["model_name"], backend) != (model_name, self.backend):
+                logger.info(f"Index generation {manifest.get('generation', 0)} uses {manifest['model_name']} ({backend})")
+                model_name = manifest["model_name"]
+                embedder = MultilingualEmbedder(model_name, backend)
+
+            vector_stores = {}
+            failed = set()
+            for lang in LANGUAGES:
+                for name in store_names(lang, num_shards):
+                    store_dir = store_dirs.get(name)
+                    if (store_dir and store_dir == self._store_dirs.get(name) and embedder is self.embedder
+                            and name not in self._failed_loads):
+                        vector_stores[name] = self.vector_stores.get(name)
+                    elif store_dir:
+                        vector_stores[name] = self._load_vector_store(store_dir, name, embedder)
+                        if vector_stores[name] is None:
+                            failed.add(name)
+                    else:
+                        vector_stores[name] = None
+            if failed and self.version >= 0:
+                logger.warning(f"Keeping index version {self.version}: could not load {', '.join(sorted(failed))} "
+                               f"of version {manifest['version']}, retrying on the next refresh")
+                return False
+
+            if embedder is self.embedder:
+                backend = self.backend
+            self._serving = ServingIndex(vector_stores, embedder, model_name, backend, num_shards, shard_by,
+                                         manifest.get("generation", 0))
+            self._failed_loads = failed
+            self._previous = manifest.get("previous")
+            self._store_dirs = dict(store_dirs)
+            self.version = manifest["version"]
+            self._manifest_stamp = None if failed else stamp
+            logger.info(f"Serving index version {self.version}")
+            return True
+        finally:
+            self._reload_lock.release()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold the in-process and cross-process writer locks and start from the latest published version.
+        Yields a copy of the shard name -> store mapping for the write to modify and publish.
+
+        Published stores are never modified: a write replaces a store with a new object (see
+        _clone_store), so searches keep reading their snapshot without taking any lock.
+        """
+        with self._write_lock, writer_lock(self.persist_dir):
+            self.refresh(force=True)
+            # A write must start from the published version, or it would drop the changes it missed
+            if self._failed_loads or self._manifest_stamp != manifest_stamp(self.persist_dir):
+                raise RuntimeError(f"Could not load the latest index version in {self.persist_dir}, not writing")
+            yield dict(self.vector_stores)
+
+    @staticmethod
+    def _clone_store(store: FAISS) -> FAISS:
+        """Copy of a FAISS store that can be written to while searches keep using the original."""
+        return FAISS(
+            embedding_function=store.embedding_function,
+            index=faiss.clone_index(store.index),
+            docstore=InMemoryDocstore(dict(store.docstore._dict)),
+            index_to_docstore_id=dict(store.index_to_docstore_id),
+            normalize_L2=store._normalize_L2,
+            distance_strategy=store.distance_strategy,
+        )
+
+    def _publish(self, vector_stores: Dict, changed: List[str], num_shards: Optional[int] = None,
+                 shard_by: Optional[str] = None) -> None:
+        """
+        Save the changed shards as a new index version and point the manifest at it.
+
+        Must be called inside _writing(). Directories of previous versions are garbage collected
+        once no reader can still be loading them. `num_shards` and `shard_by` change the shard layout
+        (snapshot import).
+        """
+        num_shards = num_shards or self.num_shards
+        shard_by = shard_by or self.shard_by
+        version = self.version + 1
+        store_dirs = dict(self._store_dirs)
+        with time_stage("persist"):
+            for name in changed:
+                store = vector_stores.get(name)
+                if store is None:
+                    store_dirs.pop(name, None)
+                    continue
+                store_dir = versioned_dir_name(name, version)
+                store.save_local(os.path.join(self.persist_dir, store_dir))
+                store_dirs[name] = store_dir
+            manifest = {"version": version, "shards": num_shards, "shard_by": shard_by, "stores": store_dirs,
+                        **self._generation_info(), "previous": self._previous}
+            write_manifest(self.persist_dir, manifest)
+
+        self._serving = self._serving.replace(vector_stores=vector_stores, num_shards=num_shards, shard_by=shard_by)
+        self._store_dirs = store_dirs
+        self.version = version
+        self._manifest_stamp = manifest_stamp(self.persist_dir)
+        logger.info(f"Published index version {version} ({', '.join(changed)})")
+        collect_garbage(self.persist_dir, manifest)
+
+    def _generation_info(self) -> Dict:
+        """Manifest fields identifying the index generation: its number and the model that embedded it."""
+        return {"generation": self.generation, "model_name": self.model_name, "backend": self.backend}
+
+    def publish_generation(self, vector_stores: Dict[str, Optional[FAISS]], embedder: "MultilingualEmbedder",
+                           model_name: str, num_shards: int, shard_by: str = SHARD_BY,
+                           backend: Optional[str] = None) -> None:
+        """
+        Swap in a complete new index generation (see RAG.reembed), keeping the current one for rollback().
+
+        Must be called inside _writing(). `vector_stores` holds every shard of the new layout
+        (`num_shards` per language, routed by `shard_by`). `backend` is the encoder backend of
+        `embedder`, its `backend` attribute (or EMBEDDING_BACKEND) by default.
+        """
+        backend = backend or getattr(embedder, "backend", EMBEDDING_BACKEND)
+        version = self.version + 1
+        previous = {"stores": dict(self._store_dirs), "shards": self.num_shards, "shard_by": self.shard_by,
+                    **self._generation_info()}
+        store_dirs = {}
+        with time_stage("persist"):
+            for name, store in vector_stores.items():
+                if store is None:
+                    continue
+                store_dirs[name] = versioned_dir_name(name, version)
+                store.save_local(os.path.join(self.persist_dir, store_dirs[name]))
+            generation = self.generation + 1
+            manifest = {"version": version, "shards": num_shards, "shard_by": shard_by, "stores": store_dirs,
+                        "generation": generation, "model_name": model_name, "backend": backend,
+                        "previous": previous}
+            write_manifest(self.persist_dir, manifest)
+
+        self._serving = ServingIndex(dict(vector_stores), embedder, model_name, backend, num_shards, shard_by,
+                                     generation)
+        self._store_dirs = store_dirs
+        self._previous = previous
+        self.version = version
+        self._manifest_stamp = manifest_stamp(self.persist_dir)
+        logger.info(f"Published index generation {generation} ({model_name}) as version {version}")
+        collect_garbage(self.persist_dir, manifest)
+
+    def rollback(self) -> Dict:
+        """
+        Serve the previous index generation again. The generation rolled back from becomes the
+        previous one, so rolling back twice returns to it. Chunks ingested after the swap are
+        only in the newer generation and have to be re-ingested.
+
+        Returns:
+            Generation info of the generation now served
+
+        Raises:
+            ValueError: if there is no previous generation
+        """
+        with self._writing():
+            previous = self._previous
+            if not previous:
+                raise ValueError("No previous index generation to roll back to")
+            current = {"stores": dict(self._store_dirs), "shards": self.num_shards, "shard_by": self.shard_by,
+                       **self._generation_info()}
+            manifest = {"version": self.version + 1, **previous, "previous": current}
+            write_manifest(self.persist_dir, manifest)
+            self.refresh(force=True)
+            logger.warning(f"Rolled back to index generation {self.generation} ({self.model_name})")
+            return self._generation_info()
+
+    def add_documents(self, chunked_docs: Dict[str, List[Dict]], replace: bool = False):
         """
         Embeds documents for each language and stores embeddings in FAISS index.
+
+        With `replace`, vectors already indexed for the same doc_ids are removed in the same
+        update, so re-ingesting a document never shows it twice or not at all.
         """
+        prepared: Dict[str, Tuple[List[str], List[Dict]]] = {}
+        ingested_at = time.time()
         for lang in LANGUAGES:
             # Extract text for the current language
             texts = [doc["text"] for doc in chunked_docs.get(lang, [])]
@@ -85,45 +470,204 @@ class FaissEmbeddingStore:
                 logger.warning(f" No text to embed for {lang}")
                 continue
             
-            logger.info(f"Generating embeddings for {lang}...")
-            
-            lang_docs = []
+            metadatas = []
 
-            # Store Document of each chunk in the FAISS index
+            # Store metadata of each chunk alongside its vector in the FAISS index
             for i, doc in enumerate(chunked_docs.get(lang, [])):
-                logger.info(f"Chunk ID: {doc['chunk_id']}, Doc ID: {doc['doc_id']}, Text: {doc['text'][:50]}...")
-                metadata = {
+                log_event("chunk_indexed", language=lang, chunk_id=doc["chunk_id"], doc_id=doc["doc_id"],
+                          chars=len(doc["text"]))
+                metadatas.append({
                     "chunk_id": doc["chunk_id"],
                     "doc_id": doc["doc_id"],
                     "chunk_idx": doc["chunk_idx"],
-                    "parallel_id": doc.get("parallel_id", None)
-                }
-                lang_docs.append(
-                    Document(
-                        page_content=doc["text"],
-                        metadata=metadata
-                    )
-                )
-            
-            if not lang_docs:
-                logger.warning(f" No documents to add for {lang}.")
-                continue
+                    "parallel_id": doc.get("parallel_id", None),
+                    "collection": doc.get("collection"),
+                    "ingested_at": ingested_at,
+                })
+            prepared[lang] = (texts, metadatas)
 
-            if self.vector_stores[lang] is None:
-                # Create new FAISS index
-                self.vector_stores[lang] = FAISS.from_documents(
-                    documents=lang_docs,
-                    embedding=self.embedder,
-                )
+        if not prepared:
+            return
+
+        # Embedding happens outside the writer lock, only the index update and publish are serialized
+        serving = self.serving()
+        embedded = self._embed_chunks(prepared, serving)
+        with self._writing() as vector_stores:
+            current = self._serving
+            if not current.same_layout(serving):
+                # A generation swap or shard layout change (in this or another process) happened
+                # while embedding: those vectors belong to the old model and layout
+                logger.warning(f"Index generation or shard layout changed while embedding, embedding again "
+                               f"with {current.model_name} for {current.num_shards} shards")
+                embedded = self._embed_chunks(prepared, current)
+            removed = []
+            if replace:
+                doc_ids = {metadata["doc_id"] for _, metadatas in embedded.values() for metadata in metadatas}
+                removed = self._remove_documents(vector_stores, doc_ids)
+            private = set(removed)  # removal already made private copies of these
+            changed = list(removed)
+            for shard, (text_embeddings, metadatas) in embedded.items():
+                # An empty shard takes the chunks directly, otherwise they are appended to its delta
+                if vector_stores.get(shard) is None and vector_stores.get(delta_name(shard)) is None:
+                    name = shard
+                else:
+                    name = delta_name(shard)
+                with time_stage("index_write", items=len(text_embeddings)):
+                    if vector_stores.get(name) is None:
+                        # Create new FAISS index
+                        vector_stores[name] = FAISS.from_embeddings(
+                            text_embeddings=text_embeddings,
+                            embedding=current.embedder,
+                            metadatas=metadatas,
+                        )
+                    else:
+                        # Add to a copy of the delta, published below with one swap
+                        if name not in private:
+                            vector_stores[name] = self._clone_store(vector_stores[name])
+                        vector_stores[name].add_embeddings(text_embeddings, metadatas=metadatas)
+                    private.add(name)
+                    changed.append(name)
+                    delta = vector_stores.get(delta_name(shard))
+                    if delta is not None and delta.index.ntotal >= DELTA_MAX_VECTORS:
+                        self._merge_delta(vector_stores, shard, private)
+                        changed.extend([shard, delta_name(shard)])
+            self._publish(vector_stores, list(dict.fromkeys(changed)))
+        logger.info(f"Updated and saved vector stores for {', '.join(embedded)}")
+
+    def _merge_delta(self, vector_stores: Dict[str, Optional[FAISS]], shard: str, private: Set[str]) -> None:
+        """
+        Move a shard's delta into (a copy of) the shard. Must be called inside _writing().
+        `private` names the stores this write already copied, which are modified in place.
+        """
+        delta = vector_stores[delta_name(shard)]
+        with time_stage("index_merge", items=delta.index.ntotal):
+            base = vector_stores.get(shard)
+            if base is None:
+                vector_stores[shard] = delta
             else:
-                # Add to existing index
-                self.vector_stores[lang].add_documents(lang_docs)
-            
-            store_path = self._get_store_path(lang)
-            self.vector_stores[lang].save_local(store_path)
-            logger.info(f"Updated and saved vector store for {lang}")
+                if shard not in private:
+                    base = self._clone_store(base)
+                # Keep the docstore ids, so the chunks keep their identity across the merge
+                ids = [delta.index_to_docstore_id[position] for position in range(delta.index.ntotal)]
+                documents = [delta.docstore._dict[docstore_id] for docstore_id in ids]
+                vectors = delta.index.reconstruct_n(0, delta.index.ntotal)
+                base.add_embeddings(zip((doc.page_content for doc in documents), vectors),
+                                    metadatas=[doc.metadata for doc in documents], ids=ids)
+                vector_stores[shard] = base
+            vector_stores[delta_name(shard)] = None
+        private.add(shard)
+        logger.info(f"Merged {delta.index.ntotal} delta vectors into {shard}")
+
+    def _embed_chunks(self, prepared: Dict[str, Tuple[List[str], List[Dict]]],
+                      serving: ServingIndex) -> Dict[str, Tuple[List[Tuple[str, np.ndarray]], List[Dict]]]:
+        """
+        Embed prepared (texts, metadatas) per language with the embedder of `serving`, grouped by
+        the shard of its layout each chunk is written to.
+        """
+        embedded = {}
+        for lang, (texts, metadatas) in prepared.items():
+            logger.info(f"Generating embeddings for {lang}...")
+            with time_stage("embed", model=serving.model_name, items=len(texts)):
+                vectors = serving.embedder.embed_documents(texts)
+
+            # Group by shard, so each write only rebuilds the shards it touches
+            for text, vector, metadata in zip(texts, vectors, metadatas):
+                shard = embedded.setdefault(self._shard_for(lang, metadata, serving.num_shards, serving.shard_by),
+                                            ([], []))
+                shard[0].append((text, vector))
+                shard[1].append(metadata)
+        return embedded
+
+    def export_snapshot(self, path: str) -> Dict:
+        """
+        Write a portable, checksummed snapshot of all languages (see RAG.snapshot).
+
+        Args:
+            path: Snapshot directory, or a file name ending in .tar for a single archive
+
+        Returns:
+            The snapshot manifest
+        """
+        from RAG import snapshot  # pyarrow is only needed for snapshots
+
+        self.refresh(force=True)
+        serving, version = self._serving, self.version
+        vector_stores, num_shards = serving.vector_stores, serving.num_shards
+        archive = path.endswith(".tar")
+        os.makedirs(self.persist_dir, exist_ok=True)
+        directory = tempfile.mkdtemp(prefix="snapshot-", dir=self.persist_dir) if archive else path
+        try:
+            dims = {store.index.d for store in vector_stores.values() if store is not None}
+            manifest = snapshot.new_manifest(serving.model_name, dims.pop() if dims else None, num_shards, version,
+                                             serving.shard_by)
+            with time_stage("snapshot_export"):
+                for name, store in vector_stores.items():
+                    if store is not None:
+                        manifest["stores"][name] = snapshot.write_store(store, os.path.join(directory, name))
+                snapshot.write_manifest(directory, manifest)
+                if archive:
+                    snapshot.pack(directory, path)
+        finally:
+            if archive:
+                shutil.rmtree(directory, ignore_errors=True)
+        logger.info(f"Exported index version {version} to {path}")
+        return manifest
 
-    def search(self, query: str, language: str, k: int = 5) -> List[Document]:
+    def import_snapshot(self, path: str, verify: bool = True) -> Dict:
+        """
+        Replace all indexes with the contents of a snapshot and publish them as a new version.
+
+        The snapshot is loaded before the writer lock is taken, so searches and other processes
+        keep using the current version until the single swap at the end.
+
+        Args:
+            path: Snapshot directory or .tar archive written by export_snapshot
+            verify: Check the sha256 of every file before loading
+
+        Returns:
+            The snapshot manifest
+        """
+        from RAG import snapshot  # pyarrow is only needed for snapshots
+
+        archive = os.path.isfile(path)
+        os.makedirs(self.persist_dir, exist_ok=True)
+        directory = tempfile.mkdtemp(prefix="snapshot-", dir=self.persist_dir) if archive else path
+        try:
+            if archive:
+                snapshot.unpack(path, directory)
+            manifest = snapshot.read_manifest(directory, verify=verify)
+            if manifest["model_name"] != self.model_name:
+                raise snapshot.SnapshotError(
+                    f"Snapshot vectors are from {manifest['model_name']}, this store embeds with {self.model_name}"
+                )
+            expected = {name for lang in LANGUAGES for name in store_names(lang, manifest["shards"])}
+            unknown = set(manifest["stores"]) - expected
+            if unknown:
+                raise snapshot.SnapshotError(f"Unexpected stores in snapshot: {', '.join(sorted(unknown))}")
+
+            with time_stage("snapshot_import"):
+                loaded = {
+                    name: snapshot.read_store(os.path.join(directory, name), self.embedder, entry["rows"])
+                    for name, entry in manifest["stores"].items()
+                }
+        finally:
+            if archive:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        with self._writing() as vector_stores:
+            names = set(vector_stores) | set(loaded)
+            self._publish({name: loaded.get(name) for name in names}, sorted(names), manifest["shards"],
+                          manifest.get("shard_by"))
+        logger.info(f"Imported snapshot of index version {manifest['index_version']} from {path}")
+        return manifest
+
+    def index_sizes(self) -> Dict[str, int]:
+        """Number of vectors in each language's index, summed over its shards."""
+        self.refresh()
+        return {lang: sum(store.index.ntotal for store in self._language_stores(lang)) for lang in LANGUAGES}
+
+    def search(self, query: str, language: str, k: int = 5,
+               search_filter: Optional[SearchFilter] = None) -> List[Document]:
         """
         Search for relevant documents in the specified language.
         
@@ -131,55 +675,157 @@ class FaissEmbeddingStore:
             query: The search query
             language: The language to search in
             k: Number of results to return
+            search_filter: Only return chunks matching this filter
             
         Returns:
             List of relevant Document objects
         """
-        if language not in self.vector_stores or self.vector_stores[language] is None:
+        serving = self.serving()
+        embedding = serving.embedder.embed_query(query)
+        return [doc for doc, _ in self.search_by_vector(embedding, language, k=k, search_filter=search_filter,
+                                                        serving=serving)]
+
+    def search_by_vector(self, embedding: np.ndarray, language: str, k: int = 5,
+                         score_threshold: Optional[float] = None, fetch_k: int = 20,
+                         search_filter: Optional[SearchFilter] = None,
+                         serving: Optional[ServingIndex] = None) -> List[Tuple[Document, float]]:
+        """
+        Search with an already computed query embedding and return scores.
+
+        Shards are searched in parallel on a thread pool and their results merged by distance.
+        A filter is turned into an allow-list of vector ids and applied inside the index scan,
+        so k results come back whenever at least k chunks match.
+
+        Args:
+            embedding: Query embedding from embedder.embed_query
+            language: The language to search in
+            k: Number of results to return
+            score_threshold: Drop results with an L2 distance above this value
+            fetch_k: Number of candidates fetched before metadata filtering
+            search_filter: Only return chunks matching this filter (doc ids, collections, ingestion dates)
+            serving: Served index the embedding was computed for (see serving()), the current one if None
+
+        Returns:
+            List of (Document, L2 distance) tuples, closest first
+        """
+        stores = (serving or self.serving()).language_stores(language)
+        if not stores:
             raise ValueError(f"No vector store available for {language}")
-        
-        return self.vector_stores[language].similarity_search(query, k=k)
+
+        kwargs = {}
+        if score_threshold is not None:
+            kwargs["score_threshold"] = score_threshold
+
+        def search_shard(store: FAISS) -> List[Tuple[Document, float]]:
+            if search_filter is not None and not search_filter.is_empty:
+                return filtered_search(store, embedding, k, search_filter, score_threshold)
+            return store.similarity_search_with_score_by_vector(embedding, k=k, fetch_k=fetch_k, **kwargs)
+
+        if len(stores) == 1:
+            return search_shard(stores[0])
+        results = list(_search_pool.map(search_shard, stores))
+        return heapq.nsmallest(k, (hit for shard_hits in results for hit in shard_hits), key=lambda hit: hit[1])
+
+    def search_by_vectors(self, embeddings: np.ndarray, language: str, k: int = 5,
+                          score_threshold: Optional[float] = None,
+                          serving: Optional[ServingIndex] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Search several query embeddings at once, with one multi-query FAISS search per shard.
+
+        Args:
+            embeddings: Matrix of query embeddings, one row per query
+            language: The language to search in
+            k: Number of results to return per query
+            score_threshold: Drop results with an L2 distance above this value
+            serving: Served index the embeddings were computed for (see serving()), the current one if None
+
+        Returns:
+            For each query, a list of (Document, L2 distance) tuples, closest first
+        """
+        stores = (serving or self.serving()).language_stores(language)
+        if not stores:
+            raise ValueError(f"No vector store available for {language}")
+        queries = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+
+        def search_shard(store: FAISS) -> List[List[Tuple[Document, float]]]:
+            distances, positions = store.index.search(queries, min(k, store.index.ntotal))
+            hits = []
+            for row_distances, row_positions in zip(distances, positions):
+                row = []
+                for position, distance in zip(row_positions, row_distances):
+                    if position < 0 or (score_threshold is not None and distance > score_threshold):
+                        continue
+                    docstore_id = store.index_to_docstore_id[int(position)]
+                    row.append((store.docstore._dict[docstore_id], float(distance)))
+                hits.append(row)
+            return hits
+
+        if len(stores) == 1:
+            return search_shard(stores[0])
+        per_shard = list(_search_pool.map(search_shard, stores))
+        return [
+            heapq.nsmallest(k, (hit for shard_hits in query_hits for hit in shard_hits), key=lambda hit: hit[1])
+            for query_hits in zip(*per_shard)
+        ]
     
     
-    def delete_document_by_id(self, doc_id_file: str):
+    def _remove_documents(self, vector_stores: Dict[str, Optional[FAISS]], doc_ids: Set[str]) -> List[str]:
         """
-        Delete all vectors associated with the given doc_id from each language's FAISS store.
+        Remove the vectors of `doc_ids` from copies of the stores in `vector_stores`.
+
+        Returns:
+            Names of the stores that changed
         """
-        doc_id = f"doc_{doc_id_file}"  # Ensure doc_id is formatted correctly
-        deleted_any = False
+        changed = []
         for lang in LANGUAGES:
-            store = self.vector_stores.get(lang)
-            if store is None:
-                logger.warning(f"No vector store found for language: {lang}")
-                continue
+            # With doc_id sharding only one shard can hold a document; by collection, or with a
+            # layout whose key was not recorded, any shard can
+            if self.shard_by == "doc_id":
+                shards = {self._shard_for(lang, {"doc_id": doc_id}) for doc_id in doc_ids}
+                names = [name for shard in sorted(shards) for name in (shard, delta_name(shard))]
+            else:
+                names = store_names(lang, self.num_shards)
+            for name in names:
+                store = vector_stores.get(name)
+                if store is None:
+                    continue
 
-            # Fetch all existing documents
-            existing_docs = store.docstore._dict.values()
-            remaining_docs = [doc for doc in existing_docs if doc.metadata.get("doc_id") != doc_id]
+                ids = [store_id for store_id, doc in store.docstore._dict.items() if doc.metadata.get("doc_id") in doc_ids]
+                if not ids:
+                    continue
 
-            if len(remaining_docs) == len(existing_docs):
-                logger.info(f"No documents found for deletion with doc_id: {doc_id} in {lang}")
-                continue
-            
-            non_empty_docs = [doc for doc in remaining_docs if doc.page_content.strip()]
-            if not non_empty_docs:
-                deleted_any = True
-                logger.warning(f"All remaining docs for {lang} are empty. Skipping FAISS index rebuild.")
-                self.vector_stores[lang] = None
-                if os.path.exists(self._get_store_path(lang)):
-                    shutil.rmtree(self._get_store_path(lang))
-                continue
-            logger.info(f"Rebuilding FAISS index for {lang} without doc_id: {doc_id}")
+                logger.info(f"Removing {len(ids)} vectors of {', '.join(sorted(doc_ids))} from {name}")
+                changed.append(name)
+                if len(ids) == store.index.ntotal:
+                    vector_stores[name] = None
+                    continue
+                # Removing from a copy avoids re-embedding the rest of the shard
+                store = self._clone_store(store)
+                store.delete(ids)
+                vector_stores[name] = store
+        return changed
 
-            if len(remaining_docs) < len(existing_docs):
-                deleted_any = True
-                new_index = FAISS.from_documents(
-                    documents=remaining_docs,
-                    embedding=self.embedder
-                )
-                self.vector_stores[lang] = new_index
-                new_index.save_local(self._get_store_path(lang))
-            logger.info(f"Updated vector store saved after deletion for {lang}")
+    def document_chunk_counts(self, doc_id_file: str) -> Dict[str, int]:
+        """Number of indexed chunks of a document, per language."""
+        self.refresh()
+        doc_id = f"doc_{doc_id_file}"
+        return {
+            lang: sum(len(metadata_index(store).by_doc.get(doc_id, ())) for store in self._language_stores(lang))
+            for lang in LANGUAGES
+        }
+
+    def delete_document_by_id(self, doc_id_file: str):
+        """
+        Delete all vectors associated with the given doc_id from each language's FAISS store.
+        """
+        doc_id = f"doc_{doc_id_file}"  # Ensure doc_id is formatted correctly
+        with self._writing() as vector_stores:
+            changed = self._remove_documents(vector_stores, {doc_id})
+            deleted_any = bool(changed)
+            if changed:
+                self._publish(vector_stores, changed)
+            else:
+                logger.info(f"No documents found for deletion with doc_id: {doc_id}")
 
         for ext in ["jpg", "jpeg", "png"]:
             file_path = os.path.join(DATA_DIR, f"{doc_id_file}.{ext}")
@@ -196,16 +842,15 @@ class FaissEmbeddingStore:
         """
         Deletes all documents and clears all FAISS indexes for all languages.
         """
-        deleted = False
-        for lang in LANGUAGES:
-            if self.vector_stores[lang] is not None:
-                self.vector_stores[lang] = None  # Clear from memory
-                index_path = self._get_store_path(lang)
-                if os.path.exists(index_path):
-                    shutil.rmtree(index_path)  # Delete the directory with index.faiss and index.pkl
-                    logger.info(f"Deleted FAISS index directory for {lang}")
-                    deleted = True
+        with self._writing() as vector_stores:
+            cleared = [name for name, store in vector_stores.items() if store is not None]
+            if cleared:
+                for name in cleared:
+                    vector_stores[name] = None  # Clear from memory
+                # The index directories are removed by garbage collection once no reader can be loading them
+                self._publish(vector_stores, cleared)
+                logger.info(f"Cleared FAISS indexes for {', '.join(cleared)}")
                 if os.path.exists(DATA_DIR):
                     shutil.rmtree(DATA_DIR)
                     os.makedirs(DATA_DIR, exist_ok=True)
-        return deleted
\ No newline at end of file
+        return bool(cleared)
@@ -0,0 +1,168 @@
+import threading
+import weakref
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Union
+
+import faiss
+import numpy as np
+
+# === Metadata filters applied inside the FAISS scan ===
+
+# Allow-lists up to this size are searched by computing their distances directly,
+# larger ones by a full index scan that skips vectors outside the list
+DIRECT_SEARCH_MAX_IDS = 20_000
+
+
+def _timestamp(value: Union[None, float, datetime]) -> Optional[float]:
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.tzinfo is None:
+        # Times without an offset are UTC, not the server's local time
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def normalize_doc_id(doc_id: str) -> str:
+    """Chunk metadata stores "doc_<uuid>", the API uses the bare uuid; accept both."""
+    return doc_id if doc_id.startswith("doc_") else f"doc_{doc_id}"
+
+
+class SearchFilter:
+    """
+    Restricts a search to some documents: any of `doc_ids`, any of `collections`, and an
+    ingestion time range (chunks ingested before timestamps were recorded never match a range).
+    Conditions of different kinds must all hold.
+    """
+
+    def __init__(self, doc_ids: Optional[Iterable[str]] = None, collections: Optional[Iterable[str]] = None,
+                 ingested_after: Union[None, float, datetime] = None,
+                 ingested_before: Union[None, float, datetime] = None):
+        self.doc_ids = {normalize_doc_id(doc_id) for doc_id in doc_ids} if doc_ids else None
+        self.collections = set(collections) if collections else None
+        self.ingested_after = _timestamp(ingested_after)
+        self.ingested_before = _timestamp(ingested_before)
+
+    @property
+    def is_empty(self) -> bool:
+        return (self.doc_ids is None and self.collections is None
+                and self.ingested_after is None and self.ingested_before is None)
+
+    def matches(self, metadata: Dict) -> bool:
+        if self.doc_ids is not None and metadata.get("doc_id") not in self.doc_ids:
+            return False
+        if self.collections is not None and metadata.get("collection") not in self.collections:
+            return False
+        if self.ingested_after is not None or self.ingested_before is not None:
+            ingested_at = metadata.get("ingested_at")
+            if ingested_at is None:
+                return False
+            if self.ingested_after is not None and ingested_at < self.ingested_after:
+                return False
+            if self.ingested_before is not None and ingested_at > self.ingested_before:
+                return False
+        return True
+
+    def to_dict(self) -> Dict:
+        return {
+            "doc_ids": sorted(self.doc_ids) if self.doc_ids is not None else None,
+            "collections": sorted(self.collections) if self.collections is not None else None,
+            "ingested_after": self.ingested_after,
+            "ingested_before": self.ingested_before,
+        }
+
+
+class MetadataIndex:
+    """
+    Positions of a FAISS store's vectors by doc_id and collection, and their ingestion times,
+    so a filter turns into a vector-id allow-list without looking at every chunk.
+    """
+
+    def __init__(self, store):
+        by_doc: Dict[str, List[int]] = {}
+        by_collection: Dict[str, List[int]] = {}
+        ingested_at = np.full(store.index.ntotal, np.nan)
+        for position, docstore_id in store.index_to_docstore_id.items():
+            metadata = store.docstore._dict[docstore_id].metadata
+            by_doc.setdefault(metadata.get("doc_id"), []).append(position)
+            if metadata.get("collection") is not None:
+                by_collection.setdefault(metadata["collection"], []).append(position)
+            if metadata.get("ingested_at") is not None:
+                ingested_at[position] = metadata["ingested_at"]
+        self.by_doc = {key: np.array(value, dtype=np.int64) for key, value in by_doc.items()}
+        self.by_collection = {key: np.array(value, dtype=np.int64) for key, value in by_collection.items()}
+        self.ingested_at = ingested_at
+
+    @staticmethod
+    def _union(groups: Dict[str, np.ndarray], keys: Iterable[str]) -> np.ndarray:
+        parts = [groups[key] for key in keys if key in groups]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def allowed_ids(self, search_filter: SearchFilter) -> np.ndarray:
+        """Sorted positions of the vectors matching the filter."""
+        allowed: Optional[np.ndarray] = None
+        if search_filter.doc_ids is not None:
+            allowed = self._union(self.by_doc, search_filter.doc_ids)
+        if search_filter.collections is not None:
+            ids = self._union(self.by_collection, search_filter.collections)
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+        if search_filter.ingested_after is not None or search_filter.ingested_before is not None:
+            in_range = ~np.isnan(self.ingested_at)
+            if search_filter.ingested_after is not None:
+                in_range &= self.ingested_at >= search_filter.ingested_after
+            if search_filter.ingested_before is not None:
+                in_range &= self.ingested_at <= search_filter.ingested_before
+            ids = np.flatnonzero(in_range).astype(np.int64)
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+        return allowed if allowed is not None else np.arange(self.ingested_at.shape[0], dtype=np.int64)
+
+
+# Published stores are never modified, so an index built for one stays valid for its lifetime
+_metadata_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_metadata_lock = threading.Lock()
+
+
+def metadata_index(store) -> MetadataIndex:
+    with _metadata_lock:
+        index = _metadata_indexes.get(store)
+    if index is None:
+        index = MetadataIndex(store)
+        with _metadata_lock:
+            _metadata_indexes[store] = index
+    return index
+
+
+def filtered_search(store, embedding: np.ndarray, k: int, search_filter: SearchFilter,
+                    score_threshold: Optional[float] = None) -> List[tuple]:
+    """
+    k nearest neighbours among the vectors matching the filter, as (Document, L2 distance) pairs.
+
+    Small allow-lists are scored directly from their reconstructed vectors; larger ones use a
+    FAISS IDSelector, so the index scan itself skips everything outside the list. Either way
+    exactly min(k, matches) results come back, no over-fetching.
+    """
+    allowed = metadata_index(store).allowed_ids(search_filter)
+    if allowed.size == 0:
+        return []
+    query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+    k = min(k, allowed.size)
+
+    if allowed.size <= DIRECT_SEARCH_MAX_IDS:
+        vectors = store.index.reconstruct_batch(allowed)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        top = np.argpartition(distances, k - 1)[:k] if k < allowed.size else np.arange(allowed.size)
+        top = top[np.argsort(distances[top])]
+        positions, scores = allowed[top], distances[top]
+    else:
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(allowed))
+        scores, positions = store.index.search(query, k, params=params)
+        scores, positions = scores[0], positions[0]
+
+    results = []
+    for position, score in zip(positions, scores):
+        if position < 0:
+            continue
+        if score_threshold is not None and score > score_threshold:
+            continue
+        docstore_id = store.index_to_docstore_id[int(position)]
+        results.append((store.docstore._dict[docstore_id], float(score)))
+    return results
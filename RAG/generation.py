@@ -1,27 +1,35 @@
 import os
 import json
 import requests
-from typing import List, AsyncGenerator
+from typing import Dict, List, AsyncGenerator, Optional, Tuple
 from langchain.schema import Document
 from langchain.prompts import PromptTemplate
 from langchain_ollama import OllamaLLM as Ollama
 from langchain.chains import LLMChain
 from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from RAG.context import ContextBuilder, MAX_CONTEXT_TOKENS
+from utils import logger
+from tracing import span
 
 class OllamaAnswerGenerator:
     """
     Class to generate answers from retrieved documents using locally hosted Ollama LLM.
     """
     
-    def __init__(self, model_name: str = "gemma3", ollama_base_url: str = "http://localhost:11434"):
+    def __init__(self, model_name: str = "gemma3", ollama_base_url: str = "http://localhost:11434",
+                 max_context_tokens: int = MAX_CONTEXT_TOKENS, num_thread: Optional[int] = None):
         """
         Initialize the answer generator with an Ollama model.
         
         Args:
             model_name: Name of the Ollama model to use
             ollama_base_url: Base URL for Ollama API
+            max_context_tokens: Token budget for the retrieved documents in the prompt
+            num_thread: CPU threads Ollama uses for a generation, its own default (all cores) if None
         """
+        self.context_builder = ContextBuilder(max_tokens=max_context_tokens)
+
         # Configure streaming callbacks for real-time output
         callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
         
@@ -31,6 +39,7 @@ class OllamaAnswerGenerator:
             base_url=ollama_base_url,
             callback_manager=callback_manager,
             temperature=0.1,  # Lower temperature for more deterministic answers
+            num_thread=num_thread,
             verbose=True,
             streaming=True  # Enable streaming for real-time output
         )
@@ -107,6 +116,9 @@ class OllamaAnswerGenerator:
     def format_documents_for_context(self, documents: List[Document]) -> str:
         """
         Format retrieved documents into a string context for the LLM prompt.
+
+        Neighbouring chunks of the same document are merged without their overlap and the
+        result is packed to the configured token budget.
         
         Args:
             documents: List of Document objects retrieved from vector store
@@ -114,14 +126,30 @@ class OllamaAnswerGenerator:
         Returns:
             Formatted context string
         """
-        context_str = ""
-        
-        for i, doc in enumerate(documents):
-            context_str += f"Document {i+1}:\n{doc.page_content}\n\n"
-        
+        context_str, _ = self.build_context(documents)
         return context_str
+
+    def build_context(self, documents: List[Document]) -> Tuple[str, Dict[str, int]]:
+        """
+        Same as format_documents_for_context, but also returns the packing stats.
+
+        Args:
+            documents: List of Document objects retrieved from vector store
+
+        Returns:
+            Tuple of the context string and the ContextBuilder stats
+        """
+        with span("context_build"):
+            context_str, stats = self.context_builder.build(documents)
+        logger.info(
+            f"Context: {stats['chunks']} chunks -> {stats['passages']} passages "
+            f"({stats['passages_dropped']} dropped), {stats['context_tokens']} tokens, "
+            f"saved {stats['tokens_saved']} of {stats['naive_tokens']} prompt tokens"
+        )
+        return context_str, stats
     
-    async def generate_answer(self, query: str, documents: List[Document], language: str) -> AsyncGenerator[str, None]:
+    async def generate_answer(self, query: str, documents: List[Document], language: str,
+                              context: Optional[str] = None) -> AsyncGenerator[str, None]:
         """
         Generate an answer for the given query based on retrieved documents.
         
@@ -129,6 +157,7 @@ class OllamaAnswerGenerator:
             query: User query
             documents: Retrieved documents
             language: Language of the query and documents
+            context: Context string already built with build_context, built from documents if not given
             
         Returns:
             Generated answer
@@ -146,7 +175,8 @@ class OllamaAnswerGenerator:
             return
         
         # Format documents into context string
-        context = self.format_documents_for_context(documents)
+        if context is None:
+            context = self.format_documents_for_context(documents)
         
         # Generate answer using the appropriate chain
         try:
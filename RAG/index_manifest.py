@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+from filelock import FileLock
+
+from utils import logger
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".write.lock"
+LOCK_TIMEOUT = 300  # seconds a writer waits for another process to finish its write
+GC_GRACE_SECONDS = 120  # unreferenced index directories are kept this long for readers still loading them
+
+VERSIONED_DIR = re.compile(r"^(?P<name>.+_index)\.v(?P<version>\d+)$")
+
+
+def manifest_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, MANIFEST_FILE)
+
+
+def empty_manifest() -> Dict:
+    return {"version": 0, "stores": {}}
+
+
+def read_manifest(persist_dir: str) -> Dict:
+    """
+    Read the current manifest: {"version": N, "stores": {name: directory relative to persist_dir}},
+    plus the shard layout (count and key), the index generation and its model, the previous generation kept for rollback,
+    and when each directory that is no longer referenced was superseded.
+
+    Indexes written before manifests existed (`{language}_index` directories) are picked up as version 0.
+    """
+    path = manifest_path(persist_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    manifest = empty_manifest()
+    if os.path.isdir(persist_dir):
+        for name in os.listdir(persist_dir):
+            if name.endswith("_index") and os.path.isdir(os.path.join(persist_dir, name)):
+                manifest["stores"][name[:-len("_index")]] = name
+    return manifest
+
+
+def manifest_stamp(persist_dir: str) -> Optional[tuple]:
+    """Cheap change detector for the manifest (one stat call), None if there is no manifest yet."""
+    try:
+        stat = os.stat(manifest_path(persist_dir))
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def referenced_dirs(manifest: Dict) -> Set[str]:
+    """Store directories a manifest references, including the previous generation kept for rollback."""
+    referenced = set(manifest.get("stores", {}).values())
+    referenced.update((manifest.get("previous") or {}).get("stores", {}).values())
+    return referenced
+
+
+def write_manifest(persist_dir: str, manifest: Dict) -> None:
+    """
+    Atomically replace the manifest, so readers see either the old or the new version.
+
+    Directories the old manifest referenced and the new one does not are recorded in the new
+    manifest's "superseded" map with the current time, which starts their garbage collection
+    grace period. Must be called under writer_lock.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    old = read_manifest(persist_dir)
+    referenced = referenced_dirs(manifest)
+    now = time.time()
+    superseded = {name: at for name, at in old.get("superseded", {}).items()
+                  if name not in referenced and os.path.isdir(os.path.join(persist_dir, name))}
+    for name in referenced_dirs(old) - referenced:
+        superseded.setdefault(name, now)
+    manifest["superseded"] = superseded
+
+    fd, tmp_path = tempfile.mkstemp(dir=persist_dir, prefix=".manifest-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path(persist_dir))
+
+
+def versioned_dir_name(name: str, version: int) -> str:
+    return f"{name}_index.v{version}"
+
+
+@contextmanager
+def writer_lock(persist_dir: str, timeout: float = LOCK_TIMEOUT):
+    """Exclusive cross-process lock held while an index write is prepared and published."""
+    os.makedirs(persist_dir, exist_ok=True)
+    with FileLock(os.path.join(persist_dir, LOCK_FILE), timeout=timeout):
+        yield
+
+
+def collect_garbage(persist_dir: str, manifest: Dict, grace_seconds: float = GC_GRACE_SECONDS) -> None:
+    """
+    Remove index directories the manifest no longer references.
+
+    Only runs under the writer lock. A directory is kept for the grace period after the manifest
+    stopped referencing it (its "superseded" time), because reader processes may still be
+    loading the version it belongs to. Directories no manifest recorded, e.g. left by a crashed
+    write, are measured from their modification time instead.
+    """
+    referenced = referenced_dirs(manifest)
+    superseded = manifest.get("superseded", {})
+    now = time.time()
+    for name in os.listdir(persist_dir):
+        path = os.path.join(persist_dir, name)
+        if name in referenced or not os.path.isdir(path):
+            continue
+        if not (VERSIONED_DIR.match(name) or name.endswith("_index")):
+            continue
+        unreferenced_since = superseded.get(name, os.path.getmtime(path))
+        if now - unreferenced_since < grace_seconds:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Removed unreferenced index directory {name}")
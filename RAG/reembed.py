@@ -0,0 +1,290 @@
+"""
+Background rebuild of the FAISS indexes with another embedding model or shard layout.
+
+The job re-embeds the chunk text already stored in the live indexes into a new index generation,
+in batches and optionally rate limited, while queries keep using the live generation. Chunks
+added or deleted in the meantime are caught up under the writer lock. The new generation is then
+verified (chunk counts, and self-retrieval recall against the live generation) and swapped in with
+one manifest update. The new generation is sharded by the configured SHARD_BY, so a re-embed is
+also how an index moves to another shard key. The generation it replaces is kept, FaissEmbeddingStore.rollback() serves it again.
+
+Usage:
+    python -m RAG.reembed --model intfloat/multilingual-e5-base [--backend int8] [--shards 4] [--max-rate 200]
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from metrics import time_stage
+from RAG.embeddings import EMBEDDING_BACKEND, LANGUAGES, SHARD_BY, FaissEmbeddingStore, MultilingualEmbedder
+from resources import governor
+from utils import logger
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "256"))  # chunks encoded per step
+REEMBED_MAX_RATE = float(os.getenv("REEMBED_MAX_RATE", "0"))  # chunks per second, 0 for no limit
+VERIFY_SAMPLE = 200  # chunks whose own text is searched in both generations
+VERIFY_K = 10
+VERIFY_TOLERANCE = 0.05  # self-retrieval recall the new generation may lose against the live one
+
+# (docstore id, chunk) of one language
+Chunks = List[Tuple[str, Document]]
+
+
+class ReembedCancelled(Exception):
+    pass
+
+
+class ReembedJob:
+    """
+    One rebuild of all language indexes. Call run() (blocking) or start() (background thread);
+    status() reports the progress at any time.
+    """
+
+    def __init__(self, store: FaissEmbeddingStore, model_name: str, backend: str = EMBEDDING_BACKEND,
+                 num_shards: Optional[int] = None, batch_size: int = REEMBED_BATCH_SIZE,
+                 max_rate: float = REEMBED_MAX_RATE):
+        """
+        Args:
+            store: The live store, swapped to the new generation when the job succeeds
+            model_name: SentenceTransformer model of the new generation
+            backend: Encoder backend of the new generation, see RAG.embedding_backends
+            num_shards: Shards per language of the new generation, the live layout by default
+            batch_size: Chunks encoded per step, progress is reported and throttling applied per step
+            max_rate: Upper bound on chunks encoded per second, to leave CPU to live queries (0: none)
+        """
+        self.store = store
+        self.model_name = model_name
+        self.backend = backend
+        self.num_shards = max(1, num_shards or store.num_shards)
+        self.shard_by = SHARD_BY
+        self.batch_size = max(1, batch_size)
+        self.max_rate = max_rate
+        self.state = "pending"
+        self.processed = 0
+        self.total = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.verification: Dict = {}
+        self._cancelled = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # === Progress ===
+
+    def status(self) -> Dict:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.processed
+        return {
+            "state": self.state,
+            "model_name": self.model_name,
+            "backend": self.backend,
+            "shards": self.num_shards,
+            "shard_by": self.shard_by,
+            "processed": self.processed,
+            "total": self.total,
+            "progress": round(self.processed / self.total, 4) if self.total else 0.0,
+            "chunks_per_s": round(rate, 2),
+            "eta_s": round(remaining / rate, 1) if rate > 0 and self.state == "embedding" else None,
+            "elapsed_s": round(elapsed, 1),
+            "verification": self.verification,
+            "error": self.error,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self.state in {"pending", "embedding", "swapping"}
+
+    def cancel(self) -> None:
+        """Stop before the swap; the live generation is left untouched."""
+        self._cancelled.set()
+
+    def start(self) -> "ReembedJob":
+        self._thread = threading.Thread(target=self.run, name="reembed", daemon=True)
+        self._thread.start()
+        return self
+
+    # === Work ===
+
+    def _encode(self, embedder: MultilingualEmbedder, chunks: Chunks, throttle: bool = True) -> np.ndarray:
+        """
+        Passage vectors of `chunks`, batch_size at a time. With `throttle`, keeps under max_rate
+        chunks per second and pauses while interactive queries run.
+        """
+        vectors = []
+        for start in range(0, len(chunks), self.batch_size):
+            if self._cancelled.is_set():
+                raise ReembedCancelled()
+            batch = [doc.page_content for _, doc in chunks[start:start + self.batch_size]]
+            if throttle:
+                # Background work, like ingestion it gives way to interactive queries
+                governor.wait_for_ingestion_slot("reembed")
+            began = time.perf_counter()
+            with time_stage("reembed", model=self.model_name, items=len(batch)):
+                vectors.append(np.asarray(embedder.embed_documents(batch), dtype=np.float32))
+            self.processed += len(batch)
+            if throttle and self.max_rate > 0:
+                time.sleep(max(0.0, len(batch) / self.max_rate - (time.perf_counter() - began)))
+        return np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def _build_stores(self, embedder: MultilingualEmbedder,
+                      embedded: Dict[str, Dict[str, Tuple[Document, np.ndarray]]]) -> Dict[str, Optional[FAISS]]:
+        """FAISS stores of the new shard layout, keeping the chunks' docstore ids."""
+        vector_stores: Dict[str, Optional[FAISS]] = {}
+        for lang in LANGUAGES:
+            shards: Dict[str, Chunks] = {name: [] for name in self.store._shard_names(lang, self.num_shards)}
+            for docstore_id, (doc, _) in embedded.get(lang, {}).items():
+                shards[self.store._shard_for(lang, doc.metadata, self.num_shards, self.shard_by)].append((docstore_id, doc))
+            for name, chunks in shards.items():
+                if not chunks:
+                    vector_stores[name] = None
+                    continue
+                vectors = np.stack([embedded[lang][docstore_id][1] for docstore_id, _ in chunks])
+                index = faiss.IndexFlatL2(vectors.shape[1])
+                index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+                vector_stores[name] = FAISS(
+                    embedding_function=embedder,
+                    index=index,
+                    docstore=InMemoryDocstore({docstore_id: doc for docstore_id, doc in chunks}),
+                    index_to_docstore_id={position: docstore_id for position, (docstore_id, _) in enumerate(chunks)},
+                )
+        return vector_stores
+
+    @staticmethod
+    def _self_recall(stores: List[FAISS], embedder: MultilingualEmbedder, sample: Chunks) -> float:
+        """Share of sampled chunks whose document is in the top VERIFY_K results for the chunk's own text."""
+        if not sample or not stores:
+            return 0.0
+        queries = np.asarray(embedder.embed_queries([doc.page_content for _, doc in sample]), dtype=np.float32)
+        hits = 0
+        for (_, doc), query in zip(sample, queries):
+            results = []
+            for store in stores:
+                distances, positions = store.index.search(query[None, :], min(VERIFY_K, store.index.ntotal))
+                results.extend((distance, store, position) for distance, position in zip(distances[0], positions[0])
+                               if position >= 0)
+            results.sort(key=lambda result: result[0])
+            doc_ids = {store.docstore._dict[store.index_to_docstore_id[int(position)]].metadata.get("doc_id")
+                       for _, store, position in results[:VERIFY_K]}
+            hits += doc.metadata.get("doc_id") in doc_ids
+        return hits / len(sample)
+
+    def _verify(self, live: Dict[str, Optional[FAISS]], new: Dict[str, Optional[FAISS]],
+                embedder: MultilingualEmbedder, chunks: Dict[str, Chunks]) -> None:
+        """Raise RuntimeError unless the new generation holds every live chunk and retrieves about as well."""
+        report = {}
+        for lang in LANGUAGES:
+            live_stores = [store for name, store in live.items() if store is not None and name.split("_")[0] == lang]
+            new_stores = [store for name, store in new.items() if store is not None and name.split("_")[0] == lang]
+            live_count = sum(store.index.ntotal for store in live_stores)
+            new_count = sum(store.index.ntotal for store in new_stores)
+            if live_count != new_count:
+                raise RuntimeError(f"{lang}: new generation has {new_count} vectors, live has {live_count}")
+            if not live_count:
+                continue
+            sample = random.Random(0).sample(chunks[lang], min(VERIFY_SAMPLE, len(chunks[lang])))
+            live_recall = self._self_recall(live_stores, self.store.embedder, sample)
+            new_recall = self._self_recall(new_stores, embedder, sample)
+            report[lang] = {"vectors": new_count, "live_recall": round(live_recall, 4), "new_recall": round(new_recall, 4)}
+            if new_recall < live_recall - VERIFY_TOLERANCE:
+                self.verification = report
+                raise RuntimeError(f"{lang}: self-retrieval recall@{VERIFY_K} drops from {live_recall:.3f} to {new_recall:.3f}")
+        self.verification = report
+
+    @staticmethod
+    def _chunks(vector_stores: Dict[str, Optional[FAISS]]) -> Dict[str, Dict[str, Document]]:
+        chunks: Dict[str, Dict[str, Document]] = {lang: {} for lang in LANGUAGES}
+        for name, store in vector_stores.items():
+            if store is not None:
+                chunks[name.split("_")[0]].update(store.docstore._dict)
+        return chunks
+
+    def run(self) -> Dict:
+        """Rebuild, verify and swap. Returns the final status; never raises."""
+        self.started_at = time.time()
+        self.state = "embedding"
+        try:
+            embedder = MultilingualEmbedder(self.model_name, self.backend)
+
+            # 1. Re-embed a snapshot of the live generation, without any lock
+            self.store.refresh(force=True)
+            source_version = self.store.version
+            source = self._chunks(self.store.vector_stores)
+            self.total = sum(len(chunks) for chunks in source.values())
+            logger.info(f"Re-embedding {self.total} chunks of index version {source_version} with "
+                        f"{self.model_name} ({self.backend}), {self.num_shards} shard(s) per language")
+            embedded: Dict[str, Dict[str, Tuple[Document, np.ndarray]]] = {}
+            for lang, docs in source.items():
+                items = list(docs.items())
+                vectors = self._encode(embedder, items)
+                embedded[lang] = {docstore_id: (doc, vector) for (docstore_id, doc), vector in zip(items, vectors)}
+
+            # 2. Catch up with writes made meanwhile, verify and swap, all under the writer lock
+            self.state = "swapping"
+            with self.store._writing() as live:
+                if self._cancelled.is_set():
+                    raise ReembedCancelled()
+                current = self._chunks(live)
+                for lang in LANGUAGES:
+                    for docstore_id in set(embedded[lang]) - set(current[lang]):
+                        del embedded[lang][docstore_id]
+                    added = [(docstore_id, doc) for docstore_id, doc in current[lang].items()
+                             if docstore_id not in embedded[lang]]
+                    if added:
+                        self.total += len(added)
+                        vectors = self._encode(embedder, added, throttle=False)
+                        embedded[lang].update({docstore_id: (doc, vector) for (docstore_id, doc), vector in zip(added, vectors)})
+                if self.store.version != source_version:
+                    logger.info(f"Caught up with index versions {source_version + 1}..{self.store.version}")
+
+                new_stores = self._build_stores(embedder, embedded)
+                self._verify(live, new_stores, embedder, {lang: list(docs.items()) for lang, docs in current.items()})
+                self.store.publish_generation(new_stores, embedder, self.model_name, self.num_shards, self.shard_by,
+                                              self.backend)
+            self.state = "swapped"
+        except ReembedCancelled:
+            self.state = "cancelled"
+            logger.info("Re-embedding cancelled, the live index generation is unchanged")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Re-embedding failed, the live index generation is unchanged: {e}")
+        finally:
+            self.finished_at = time.time()
+        return self.status()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Re-embed the indexes into a new generation and swap it in")
+    parser.add_argument("--model", required=True, help="SentenceTransformer model of the new generation")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=["torch", "int8", "onnx"])
+    parser.add_argument("--shards", type=int, help="Shards per language (default: unchanged)")
+    parser.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE)
+    parser.add_argument("--max-rate", type=float, default=REEMBED_MAX_RATE, help="Chunks per second, 0 for no limit")
+    parser.add_argument("--rollback", action="store_true", help="Serve the previous generation again instead")
+    args = parser.parse_args(argv)
+
+    store = FaissEmbeddingStore()
+    if args.rollback:
+        print(json.dumps(store.rollback(), indent=2))
+        return
+    job = ReembedJob(store, args.model, args.backend, args.shards, args.batch_size, args.max_rate).start()
+    while job._thread.is_alive():
+        job._thread.join(timeout=5)
+        status = job.status()
+        logger.info(f"Re-embedding: {status['processed']}/{status['total']} chunks, ETA {status['eta_s']}s")
+    print(json.dumps(job.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
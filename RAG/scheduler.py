@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from utils import logger
+
+MAX_CONCURRENT_GENERATIONS = 2
+MAX_QUEUED_GENERATIONS = 16
+DEFAULT_QUEUE_TIMEOUT = 60.0  # seconds a request may wait for a generation slot
+WAIT_SAMPLES = 512  # recent wait/generation times kept for stats and Retry-After estimates
+
+
+class QueueFullError(Exception):
+    """Raised when the generation queue cannot take another request."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Generation queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a queued request did not get a generation slot before its deadline."""
+
+
+class GenerationTicket:
+    """
+    A request's place in the generation queue.
+
+    Use as an async context manager: entering waits for a slot (or raises
+    DeadlineExceededError), leaving releases the slot to the next waiter.
+    """
+
+    def __init__(self, scheduler: "GenerationScheduler", priority: int, deadline: float):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.granted = asyncio.get_running_loop().create_future()
+        self.done = False
+
+    async def __aenter__(self) -> "GenerationTicket":
+        timeout = self.deadline - time.monotonic()
+        try:
+            if timeout <= 0 and not self.granted.done():
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(asyncio.shield(self.granted), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            self.cancel()
+            raise DeadlineExceededError("Timed out waiting for a generation slot")
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        self.started_at = time.monotonic()
+        self.scheduler._record_wait(self.started_at - self.enqueued_at)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.cancel()
+
+    def cancel(self):
+        """Give up the slot or the queue position. Safe to call more than once."""
+        if self.done:
+            return
+        self.done = True
+        if self.granted.done() and not self.granted.cancelled():
+            self.scheduler._release(self)
+        else:
+            self.granted.cancel()
+            self.scheduler._discard(self)
+
+
+class GenerationScheduler:
+    """
+    Admission control for LLM generations.
+
+    At most `max_concurrent` generations run at once. Further requests wait in a bounded
+    priority queue (lower `priority` value is served first, ties in arrival order) until a
+    slot frees up or their deadline passes. When the queue is full, `submit` fails fast
+    with QueueFullError so the caller can answer 429 instead of piling up work on Ollama.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_GENERATIONS,
+        max_queue: int = MAX_QUEUED_GENERATIONS,
+        default_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.in_flight = 0
+        self._queue: List = []
+        self._queued = 0
+        self._counter = itertools.count()
+        self._wait_times = deque(maxlen=WAIT_SAMPLES)
+        self._run_times = deque(maxlen=WAIT_SAMPLES)
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.expired_total = 0
+
+    def submit(self, priority: int = 0, timeout: Optional[float] = None) -> GenerationTicket:
+        """
+        Reserve a place for one generation.
+
+        Args:
+            priority: Lower values are served first
+            timeout: Seconds the request may wait for a slot, defaults to default_timeout
+
+        Returns:
+            GenerationTicket to enter around the generation
+
+        Raises:
+            QueueFullError: If no slot is free and the wait queue is full
+        """
+        self.check_capacity()
+        timeout = self.default_timeout if timeout is None else timeout
+        ticket = GenerationTicket(self, priority, time.monotonic() + timeout)
+        self.admitted_total += 1
+        if self.in_flight < self.max_concurrent and not self._queued:
+            self._grant(ticket)
+        else:
+            heapq.heappush(self._queue, (priority, next(self._counter), ticket))
+            self._queued += 1
+        return ticket
+
+    def check_capacity(self) -> None:
+        """
+        Fail fast when a request submitted now would be rejected, without reserving anything.
+
+        Lets an endpoint answer 429 before it starts streaming, while the ticket itself is only
+        submitted once retrieval is done and the generation is about to start.
+
+        Raises:
+            QueueFullError: If no slot is free and the wait queue is full
+        """
+        if self.in_flight >= self.max_concurrent and self._queued >= self.max_queue:
+            self.rejected_total += 1
+            retry_after = self.retry_after()
+            logger.warning(f"Generation queue full ({self._queued} waiting), rejecting; retry after {retry_after}s")
+            raise QueueFullError(retry_after)
+
+    def _grant(self, ticket: GenerationTicket):
+        self.in_flight += 1
+        ticket.granted.set_result(True)
+
+    def _release(self, ticket: GenerationTicket):
+        self.in_flight -= 1
+        if ticket.started_at is not None:
+            self._run_times.append(time.monotonic() - ticket.started_at)
+        self._dispatch()
+
+    def _discard(self, ticket: GenerationTicket):
+        # The heap entry is skipped lazily in _dispatch, only the count changes here
+        self._queued -= 1
+        if time.monotonic() >= ticket.deadline:
+            self.expired_total += 1
+
+    def _dispatch(self):
+        while self._queue and self.in_flight < self.max_concurrent:
+            _, _, ticket = heapq.heappop(self._queue)
+            if ticket.done:
+                continue
+            self._queued -= 1
+            self._grant(ticket)
+
+    def _record_wait(self, seconds: float):
+        self._wait_times.append(seconds)
+
+    def retry_after(self) -> int:
+        """Estimate in whole seconds until a queued request would start."""
+        if self._run_times:
+            avg_run = sum(self._run_times) / len(self._run_times)
+        else:
+            avg_run = 5.0
+        waves = (self._queued + 1) / max(self.max_concurrent, 1)
+        return max(1, int(avg_run * waves + 0.5))
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of queue depth, concurrency and wait time statistics."""
+        waits = sorted(self._wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(int(p * len(waits)), len(waits) - 1)]
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "expired_total": self.expired_total,
+            "wait_seconds_p50": percentile(0.5),
+            "wait_seconds_p99": percentile(0.99),
+            "wait_seconds_max": waits[-1] if waits else 0.0,
+        }
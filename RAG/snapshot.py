@@ -0,0 +1,229 @@
+"""
+Portable, checksummed snapshots of the FAISS indexes.
+
+A snapshot is a directory:
+
+    snapshot.json           format version, model, dimension, shard layout, per-file sha256
+    {store}/vectors.npy     float32 matrix in index order (memory-mappable)
+    {store}/chunks.parquet  one row per vector: docstore id, text and chunk metadata
+
+where {store} is a language or language shard name. Unlike the pickled docstores of the
+persisted indexes, nothing in a snapshot executes code when it is loaded.
+
+Usage:
+    python -m RAG.snapshot export SNAPSHOT_DIR
+    python -m RAG.snapshot import SNAPSHOT_DIR
+"""
+import argparse
+import hashlib
+import json
+import os
+import tarfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+import faiss
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+SNAPSHOT_FORMAT = "pdl-index-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "snapshot.json"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.parquet"
+BATCH_ROWS = 50_000  # rows per Parquet row group and per index.add call, bounds memory on both sides
+
+# Metadata written to their own Parquet columns; anything else goes to the JSON "metadata" column
+METADATA_COLUMNS = ("chunk_id", "doc_id", "chunk_idx", "parallel_id", "collection")
+CHUNKS_SCHEMA = pa.schema([
+    ("docstore_id", pa.string()),
+    ("text", pa.string()),
+    ("chunk_id", pa.string()),
+    ("doc_id", pa.string()),
+    ("chunk_idx", pa.int64()),
+    ("parallel_id", pa.string()),
+    ("collection", pa.string()),
+    ("metadata", pa.string()),
+])
+
+
+class SnapshotError(Exception):
+    """The snapshot is malformed, corrupted or incompatible with this store."""
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_rows(store: FAISS, start: int, stop: int) -> Dict[str, List]:
+    columns = {field.name: [] for field in CHUNKS_SCHEMA}
+    for position in range(start, stop):
+        docstore_id = store.index_to_docstore_id[position]
+        doc = store.docstore._dict[docstore_id]
+        metadata = dict(doc.metadata)
+        columns["docstore_id"].append(docstore_id)
+        columns["text"].append(doc.page_content)
+        for name in METADATA_COLUMNS:
+            value = metadata.pop(name, None)
+            if name == "chunk_idx":
+                columns[name].append(None if value is None else int(value))
+            else:
+                columns[name].append(None if value is None else str(value))
+        columns["metadata"].append(json.dumps(metadata, ensure_ascii=False) if metadata else None)
+    return columns
+
+
+def write_store(store: FAISS, directory: str) -> Dict:
+    """
+    Write one FAISS store as vectors.npy + chunks.parquet, BATCH_ROWS vectors at a time.
+
+    Returns:
+        {"rows": number of vectors, "files": {file name: sha256}}
+    """
+    os.makedirs(directory, exist_ok=True)
+    total, dim = store.index.ntotal, store.index.d
+    vectors_path = os.path.join(directory, VECTORS_FILE)
+    vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(total, dim))
+    with pq.ParquetWriter(os.path.join(directory, CHUNKS_FILE), CHUNKS_SCHEMA, compression="zstd") as writer:
+        for start in range(0, total, BATCH_ROWS):
+            stop = min(start + BATCH_ROWS, total)
+            vectors[start:stop] = store.index.reconstruct_n(start, stop - start)
+            writer.write_table(pa.table(_chunk_rows(store, start, stop), schema=CHUNKS_SCHEMA))
+    vectors.flush()
+    del vectors
+    return {
+        "rows": total,
+        "files": {name: file_sha256(os.path.join(directory, name)) for name in (VECTORS_FILE, CHUNKS_FILE)},
+    }
+
+
+def _documents(path: str) -> Iterator[tuple]:
+    """(docstore id, Document) pairs from chunks.parquet, one row group at a time."""
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_ROWS):
+        for row in batch.to_pylist():
+            metadata = json.loads(row["metadata"]) if row["metadata"] else {}
+            for name in METADATA_COLUMNS:
+                metadata[name] = row[name]
+            yield row["docstore_id"], Document(page_content=row["text"], metadata=metadata)
+
+
+def read_store(directory: str, embedder, rows: int) -> FAISS:
+    """
+    Load one store from a snapshot directory. Vectors are memory-mapped and copied into the
+    index BATCH_ROWS at a time, so the file is never held in memory twice.
+    """
+    vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+    if vectors.ndim != 2 or vectors.shape[0] != rows:
+        raise SnapshotError(f"{directory}: expected {rows} vectors, found shape {vectors.shape}")
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    for start in range(0, rows, BATCH_ROWS):
+        index.add(np.ascontiguousarray(vectors[start:start + BATCH_ROWS], dtype=np.float32))
+    del vectors
+
+    docstore, index_to_docstore_id = {}, {}
+    for position, (docstore_id, document) in enumerate(_documents(os.path.join(directory, CHUNKS_FILE))):
+        docstore[docstore_id] = document
+        index_to_docstore_id[position] = docstore_id
+    if len(index_to_docstore_id) != rows:
+        raise SnapshotError(f"{directory}: {rows} vectors but {len(index_to_docstore_id)} chunks")
+    return FAISS(
+        embedding_function=embedder,
+        index=index,
+        docstore=InMemoryDocstore(docstore),
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def write_manifest(directory: str, manifest: Dict) -> None:
+    with open(os.path.join(directory, SNAPSHOT_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def new_manifest(model_name: str, dim: Optional[int], shards: int, index_version: int,
+                 shard_by: Optional[str] = None) -> Dict:
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "format_version": SNAPSHOT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "model_name": model_name,
+        "dim": dim,
+        "shards": shards,
+        "shard_by": shard_by,
+        "index_version": index_version,
+        "stores": {},
+    }
+
+
+def read_manifest(directory: str, verify: bool = True) -> Dict:
+    """
+    Read and validate snapshot.json, checking every file's sha256 when `verify` is set.
+
+    Raises:
+        SnapshotError: if the snapshot is malformed, of an unknown format version or corrupted
+    """
+    try:
+        with open(os.path.join(directory, SNAPSHOT_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Cannot read {SNAPSHOT_FILE}: {e}")
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("format_version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} v{manifest.get('format_version')}")
+
+    for name, entry in manifest["stores"].items():
+        if os.path.basename(name) != name or name.startswith("."):
+            raise SnapshotError(f"Invalid store name {name!r}")
+        if not verify:
+            continue
+        for file_name, checksum in entry["files"].items():
+            path = os.path.join(directory, name, os.path.basename(file_name))
+            if not os.path.isfile(path) or file_sha256(path) != checksum:
+                raise SnapshotError(f"Checksum mismatch for {name}/{file_name}")
+    return manifest
+
+
+def pack(directory: str, archive_path: str) -> None:
+    """Bundle a snapshot directory into an uncompressed tar (its files are already compact)."""
+    with tarfile.open(archive_path, "w") as tar:
+        for name in sorted(os.listdir(directory)):
+            tar.add(os.path.join(directory, name), arcname=name)
+
+
+def unpack(archive_path: str, directory: str) -> None:
+    """Extract a snapshot tar, refusing links and paths outside the target directory."""
+    root = os.path.realpath(directory)
+    with tarfile.open(archive_path, "r") as tar:
+        members = tar.getmembers()
+        for member in members:
+            target = os.path.realpath(os.path.join(root, member.name))
+            if not (member.isfile() or member.isdir()) or not target.startswith(root + os.sep):
+                raise SnapshotError(f"Refusing to extract {member.name!r}")
+        tar.extractall(root, members=members)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export or import a snapshot of the FAISS indexes")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Snapshot directory, or a .tar archive")
+    parser.add_argument("--no-verify", action="store_true", help="Skip checksum verification on import")
+    args = parser.parse_args(argv)
+
+    from RAG.embeddings import FaissEmbeddingStore
+
+    store = FaissEmbeddingStore()
+    if args.command == "export":
+        result = store.export_snapshot(args.path)
+    else:
+        result = store.import_snapshot(args.path, verify=not args.no_verify)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from utils import logger
+
+AUDIO_CACHE_DIR = "audio_cache"
+AUDIO_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+EVICTION_GRACE_SECONDS = 60  # a path handed out by get() is not evicted for this long, so it can still be opened
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so that answers differing only in whitespace or Unicode form share a cache entry."""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AudioCache:
+    """
+    Content-addressed, size-bounded LRU cache of synthesized audio on disk.
+
+    Entries are keyed by (engine, language, normalized text). The key doubles as the
+    ETag, so clients can revalidate with If-None-Match without the audio being re-read.
+
+    Entries returned by get() or put() within the last EVICTION_GRACE_SECONDS are skipped by
+    eviction (the cache may exceed max_bytes meanwhile), so a response that was handed a path
+    can still open the file.
+    """
+
+    def __init__(self, cache_dir: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (path, size), least recently used first
+        self.handed_out: Dict[str, float] = {}  # key -> monotonic time its path was last returned
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from the files already on disk, oldest access first."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, os.path.splitext(name)[0], path, stat.st_size))
+        for _, key, path, size in sorted(files):
+            self.entries[key] = (path, size)
+            self.total_bytes += size
+        logger.info(f"Audio cache: {len(self.entries)} entries, {self.total_bytes / 1024 / 1024:.1f} MB")
+
+    @staticmethod
+    def make_key(engine: str, language: str, text: str) -> str:
+        payload = f"{engine}\0{language}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached audio file.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Path to the audio file, or None on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not os.path.exists(entry[0]):
+                if entry is not None:
+                    # File was removed behind our back
+                    self.total_bytes -= entry[1]
+                    del self.entries[key]
+                    self.handed_out.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.handed_out[key] = time.monotonic()
+            self.hits += 1
+        try:
+            # mtime marks recency so the LRU order survives a restart
+            os.utime(entry[0])
+        except OSError:
+            pass
+        return entry[0]
+
+    def put(self, key: str, audio: bytes, extension: str = "mp3") -> str:
+        """
+        Store audio under the given key, evicting least recently used entries if needed.
+
+        Args:
+            key: Cache key from make_key
+            audio: Encoded audio bytes
+            extension: File extension matching the audio format
+
+        Returns:
+            Path to the cached audio file
+        """
+        path = os.path.join(self.cache_dir, f"{key}.{extension}")
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(audio)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self.entries[key] = (path, len(audio))
+            self.total_bytes += len(audio)
+            now = time.monotonic()
+            self.handed_out[key] = now
+            evicted = []
+            for old_key in list(self.entries):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if now - self.handed_out.get(old_key, float("-inf")) < EVICTION_GRACE_SECONDS:
+                    continue  # possibly about to be sent
+                old_path, old_size = self.entries.pop(old_key)
+                self.handed_out.pop(old_key, None)
+                self.total_bytes -= old_size
+                evicted.append(old_path)
+
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Failed to evict cached audio {old_path}: {e}")
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} cached audio files")
+        return path
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,31 +1,436 @@
 from gtts import gTTS
 from utils import valid_languages
 from utils import logger
+from TTS.audio_cache import AudioCache
+from metrics import Gauge, time_stage
+import tracing
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import abc
+import asyncio
+import contextvars
 import io
-def generate_audio(text: str, language: str):
-    """Generate audio from text using gTTS"""
+import os
+import re
+import struct
+import threading
+import wave
+
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+PARLER_MODEL_NAME = "ai4bharat/indic-parler-tts"
+TTS_WORKERS = 4
+TTS_LANGUAGE_CONCURRENCY = {"punjabi": 2, "hindi": 2, "english": 2}
+TTS_SEGMENT_CHARS = 400  # long answers are cut into segments of about this size and synthesized in parallel
+
+# Sentence ends: danda/double danda always end a sentence, Latin punctuation only before whitespace
+SENTENCE_BOUNDARY = re.compile(r"(?<=[।॥])\s*|(?<=[.!?])\s+")
+SENTENCE_END = re.compile(r"(?:[।॥]\s*|[.!?]\s+)$")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences on `।`, `॥`, `.`, `!` and `?` boundaries."""
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def split_segments(text: str, max_chars: int = TTS_SEGMENT_CHARS) -> List[str]:
+    """Group whole sentences into segments of at most max_chars (longer sentences stay whole)."""
+    segments = []
+    current = ""
+    for sentence in split_sentences(text):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+class SentenceBuffer:
+    """
+    Collects streamed text (e.g. LLM tokens) and hands out sentences as soon as they are complete.
+    """
+
+    def __init__(self):
+        self.pending = ""
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add a chunk of text and return the sentences it completed."""
+        self.pending += chunk
+        sentences = split_sentences(self.pending)
+        # The last piece is only complete if the text ends on a boundary
+        if sentences and SENTENCE_END.search(self.pending) is None:
+            self.pending = sentences.pop()
+        else:
+            self.pending = ""
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the stream has ended."""
+        sentences = split_sentences(self.pending)
+        self.pending = ""
+        return sentences
+
+
+class TTSBackend(abc.ABC):
+    """
+    Interface of a text-to-speech engine.
+
+    `synthesize` returns one complete audio file. `stream` returns audio for a sequence of
+    sentences as a single playable stream, one piece per sentence as soon as it is ready.
+    """
+
+    name = "base"
+    media_type = "application/octet-stream"
+    extension = "bin"
+
+    @abc.abstractmethod
+    def synthesize(self, text: str, language: str) -> bytes:
+        """One complete audio file for the text."""
+
+    def stream(self, sentences: Iterable[str], language: str) -> Iterator[bytes]:
+        header = self.stream_header()
+        if header:
+            yield header
+        for sentence in sentences:
+            yield self.stream_piece(sentence, language)
+
+    def stream_header(self) -> bytes:
+        """Bytes sent once before the per-sentence pieces of a stream."""
+        return b""
+
+    def stream_piece(self, sentence: str, language: str) -> bytes:
+        """Audio for one sentence in the form used inside a stream."""
+        return self.synthesize(sentence, language)
+
+    def assemble(self, pieces: List[bytes]) -> bytes:
+        """Join stream pieces, in order, into one complete audio file."""
+        return b"".join(pieces)
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS. Needs network access. MP3 pieces can be concatenated as-is."""
+
+    name = "gtts"
+    media_type = "audio/mpeg"
+    extension = "mp3"
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        tts = gTTS(text=text, lang=valid_languages[language], slow=False)
+        buffer = io.BytesIO()
+        tts.write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class PCMBackend(TTSBackend):
+    """
+    Base for local engines producing 16-bit mono PCM.
+
+    Complete files are WAV. Streams start with a WAV header whose sizes are left open
+    (0xFFFFFFFF), followed by raw PCM per sentence, which players accept as a live stream.
+    """
+
+    media_type = "audio/wav"
+    extension = "wav"
+    sample_rate = 16000
+
+    @abc.abstractmethod
+    def synthesize_pcm(self, text: str, language: str) -> bytes:
+        """Raw 16-bit mono PCM samples at `sample_rate` for the text."""
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        return self._wrap_wav(self.synthesize_pcm(text, language))
+
+    def stream_header(self) -> bytes:
+        byte_rate = self.sample_rate * 2
+        return (
+            b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, self.sample_rate, byte_rate, 2, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF)
+        )
+
+    def stream_piece(self, sentence: str, language: str) -> bytes:
+        return self.synthesize_pcm(sentence, language)
+
+    def assemble(self, pieces: List[bytes]) -> bytes:
+        return self._wrap_wav(b"".join(pieces))
+
+    def _wrap_wav(self, pcm: bytes) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(pcm)
+        return buffer.getvalue()
+
+
+class SilenceBackend(PCMBackend):
+    """
+    Trivial offline stand-in for tests and benchmarks: silence whose length follows the text length.
+    """
+
+    name = "silence"
+    seconds_per_char = 0.06
+
+    def synthesize_pcm(self, text: str, language: str) -> bytes:
+        frames = int(len(text) * self.seconds_per_char * self.sample_rate)
+        return b"\x00\x00" * frames
+
+
+class ParlerTTSBackend(PCMBackend):
+    """Local Indic Parler-TTS model. Runs fully offline once the model is in the Hugging Face cache."""
+
+    name = "parler"
+    descriptions = {
+        "punjabi": "Divjot speaks in a clear, moderate-paced voice with very clear audio.",
+        "hindi": "Rohit speaks in a clear, moderate-paced voice with very clear audio.",
+        "english": "Mary speaks in a clear, moderate-paced voice with very clear audio.",
+    }
+
+    def __init__(self, model_name: str = PARLER_MODEL_NAME):
+        import torch
+        from parler_tts import ParlerTTSForConditionalGeneration
+        from transformers import AutoTokenizer
+
+        logger.info(f"Loading Parler-TTS model: {model_name}")
+        self.torch = torch
+        self.model = ParlerTTSForConditionalGeneration.from_pretrained(model_name).to("cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.description_tokenizer = AutoTokenizer.from_pretrained(self.model.config.text_encoder._name_or_path)
+        self.sample_rate = self.model.config.sampling_rate
+        self.lock = threading.Lock()  # generate() is not safe to call from several threads at once
+        logger.info(f"Parler-TTS model loaded, sample rate {self.sample_rate}")
+
+    def synthesize_pcm(self, text: str, language: str) -> bytes:
+        description = self.description_tokenizer(self.descriptions[language], return_tensors="pt")
+        prompt = self.tokenizer(text, return_tensors="pt")
+        with self.lock, self.torch.no_grad():
+            audio = self.model.generate(
+                input_ids=description.input_ids,
+                attention_mask=description.attention_mask,
+                prompt_input_ids=prompt.input_ids,
+                prompt_attention_mask=prompt.attention_mask,
+            )
+        samples = audio.cpu().numpy().squeeze().clip(-1.0, 1.0)
+        return (samples * 32767).astype("<i2").tobytes()
+
+
+BACKENDS = {
+    "gtts": GTTSBackend,
+    "parler": ParlerTTSBackend,
+    "silence": SilenceBackend,
+}
+_backend_instances = {}
+_backend_lock = threading.Lock()
+
+
+def get_backend(name: Optional[str] = None) -> TTSBackend:
+    """Return the (lazily created, shared) backend with the given name, TTS_BACKEND by default."""
+    name = name or TTS_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend '{name}'. Available: {', '.join(BACKENDS)}")
+    with _backend_lock:
+        if name not in _backend_instances:
+            _backend_instances[name] = BACKENDS[name]()
+        return _backend_instances[name]
+
+
+async def load_backend(name: Optional[str] = None) -> TTSBackend:
+    """
+    get_backend for the event loop: creating a backend can load a model for a long time
+    (Parler-TTS), so it runs on a worker thread.
+    """
+    return await tracing.to_thread(get_backend, name)
+
+
+audio_cache = AudioCache()
+Gauge("pdl_audio_cache_hit_ratio", "Share of audio requests served from the disk cache.",
+      callback=lambda: {(): audio_cache.stats()["hit_rate"]})
+Gauge("pdl_audio_cache_bytes", "Size of the audio cache on disk.",
+      callback=lambda: {(): audio_cache.stats()["bytes"]})
+
+
+def generate_audio(text: str, language: str, backend: Optional[TTSBackend] = None):
+    """Generate audio from text using the configured TTS backend"""
     if not text.strip():
         logger.error("Text cannot be empty.")
         return None
-        
+
     if language not in valid_languages:
         logger.error(f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
         return None
 
     try:
-        # Create TTS object
-        tts = gTTS(text=text, lang=valid_languages[language], slow=False)
-        
-        # Create buffer to store audio
-        buffer = io.BytesIO()
-        tts.write_to_fp(buffer)
-        buffer.seek(0)
-        
-        return buffer.getvalue()
-        
+        backend = backend or get_backend()
+        return backend.synthesize(text, language)
+
     except ValueError as ve:
         logger.error(f"TTS Error: {str(ve)}")
         return None
     except Exception as e:
         logger.error(f"Error generating audio: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+def audio_cache_key(text: str, language: str, backend: Optional[TTSBackend] = None) -> str:
+    """Cache key (and ETag) of the audio for this text with `backend`, the current engine by default."""
+    return AudioCache.make_key((backend or get_backend()).name, language, text)
+
+
+def generate_audio_cached(text: str, language: str) -> Optional[str]:
+    """
+    Return the path of the audio for the text, synthesizing it only on a cache miss.
+    Returns None if synthesis fails.
+    """
+    backend = get_backend()
+    key = audio_cache_key(text, language, backend)
+    path = audio_cache.get(key)
+    if path is not None:
+        return path
+
+    audio_data = generate_audio(text, language, backend)
+    if audio_data is None:
+        return None
+    return audio_cache.put(key, audio_data, extension=backend.extension)
+
+
+class TTSWorkerPool:
+    """
+    Runs synthesis on a bounded thread pool so it never blocks the event loop.
+
+    Long text is cut into sentence-aligned segments that are synthesized concurrently and
+    joined in order. Each language has its own concurrency limit, so one long answer cannot
+    take every worker.
+    """
+
+    def __init__(self, max_workers: int = TTS_WORKERS, language_concurrency: Optional[Dict[str, int]] = None,
+                 segment_chars: int = TTS_SEGMENT_CHARS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self.language_concurrency = language_concurrency or TTS_LANGUAGE_CONCURRENCY
+        self.segment_chars = segment_chars
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, language: str) -> asyncio.Semaphore:
+        if language not in self.semaphores:
+            self.semaphores[language] = asyncio.Semaphore(self.language_concurrency.get(language, 1))
+        return self.semaphores[language]
+
+    async def run(self, language: str, func, *args):
+        """Run a blocking TTS call on the pool, within the language's concurrency limit."""
+        async with self._semaphore(language):
+            # Copy the context like asyncio.to_thread, so request traces follow the work
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, func, *args)
+
+    async def run_tts(self, language: str, backend: TTSBackend, func, text: str) -> bytes:
+        """Run one synthesis call on the pool and record it as the "tts" stage."""
+        def timed():
+            with time_stage("tts", model=backend.name, items=1):
+                return func(text, language)
+        return await self.run(language, timed)
+
+    async def synthesize(self, text: str, language: str) -> bytes:
+        """Synthesize text into one complete audio file, segments in parallel."""
+        if language not in valid_languages:
+            raise ValueError(f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+        backend = await load_backend()
+        segments = split_segments(text, self.segment_chars)
+        if len(segments) <= 1:
+            return await self.run_tts(language, backend, backend.synthesize, text)
+        pieces = await asyncio.gather(
+            *(self.run_tts(language, backend, backend.stream_piece, segment) for segment in segments)
+        )
+        return backend.assemble(list(pieces))
+
+    async def generate_cached(self, text: str, language: str) -> Optional[str]:
+        """
+        Async counterpart of generate_audio_cached. Returns None if synthesis fails.
+        """
+        backend = await load_backend()
+        key = audio_cache_key(text, language, backend)
+        path = audio_cache.get(key)
+        if path is not None:
+            return path
+
+        try:
+            audio_data = await self.synthesize(text, language)
+        except Exception as e:
+            logger.error(f"Error generating audio: {str(e)}")
+            return None
+        return await self.run(language, audio_cache.put, key, audio_data, backend.extension)
+
+    async def stream(self, sentences: AsyncIterable[str], language: str) -> AsyncIterator[bytes]:
+        """
+        Synthesize sentences as they arrive and yield their audio in order.
+
+        Sentences are started as soon as they arrive (within the language limit), so the
+        next one is usually ready by the time the previous one has been sent.
+        """
+        backend = await load_backend()
+        header = backend.stream_header()
+        if header:
+            yield header
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for sentence in sentences:
+                    await queue.put(asyncio.ensure_future(self.run_tts(language, backend, backend.stream_piece, sentence)))
+            finally:
+                await queue.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                task = await queue.get()
+                if task is None:
+                    break
+                yield await task
+            # Surface errors from the text stream itself
+            await producer
+        finally:
+            producer.cancel()
+            while not queue.empty():
+                task = queue.get_nowait()
+                if task is not None:
+                    task.cancel()
+
+
+tts_pool = TTSWorkerPool()
+
+
+async def _iterate(items: Iterable[str]) -> AsyncIterator[str]:
+    for item in items:
+        yield item
+
+
+async def _complete_sentences(chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+    sentence_buffer = SentenceBuffer()
+    async for chunk in chunks:
+        for sentence in sentence_buffer.feed(chunk):
+            yield sentence
+    for sentence in sentence_buffer.flush():
+        yield sentence
+
+
+def stream_audio(text: str, language: str) -> AsyncIterator[bytes]:
+    """
+    Synthesize text sentence by sentence, yielding audio as soon as each sentence is done.
+    """
+    if language not in valid_languages:
+        raise ValueError(f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+    return tts_pool.stream(_iterate(split_sentences(text)), language)
+
+
+def stream_audio_from_text_stream(chunks: AsyncIterable[str], language: str) -> AsyncIterator[bytes]:
+    """
+    Turn a stream of text (e.g. LLM tokens) into a stream of audio.
+
+    Each sentence is synthesized on the TTS pool as soon as it is complete, so playback
+    can start while the rest of the text is still being generated.
+    """
+    if language not in valid_languages:
+        raise ValueError(f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+    return tts_pool.stream(_complete_sentences(chunks), language)
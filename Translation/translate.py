@@ -4,6 +4,9 @@ import asyncio
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 from src.indictranstoolkit.IndicTransToolkit.processor import IndicProcessor
 from utils import logger
+from metrics import time_stage
+from resources import governor
+import tracing
 DEVICE = "cpu"
 logger.info(f"[INFO] Using device: {DEVICE}")
 
@@ -34,7 +37,7 @@ def clean_output_text_hindi(text):
     
     return text.strip()
 
-async def translate_batch(batch, src, tgt, tokenizer, model):
+def _translate_batch(batch, src, tgt, tokenizer, model):
     preprocessed = ip.preprocess_batch(batch, src_lang=src, tgt_lang=tgt)
     inputs = tokenizer(preprocessed, truncation=True, padding="longest", return_tensors="pt").to(DEVICE)
 
@@ -49,10 +52,16 @@ async def translate_batch(batch, src, tgt, tokenizer, model):
         decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
     return ip.postprocess_batch(decoded, lang=tgt)
 
+async def translate_batch(batch, src, tgt, tokenizer, model, engine):
+    # Each model runs on its own worker thread, with the cores and torch threads of its engine
+    with time_stage("translate", model=model.name_or_path, items=len(batch)):
+        return await tracing.run_in_executor(governor.executor(engine), _translate_batch, batch, src, tgt,
+                                             tokenizer, model)
+
 async def translate_punjabi_to_HindiEnglish(input_sentences):
 
-    task_en = translate_batch(input_sentences, src_lang, "eng_Latn", tokenizer_en, model_en)
-    task_hi = translate_batch(input_sentences, src_lang, "hin_Deva", tokenizer_hi, model_hi)
+    task_en = translate_batch(input_sentences, src_lang, "eng_Latn", tokenizer_en, model_en, "translation_en")
+    task_hi = translate_batch(input_sentences, src_lang, "hin_Deva", tokenizer_hi, model_hi, "translation_hi")
 
     translations_en, translations_hi = await asyncio.gather(task_en, task_hi)
 
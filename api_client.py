@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# === Backends for the Streamlit UI ===
+#
+# The UI talks to the FastAPI service over HTTP by default ("client" mode), so the Streamlit
+# process stays small. "local" mode runs the pipeline inside the UI process like before.
+
+UI_MODE = os.getenv("UI_MODE", "client")  # "client" or "local"
+API_URL = os.getenv("PDL_API_URL", "http://localhost:8000")
+UPLOAD_CONCURRENCY = 4  # documents uploaded in parallel
+REQUEST_TIMEOUT = 30.0  # seconds to connect and for short requests
+INGEST_TIMEOUT = 600.0  # OCR, translation and embedding of one document
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))  # same limit as the API
+
+# (filename, content as bytes or a file object, content type)
+UploadFile = Tuple[str, Union[bytes, BinaryIO], str]
+
+
+class APIError(Exception):
+    """Non-success response from the API, with its detail message."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class RAGClient:
+    """
+    HTTP client of the FastAPI service, sharing one pooled connection set across Streamlit reruns
+    and sessions (create it with st.cache_resource).
+    """
+
+    def __init__(self, base_url: str = API_URL, max_connections: int = 20):
+        import httpx
+
+        self.base_url = base_url.rstrip("/")
+        self.http = httpx.Client(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, read=INGEST_TIMEOUT),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    @staticmethod
+    def _check(response) -> None:
+        if response.is_success:
+            return
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise APIError(response.status_code, str(detail))
+
+    def query_events(self, query: str, language: str, k: int = 6) -> Iterator[Dict]:
+        """Stream the retrieval/token/error/done events of /query_stream as they arrive."""
+        params = {"query": query, "language": language, "k": k, "format": "ndjson"}
+        with self.http.stream("GET", "/query_stream", params=params) as response:
+            if not response.is_success:
+                response.read()
+                self._check(response)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def add_document(self, filename: str, content: Union[bytes, BinaryIO], content_type: str) -> Dict:
+        """Upload one image and wait until it is ingested; returns chunks_added and doc_uuid."""
+        response = self.http.post("/add_document", files={"file": (filename, content, content_type)})
+        self._check(response)
+        return response.json()
+
+    def add_documents(self, files: List[UploadFile],
+                      on_result: Optional[Callable[[str, Optional[Dict], Optional[Exception]], None]] = None) -> None:
+        """
+        Upload several images in parallel.
+
+        Args:
+            files: (filename, content, content type) of each image
+            on_result: Called from the calling thread as each upload finishes, with the filename and
+                either the add_document result or the error
+        """
+        with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="upload") as pool:
+            futures = {pool.submit(self.add_document, *file): file[0] for file in files}
+            for future in as_completed(futures):
+                error = future.exception()
+                if on_result is not None:
+                    on_result(futures[future], None if error else future.result(), error)
+
+    def list_documents(self) -> List[Dict]:
+        response = self.http.get("/documents")
+        self._check(response)
+        return response.json()["documents"]
+
+    def delete_document(self, doc_id: str) -> bool:
+        response = self.http.delete(f"/delete_document/{doc_id}")
+        self._check(response)
+        return True
+
+    def delete_all(self) -> bool:
+        response = self.http.delete("/delete_all_documents")
+        self._check(response)
+        return True
+
+    def audio(self, text: str, language: str) -> Tuple[bytes, str]:
+        """Synthesized answer audio and its media type."""
+        response = self.http.get("/generate_audio", params={"answer": text, "language": language})
+        self._check(response)
+        return response.content, response.headers.get("content-type", "audio/mpeg")
+
+
+class LocalClient:
+    """
+    Same interface as RAGClient, running the pipeline in this process. Coroutines run on one
+    long-lived event loop in a background thread instead of a new loop per Streamlit rerun.
+    """
+
+    def __init__(self):
+        import services
+
+        self.services = services
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="ui-event-loop", daemon=True).start()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def query_events(self, query: str, language: str, k: int = 6) -> Iterator[Dict]:
+        events = self.services.query_chatbot_events(query, language, k)
+        try:
+            while True:
+                try:
+                    yield self._run(events.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(events.aclose())
+
+    def add_document(self, filename: str, content: Union[bytes, BinaryIO], content_type: str) -> Dict:
+        import io
+        import uuid
+
+        from uploads import UploadError, store_upload_file
+
+        doc_uuid = str(uuid.uuid4())
+        source = io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+        try:
+            upload = store_upload_file(source, filename, doc_uuid)
+        except UploadError as ue:
+            raise APIError(ue.status_code, ue.detail) from ue
+        chunks = self._run(self.services.add_document(upload.path, doc_uuid, upload=upload))
+        return {"status": "success", "chunks_added": chunks, "doc_uuid": doc_uuid}
+
+    def add_documents(self, files: List[UploadFile], on_result=None) -> None:
+        for file in files:
+            try:
+                result, error = self.add_document(*file), None
+            except Exception as e:
+                result, error = None, e
+            if on_result is not None:
+                on_result(file[0], result, error)
+
+    def list_documents(self) -> List[Dict]:
+        from routes.list_documents import list_documents_endpoint
+
+        return self._run(list_documents_endpoint())["documents"]
+
+    def delete_document(self, doc_id: str) -> bool:
+        return self._run(self.services.delete_doc_by_id(doc_id))
+
+    def delete_all(self) -> bool:
+        return self._run(self.services.delete_all_docs())
+
+    def audio(self, text: str, language: str) -> Tuple[bytes, str]:
+        from TTS.tts_engine import generate_audio_cached, get_backend
+
+        path = generate_audio_cached(text, language)
+        if path is None:
+            raise APIError(400, "Failed to generate audio")
+        with open(path, "rb") as f:
+            return f.read(), get_backend().media_type
+
+
+def make_client(mode: str = UI_MODE):
+    return LocalClient() if mode == "local" else RAGClient()
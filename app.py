@@ -1,17 +1,9 @@
 import streamlit as st
-import asyncio
-import uuid
-import os
-import shutil
-from utils import DATA_DIR
-from typing import AsyncGenerator
 import pandas as pd
 from datetime import datetime
-import glob
 
-# Import your RAG functions (assuming they're in the same directory or properly installed)
-from services import add_document, query_chatbot, delete_doc_by_id, delete_all_docs
-from TTS.tts_engine import generate_audio
+# The UI talks to the FastAPI service (UI_MODE=client, default) or runs the pipeline in-process (UI_MODE=local)
+from api_client import make_client, MAX_UPLOAD_BYTES
 
 # Configure page
 st.set_page_config(
@@ -35,48 +27,36 @@ page = st.sidebar.selectbox(
     ["💬 Query Chatbot", "📄 Document Ingestion", "🗑️ Document Management"]
 )
 
-# Helper function to run async functions
-def run_async(coro):
-    """Helper to run async functions in Streamlit"""
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    return loop.run_until_complete(coro)
+@st.cache_resource
+def get_client():
+    """One client (and HTTP connection pool) shared by all sessions and reruns"""
+    return make_client()
+
+client = get_client()
+
+@st.cache_data(ttl=10, show_spinner=False)
+def list_documents():
+    """Stored documents, refreshed at most every 10 seconds or after a change"""
+    documents = client.list_documents()
+    for document in documents:
+        document["size_kb"] = f"{document['size_bytes'] / 1024:.1f}"
+    return documents
 
 def get_files_from_data_dir():
-    """Get all image files from DATA_DIR with their metadata"""
-    if not os.path.exists(DATA_DIR):
+    """Get the stored documents with their metadata"""
+    try:
+        return list_documents()
+    except Exception as e:
+        st.sidebar.error(f"API unavailable: {e}")
         return []
-    
-    image_extensions = ['.png', '.jpg', '.jpeg', '.tiff', '.bmp']
-    files_data = []
-    
-    for file_path in glob.glob(os.path.join(DATA_DIR, "*")):
-        if os.path.isfile(file_path):
-            file_ext = os.path.splitext(file_path)[1].lower()
-            if file_ext in image_extensions:
-                file_stats = os.stat(file_path)
-                file_name = os.path.basename(file_path)
-                
-                # Extract UUID from filename (assuming format: uuid.extension)
-                doc_id = os.path.splitext(file_name)[0]
-                
-                files_data.append({
-                    "doc_id": doc_id,
-                    "filename": file_name,
-                    "file_path": file_path,
-                    "size_bytes": file_stats.st_size,
-                    "size_kb": f"{file_stats.st_size / 1024:.1f}",
-                    "created_time": datetime.fromtimestamp(file_stats.st_ctime).strftime("%Y-%m-%d %H:%M:%S"),
-                    "modified_time": datetime.fromtimestamp(file_stats.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-                })
-    
-    return files_data
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_answer_audio(text: str, language: str):
+    """Audio bytes and media type of an answer, kept across reruns"""
+    return client.audio(text, language)
 
 def sync_session_state_with_data_dir():
-    """Synchronize session state document history with actual files in DATA_DIR"""
+    """Synchronize session state document history with the documents stored by the backend"""
     actual_files = get_files_from_data_dir()
     actual_doc_ids = {file_data['doc_id'] for file_data in actual_files}
     
@@ -136,10 +116,10 @@ if page == "💬 Query Chatbot":
                 with col1:
                     if st.button(f"🔊 Play Audio", key=f"audio_btn_{i}"):
                         with st.spinner("Generating audio..."):
-                            audio_data = generate_audio(bot_msg, lang)
-                            if audio_data:
-                                st.audio(audio_data, format='audio/mp3')
-                            else:
+                            try:
+                                audio, media_type = get_answer_audio(bot_msg, lang)
+                                st.audio(audio, format=media_type)
+                            except Exception:
                                 st.error("Failed to generate audio")
     # Query input
     query = st.chat_input("Enter your question here...")
@@ -151,21 +131,38 @@ if page == "💬 Query Chatbot":
         
         # Generate response
         with st.chat_message("assistant"):
+            sources_placeholder = st.empty()
             response_placeholder = st.empty()
             # full_response = ""
             response_chunks = []
             
             try:
                 with st.spinner("Generating response..."):
-                    # Create async generator and collect response
-                    async def stream_response():
-                        async for chunk in query_chatbot(query, language, k_value):
-                            response_chunks.append(chunk)
+                    timings = {}
+
+                    # Render the event stream as it arrives
+                    for event in client.query_events(query, language, k_value):
+                        if event["event"] == "retrieval":
+                            # Show the sources before the first token arrives
+                            with sources_placeholder.expander(f"📚 Sources ({len(event['results'])})"):
+                                for result in event["results"]:
+                                    st.markdown(
+                                        f"**{result['doc_id']}** · chunk {result['chunk_idx']} · "
+                                        f"score {result['score']:.3f}"
+                                    )
+                                    st.caption(result["text"][:300])
+                        elif event["event"] == "token":
+                            response_chunks.append(event["text"])
                             response_placeholder.markdown("".join(response_chunks))
+                        elif event["event"] == "error":
+                            response_chunks.append(event["message"])
+                        elif event["event"] == "done":
+                            timings.update(event["timings"])
 
-                    run_async(stream_response())
                     response_placeholder.markdown("".join(response_chunks))
                     st.success("Response generated successfully!")
+                    if timings:
+                        st.caption(" · ".join(f"{name}: {value:.0f} ms" for name, value in timings.items()))
                 # Add to chat history
                 st.session_state.chat_history.append((query, "".join(response_chunks), language))
                 st.rerun()
@@ -213,41 +210,43 @@ elif page == "📄 Document Ingestion":
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                try:
-                    # Update progress
-                    progress = (i + 1) / len(uploaded_files)
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing {uploaded_file.name}...")
-                    
-                    # Generate unique document ID
-                    doc_uuid = str(uuid.uuid4())
-                    file_path = os.path.join(DATA_DIR, doc_uuid + os.path.splitext(uploaded_file.name)[-1])
-                    if os.path.exists(file_path):
-                        raise ValueError(f"File {uploaded_file.name} already exists in the system.")
-                    with open(file_path, "wb") as buffer:
-                        shutil.copyfileobj(uploaded_file, buffer)
+            # Oversized files would be refused by the API, skip them before uploading anything
+            accepted_files = []
+            for uploaded_file in uploaded_files:
+                if uploaded_file.size > MAX_UPLOAD_BYTES:
+                    st.error(f"❌ {uploaded_file.name} is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+                else:
+                    uploaded_file.seek(0)
+                    accepted_files.append(uploaded_file)
+            status_text.text(f"Uploading {len(accepted_files)} documents...")
+            sizes = {uploaded_file.name: uploaded_file.size for uploaded_file in accepted_files}
+            # The uploaded file objects are streamed as they are, without copying their bytes
+            files = [
+                (uploaded_file.name, uploaded_file, uploaded_file.type or "application/octet-stream")
+                for uploaded_file in accepted_files
+            ]
+            finished = []
 
-                    try:
-                        # Process the document
-                        chunk_count = run_async(add_document(file_path, doc_uuid))
+            def on_result(filename, result, error):
+                # Documents are processed in parallel, progress follows completion order
+                finished.append(filename)
+                progress_bar.progress(len(finished) / len(files))
+                status_text.text(f"Processed {len(finished)}/{len(files)}: {filename}")
+                if error is not None:
+                    st.error(f"❌ Error processing {filename}: {str(error)}")
+                    return
+                # Add to document history
+                st.session_state.document_history.append({
+                    "doc_id": result["doc_uuid"],
+                    "filename": filename,
+                    "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "size_kb": f"{sizes[filename] / 1024:.1f}"
+                })
+                st.success(f"✅ Successfully processed {filename} ({result['chunks_added']} chunks created)")
 
-                        # Add to document history
-                        st.session_state.document_history.append({
-                            "doc_id": doc_uuid,
-                            "filename": uploaded_file.name,
-                            "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "size_kb": f"{uploaded_file.size / 1024:.1f}"
-                        })
-                        
-                        st.success(f"✅ Successfully processed {uploaded_file.name} ({chunk_count} chunks created)")
-                        
-                    finally:
-                        # Clean up the uploaded file from memory
-                        uploaded_file.close()
-                        
-                except Exception as e:
-                    st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+            client.add_documents(files, on_result=on_result)
+            del files
+            list_documents.clear()
             
             progress_bar.progress(1.0)
             status_text.text("✅ All documents processed!")
@@ -307,7 +306,8 @@ elif page == "🗑️ Document Management":
                     doc_id = doc_options[selected_doc]
                     try:
                         with st.spinner("Deleting document..."):
-                            success = run_async(delete_doc_by_id(doc_id))
+                            success = client.delete_document(doc_id)
+                        list_documents.clear()
                             
                         if success:
                             # Remove from session state
@@ -335,7 +335,8 @@ elif page == "🗑️ Document Management":
             if st.button("🗑️ Delete All", type="secondary", disabled=not confirm_delete_all):
                 try:
                     with st.spinner("Deleting all documents..."):
-                        success = run_async(delete_all_docs())
+                        success = client.delete_all()
+                    list_documents.clear()
                     
                     if success:
                         st.session_state.document_history = []
@@ -0,0 +1,127 @@
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+import xxhash
+
+from utils import logger
+
+# === Durable per-document ingestion checkpoints ===
+#
+# Every ingestion stage (OCR, split, translate, index) stores its output under the document's id,
+# keyed by a hash of its input and of the version of the model or settings that produced it:
+#
+#     {ARTIFACT_DIR}/{doc_uuid}/document.json          source file and collection
+#     {ARTIFACT_DIR}/{doc_uuid}/{stage}.{key}.json     one stage output
+#
+# A stage whose key already has an artifact is skipped, so a failed ingestion resumes after the
+# last completed stage and a new model version only reruns the stages downstream of it.
+# Outputs of older versions are kept, switching back to a model does not recompute anything.
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+INFO_FILE = "document.json"
+
+
+def content_hash(data: Any) -> str:
+    """Stable hash of JSON-serializable data."""
+    return xxhash.xxh64_hexdigest(json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    digest = xxhash.xxh64()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(version: str, input_hash: str) -> str:
+    """Artifact key of a stage run by `version` on an input with hash `input_hash`."""
+    return xxhash.xxh64_hexdigest(f"{version}\x1f{input_hash}".encode("utf-8"))
+
+
+def _write_json(path: str, payload: Dict) -> None:
+    # Write then rename, a crash never leaves a truncated artifact behind
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class ArtifactStore:
+    """
+    Stage outputs of each document's ingestion, as JSON files under `root`.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR):
+        self.root = root
+
+    @staticmethod
+    def check_id(doc_uuid: str) -> None:
+        """Raise ValueError unless `doc_uuid` can name a document directory."""
+        if not doc_uuid or os.path.basename(doc_uuid) != doc_uuid or doc_uuid.startswith("."):
+            raise ValueError(f"Invalid document id {doc_uuid!r}")
+
+    def _doc_dir(self, doc_uuid: str) -> str:
+        self.check_id(doc_uuid)
+        return os.path.join(self.root, doc_uuid)
+
+    def load(self, doc_uuid: str, stage: str, key: str) -> Optional[Any]:
+        """Output of `stage` stored under `key`, None if it was never completed (or is unreadable)."""
+        path = os.path.join(self._doc_dir(doc_uuid), f"{stage}.{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["data"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable {stage} artifact of {doc_uuid}: {e}")
+            return None
+
+    def save(self, doc_uuid: str, stage: str, key: str, data: Any, version: str = "") -> None:
+        directory = self._doc_dir(doc_uuid)
+        os.makedirs(directory, exist_ok=True)
+        _write_json(os.path.join(directory, f"{stage}.{key}.json"), {
+            "stage": stage,
+            "key": key,
+            "version": version,
+            "created_at": time.time(),
+            "data": data,
+        })
+
+    def read_info(self, doc_uuid: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self._doc_dir(doc_uuid), INFO_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_info(self, doc_uuid: str, info: Dict) -> None:
+        directory = self._doc_dir(doc_uuid)
+        os.makedirs(directory, exist_ok=True)
+        _write_json(os.path.join(directory, INFO_FILE), info)
+
+    def stages(self, doc_uuid: str) -> List[Dict]:
+        """Stage, key, version and creation time of every artifact of a document, oldest first."""
+        directory = self._doc_dir(doc_uuid)
+        if not os.path.isdir(directory):
+            return []
+        records = []
+        for name in os.listdir(directory):
+            if name == INFO_FILE or not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            records.append({field: record.get(field) for field in ("stage", "key", "version", "created_at")})
+        return sorted(records, key=lambda record: record["created_at"] or 0)
+
+    def delete(self, doc_uuid: str) -> None:
+        shutil.rmtree(self._doc_dir(doc_uuid), ignore_errors=True)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,57 @@
+import random
+from typing import List
+
+# Gurmukhi letters and vowel signs used to build pseudo-words
+CONSONANTS = [chr(c) for c in range(0x0A15, 0x0A39) if c not in (0x0A29, 0x0A31, 0x0A34, 0x0A37)]
+VOWEL_SIGNS = ["", "ਾ", "ਿ", "ੀ", "ੁ", "ੂ", "ੇ", "ੈ", "ੋ", "ੌ"]
+MARKS = ["", "", "", "ਂ", "ੰ", "ੱ"]
+SENTENCE_ENDS = ["।", "।", "।", "॥", "?"]
+
+
+def make_vocabulary(size: int = 2000, seed: int = 0) -> List[str]:
+    """Deterministic list of Gurmukhi pseudo-words."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        syllables = rng.randint(1, 4)
+        word = "".join(
+            rng.choice(MARKS) + rng.choice(CONSONANTS) + rng.choice(VOWEL_SIGNS)
+            for _ in range(syllables)
+        )
+        words.add(word)
+    return sorted(words)
+
+
+def make_document(rng: random.Random, vocabulary: List[str], sentences: int) -> str:
+    """One OCR-like page: sentences of Zipf-ish distributed words, grouped into paragraphs."""
+    lines = []
+    for i in range(sentences):
+        length = rng.randint(6, 22)
+        words = [vocabulary[min(int(rng.paretovariate(1.2)) - 1, len(vocabulary) - 1)] if rng.random() < 0.5
+                 else rng.choice(vocabulary) for _ in range(length)]
+        lines.append(" ".join(words) + rng.choice(SENTENCE_ENDS))
+        if i % 5 == 4:
+            lines.append("\n\n")
+        else:
+            lines.append(" ")
+    return "".join(lines).strip()
+
+
+def make_corpus(documents: int, sentences_per_document: int = 40, seed: int = 0) -> List[str]:
+    """
+    Deterministic synthetic Gurmukhi corpus.
+
+    Args:
+        documents: Number of pages to generate
+        sentences_per_document: Average sentences per page
+        seed: Random seed, the same seed always gives the same corpus
+
+    Returns:
+        List of page texts
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(seed=seed)
+    return [
+        make_document(rng, vocabulary, max(1, int(rng.gauss(sentences_per_document, sentences_per_document / 4))))
+        for _ in range(documents)
+    ]
@@ -0,0 +1,86 @@
+"""
+Benchmark of the e5 embedding backends on this CPU.
+
+For each backend: load time, calibrated batch size, ingestion throughput (texts/sec),
+single-query latency and cosine parity with the fp32 torch vectors. Needs the real model
+(from the local Hugging Face cache or the network); the onnx backend also needs optimum[onnxruntime].
+
+Usage:
+    python -m benchmarks.embedder --backends torch,int8,onnx --output embedder.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.run import git_commit, summarize  # noqa: E402
+from RAG.embedding_backends import (calibrate_batch_size, cosine_parity, load_model,  # noqa: E402
+                                    measure_throughput, sample_texts)
+from RAG.embeddings import MODEL_NAME  # noqa: E402
+
+
+def bench_backend(backend: str, args, texts, reference) -> Dict:
+    start = time.perf_counter()
+    model = load_model(args.model, backend)
+    result = {"backend": backend, "load_s": round(time.perf_counter() - start, 3)}
+
+    calibration = calibrate_batch_size(model, texts)
+    batch_size = calibration["batch_size"]
+    result["calibration_texts_per_s"] = calibration["texts_per_s"]
+    result["batch_size"] = batch_size
+    result["texts_per_s"] = round(measure_throughput(model, texts, batch_size), 1)
+
+    latencies = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        model.encode([f"query: {texts[i % len(texts)][:80]}"], show_progress_bar=False)
+        latencies.append(time.perf_counter() - start)
+    result["query_latency"] = summarize(latencies)
+
+    passages = [f"passage: {text}" for text in texts[:args.parity_texts]]
+    vectors = model.encode(passages, batch_size=batch_size, show_progress_bar=False)
+    result["parity_vs_fp32"] = cosine_parity(reference, vectors) if reference is not None else None
+    return result, vectors
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backends", default="torch,int8,onnx", help="Comma separated backends, torch first for parity")
+    parser.add_argument("--texts", type=int, default=256, help="Chunk-sized texts for throughput")
+    parser.add_argument("--queries", type=int, default=100, help="Single-query encodes for latency")
+    parser.add_argument("--parity-texts", type=int, default=64)
+    parser.add_argument("--output", help="Write the JSON result here instead of stdout")
+    args = parser.parse_args(argv)
+
+    texts = sample_texts(args.texts)
+    backends = [backend for backend in args.backends.split(",") if backend]
+    results = {"meta": {"commit": git_commit(), "model": args.model, "cpu_count": os.cpu_count()}, "backends": []}
+    reference = None
+    for backend in backends:
+        try:
+            result, vectors = bench_backend(backend, args, texts, reference)
+        except Exception as e:
+            results["backends"].append({"backend": backend, "error": str(e)})
+            continue
+        if backend == "torch":
+            reference = vectors
+        results["backends"].append(result)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
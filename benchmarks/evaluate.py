@@ -0,0 +1,457 @@
+"""
+Offline quality evaluation, with throughput measured next to quality for every configuration.
+
+- Translation: BLEU and chrF (sacrebleu) of translate_punjabi_to_HindiEnglish against reference
+  English and Hindi translations.
+- Retrieval: recall@k and MRR on a QA set. The QA documents are split and indexed with the
+  configured splitter and embedder, and a question is a hit when a chunk of its document is
+  among the top k results.
+
+A configuration is a set of environment variables (EMBEDDING_BACKEND, CHUNK_SIZE, ...), applied in
+a fresh process so module-level settings take effect. Quality runs in parallel, one process per
+configuration; throughput is then timed one configuration at a time on a fixed sample, so the
+timings are not skewed by the other processes.
+
+Translations and embeddings are cached in a SQLite file, keyed by the text and by the models and
+code that produced them, so a rerun only computes what changed. Throughput is never cached.
+
+Input files:
+    translations (JSONL)  {"punjabi": ..., "english": ..., "hindi": ...} per line, either reference optional
+    QA set (JSON)         {"documents": [{"doc_id", "language", "text"}],
+                           "questions": [{"question", "language", "doc_id"}]}
+
+Usage:
+    python -m benchmarks.evaluate --translations translations.jsonl --qa qa.json \\
+        --config baseline --config int8:EMBEDDING_BACKEND=int8 --workers 2 --output eval.json
+    python -m benchmarks.evaluate --synthetic 20 --stub   # smoke run of the harness with the stand-ins
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import xxhash
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.corpus import make_corpus  # noqa: E402
+from benchmarks.run import git_commit, summarize  # noqa: E402
+
+CACHE_FILE = "eval_cache.sqlite"
+RECALL_AT = (1, 5, 10)
+TRANSLATION_BATCH = 16  # sentences per translate_punjabi_to_HindiEnglish call
+THROUGHPUT_SAMPLE = 32  # sentences / chunks / questions timed per configuration
+TARGETS = ("english", "hindi")
+
+
+# === Output cache ===
+
+def text_key(*parts: str) -> str:
+    return xxhash.xxh64_hexdigest("\x1f".join(parts).encode("utf-8"))
+
+
+def source_fingerprint(*names: str, extra: Iterable[str] = ()) -> str:
+    """Hash of the given repo source files and settings: cached outputs go stale when either changes."""
+    digest = xxhash.xxh64()
+    for name in names:
+        with open(os.path.join(REPO_ROOT, name), "rb") as f:
+            digest.update(f.read())
+    for value in extra:
+        digest.update(str(value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class OutputCache:
+    """
+    Model outputs by (namespace, key) in SQLite, shared safely by the evaluation processes.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS outputs (namespace TEXT, key TEXT, value BLOB, "
+                            "PRIMARY KEY (namespace, key))")
+            self.db.commit()
+
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, bytes]:
+        if self.db is None:
+            return {}
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT key, value FROM outputs WHERE namespace = ? AND key IN ({','.join('?' * len(batch))})",
+                [namespace, *batch],
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, namespace: str, items: Dict[str, bytes]) -> None:
+        if self.db is None or not items:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)",
+                                [(namespace, key, value) for key, value in items.items()])
+
+
+class CachedEmbedder:
+    """
+    Wraps the store's embedder so document and query vectors come from the cache when present.
+    """
+
+    def __init__(self, embedder, cache: OutputCache, fingerprint: str):
+        self.embedder = embedder
+        self.cache = cache
+        self.fingerprint = fingerprint
+        self.computed = 0
+
+    def _cached(self, kind: str, texts: List[str], compute) -> List[np.ndarray]:
+        namespace = f"{kind}:{self.fingerprint}"
+        keys = [text_key(text) for text in texts]
+        found = self.cache.get_many(namespace, keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            vectors = np.asarray(compute([texts[i] for i in missing]), dtype=np.float32)
+            fresh = {keys[i]: vector.tobytes() for i, vector in zip(missing, vectors)}
+            self.cache.put_many(namespace, fresh)
+            found.update(fresh)
+            self.computed += len(missing)
+        return [np.frombuffer(found[key], dtype=np.float32) for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[np.ndarray]:
+        return self._cached("passage", texts, self.embedder.embed_documents)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return np.stack(self._cached("query", queries, self.embedder.embed_queries))
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_queries([query])[0]
+
+
+# === Translation ===
+
+def _translate(sources: List[str], batch_size: int) -> Tuple[Dict[str, List[str]], float]:
+    """Translations of `sources` to every target language, and the seconds it took."""
+    from Translation.translate import translate_punjabi_to_HindiEnglish
+
+    outputs = {target: [] for target in TARGETS}
+    started = time.perf_counter()
+    for start in range(0, len(sources), batch_size):
+        batch = asyncio.run(translate_punjabi_to_HindiEnglish(sources[start:start + batch_size]))
+        for target in TARGETS:
+            outputs[target].extend(batch[target])
+    return outputs, time.perf_counter() - started
+
+
+def translation_fingerprint() -> str:
+    import Translation.translate as translate
+
+    return source_fingerprint(
+        "Translation/translate.py",
+        extra=(getattr(translate, "model_name_en", ""), getattr(translate, "model_name_hi", ""),
+               "stub" if getattr(translate, "__file__", None) is None else ""),
+    )
+
+
+def translation_quality(pairs: List[Dict], cache: OutputCache, batch_size: int) -> Dict:
+    """BLEU and chrF per target language, translating only sources missing from the cache."""
+    import sacrebleu
+
+    namespace = f"translation:{translation_fingerprint()}"
+    sources = [pair["punjabi"] for pair in pairs]
+    keys = [text_key(source) for source in sources]
+    found = cache.get_many(namespace, keys)
+    missing = list(dict.fromkeys(source for source, key in zip(sources, keys) if key not in found))
+    if missing:
+        outputs, _ = _translate(missing, batch_size)
+        fresh = {
+            text_key(source): json.dumps({target: outputs[target][i] for target in TARGETS}, ensure_ascii=False).encode()
+            for i, source in enumerate(missing)
+        }
+        cache.put_many(namespace, fresh)
+        found.update(fresh)
+
+    hypotheses = [json.loads(found[key]) for key in keys]
+    result = {"sentences": len(pairs), "uncached_translations": len(missing)}
+    for target in TARGETS:
+        scored = [(hypothesis[target], pair[target]) for hypothesis, pair in zip(hypotheses, pairs) if pair.get(target)]
+        if not scored:
+            continue
+        system, references = [h for h, _ in scored], [[r for _, r in scored]]
+        result[f"{target}_bleu"] = round(sacrebleu.corpus_bleu(system, references).score, 2)
+        result[f"{target}_chrf"] = round(sacrebleu.corpus_chrf(system, references).score, 2)
+    return result
+
+
+def translation_throughput(pairs: List[Dict], batch_size: int, sample: int) -> Dict:
+    sources = [pair["punjabi"] for pair in pairs[:sample]]
+    if not sources:
+        return {}
+    _translate(sources[:1], batch_size)  # load the models outside the timing
+    _, seconds = _translate(sources, batch_size)
+    return {"sentences_per_s": round(len(sources) / seconds, 3)}
+
+
+# === Retrieval ===
+
+def embedding_fingerprint(store) -> str:
+    from RAG.embeddings import EMBEDDING_BACKEND
+
+    return source_fingerprint("RAG/embeddings.py", "RAG/embedding_backends.py",
+                              extra=(store.model_name, EMBEDDING_BACKEND))
+
+
+def _chunks(documents: List[Dict]) -> Dict[str, List[Dict]]:
+    from RAG.TextSplitter import MultilingualTextSplitter
+
+    splitter = MultilingualTextSplitter()
+    chunked: Dict[str, List[Dict]] = {}
+    for document in documents:
+        chunked.setdefault(document["language"], []).extend(
+            splitter.split_documents(document["text"], document["doc_id"]))
+    return chunked
+
+
+def retrieval_quality(qa: Dict, cache: OutputCache, ks: Sequence[int]) -> Dict:
+    """recall@k and MRR of the questions, on an index built from the QA documents."""
+    from RAG.embeddings import FaissEmbeddingStore
+    from RAG.filters import normalize_doc_id
+
+    with tempfile.TemporaryDirectory(prefix="pdl-eval-") as workdir:
+        store = FaissEmbeddingStore(persist_dir=workdir)
+        embedder = CachedEmbedder(store.embedder, cache, embedding_fingerprint(store))
+        store.embedder = embedder
+        chunked = _chunks(qa["documents"])
+        store.add_documents(chunked)
+
+        questions = qa["questions"]
+        depth = max(ks)
+        ranks: List[Optional[int]] = [None] * len(questions)
+        query_vectors = embedder.embed_queries([q["question"] for q in questions]) if questions else None
+        by_language: Dict[str, List[int]] = {}
+        for i, question in enumerate(questions):
+            by_language.setdefault(question["language"], []).append(i)
+        for language, indexes in by_language.items():
+            hits = store.search_by_vectors(query_vectors[indexes], language, depth)
+            for i, query_hits in zip(indexes, hits):
+                expected = normalize_doc_id(questions[i]["doc_id"])
+                doc_ids = [doc.metadata.get("doc_id") for doc, _ in query_hits]
+                ranks[i] = doc_ids.index(expected) + 1 if expected in doc_ids else None
+
+    total = max(len(questions), 1)
+    result = {
+        "questions": len(questions),
+        "chunks": sum(len(chunks) for chunks in chunked.values()),
+        "uncached_embeddings": embedder.computed,
+    }
+    for k in ks:
+        result[f"recall@{k}"] = round(sum(1 for rank in ranks if rank is not None and rank <= k) / total, 4)
+    result["mrr"] = round(sum(1 / rank for rank in ranks if rank is not None) / total, 4)
+    return result
+
+
+def retrieval_throughput(qa: Dict, ks: Sequence[int], sample: int) -> Dict:
+    """Chunk embedding rate, and query latency (embed + search) on the full QA index."""
+    from RAG.embeddings import FaissEmbeddingStore
+
+    with tempfile.TemporaryDirectory(prefix="pdl-eval-") as workdir:
+        store = FaissEmbeddingStore(persist_dir=workdir)
+        chunked = _chunks(qa["documents"])
+        texts = [chunk["text"] for chunks in chunked.values() for chunk in chunks][:sample]
+        questions = qa["questions"][:sample]
+        if not texts or not questions:
+            return {}
+        store.embedder.embed_documents(texts[:1])  # load the model outside the timing
+        started = time.perf_counter()
+        store.embedder.embed_documents(texts)
+        chunks_per_s = len(texts) / (time.perf_counter() - started)
+
+        store.add_documents(chunked)
+        latencies = []
+        for question in questions:
+            started = time.perf_counter()
+            vector = store.embedder.embed_query(question["question"])
+            store.search_by_vectors(vector[None, :], question["language"], max(ks))
+            latencies.append(time.perf_counter() - started)
+    return {"chunks_per_s": round(chunks_per_s, 3), "query_latency": summarize(latencies)}
+
+
+# === Configurations ===
+
+def parse_config(spec: str) -> Dict:
+    """"name" or "name:VAR=value,VAR=value" -> {"name", "env"}."""
+    name, _, assignments = spec.partition(":")
+    env = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, separator, value = assignment.partition("=")
+        if not separator:
+            raise argparse.ArgumentTypeError(f"Expected VAR=value in {spec!r}")
+        env[key.strip()] = value.strip()
+    return {"name": name, "env": env}
+
+
+def evaluate_config(config: Dict, data: Dict, options: Dict, parts: Sequence[str]) -> Dict:
+    """Run in a fresh process: apply the configuration, then measure the requested parts."""
+    os.environ.update(config["env"])
+    if options["stub"]:
+        os.environ.setdefault("EMBEDDING_BATCH_SIZE", "32")
+        from benchmarks import stubs
+
+        stubs.install()
+    from utils import logger
+
+    logger.setLevel("WARNING")  # add_documents logs every chunk
+
+    cache = OutputCache(options["cache"])
+    result: Dict[str, Dict] = {"translation": {}, "retrieval": {}}
+    if data["translations"]:
+        if "quality" in parts:
+            result["translation"].update(translation_quality(data["translations"], cache, options["batch_size"]))
+        if "throughput" in parts:
+            result["translation"].update(
+                translation_throughput(data["translations"], options["batch_size"], options["sample"]))
+    if data["qa"]:
+        if "quality" in parts:
+            result["retrieval"].update(retrieval_quality(data["qa"], cache, options["ks"]))
+        if "throughput" in parts:
+            result["retrieval"].update(retrieval_throughput(data["qa"], options["ks"], options["sample"]))
+    return result
+
+
+def run_isolated(config: Dict, data: Dict, options: Dict, parts: Sequence[str]) -> Dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(evaluate_config, config, data, options, parts).result()
+
+
+def deltas(baseline: Dict, result: Dict) -> Dict:
+    """Differences of the numeric metrics of `result` from `baseline`, per section."""
+    changes = {}
+    for section, metrics in result.items():
+        base = baseline.get(section, {})
+        changes[section] = {
+            name: round(value - base[name], 4)
+            for name, value in metrics.items()
+            if isinstance(value, (int, float)) and isinstance(base.get(name), (int, float))
+        }
+    return changes
+
+
+# === Data ===
+
+def load_translations(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_qa(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        qa = json.load(f)
+    if not {"documents", "questions"} <= qa.keys():
+        raise ValueError(f"{path}: expected 'documents' and 'questions'")
+    return qa
+
+
+def synthetic_data(documents: int, seed: int = 0) -> Dict:
+    """
+    Synthetic Gurmukhi pages, with references from the translation stand-ins and one question
+    per page taken from its own text. Only meaningful with --stub, to check the harness end to end.
+    """
+    from benchmarks.stubs import gurmukhi_to_devanagari, pseudo_english
+    from RAG.TextSplitter import SENTENCE_BOUNDARY
+
+    rng = random.Random(seed)
+    pages = make_corpus(documents, sentences_per_document=20, seed=seed)
+    translations, docs, questions = [], [], []
+    for i, page in enumerate(pages):
+        sentences = [s for s in SENTENCE_BOUNDARY.split(page) if s.strip()]
+        for sentence in sentences[:3]:
+            translations.append({"punjabi": sentence, "english": pseudo_english(sentence),
+                                 "hindi": gurmukhi_to_devanagari(sentence)})
+        docs.append({"doc_id": f"synthetic-{i}", "language": "punjabi", "text": page})
+        questions.append({"question": rng.choice(sentences), "language": "punjabi", "doc_id": f"synthetic-{i}"})
+    return {"translations": translations, "qa": {"documents": docs, "questions": questions}}
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Translation and retrieval quality evaluation")
+    parser.add_argument("--translations", help="JSONL of Punjabi sentences with reference translations")
+    parser.add_argument("--qa", help="JSON QA set: documents and questions with their doc_id")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate a synthetic set of this many pages instead")
+    parser.add_argument("--config", action="append", type=parse_config, default=[],
+                        help='"name" or "name:VAR=value,..." (repeatable); the first one is the baseline')
+    parser.add_argument("--workers", type=int, default=1, help="Configurations evaluated in parallel")
+    parser.add_argument("--k", default=",".join(map(str, RECALL_AT)), help="Comma-separated recall cut-offs")
+    parser.add_argument("--batch-size", type=int, default=TRANSLATION_BATCH, help="Sentences per translation call")
+    parser.add_argument("--sample", type=int, default=THROUGHPUT_SAMPLE, help="Items timed per throughput measurement")
+    parser.add_argument("--cache", default=CACHE_FILE, help="Model output cache (SQLite)")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every model output")
+    parser.add_argument("--stub", action="store_true", help="Use the benchmark stand-ins instead of the real models")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON result here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        data = synthetic_data(args.synthetic, args.seed)
+    else:
+        if not args.translations and not args.qa:
+            parser.error("give --translations and/or --qa, or --synthetic")
+        data = {
+            "translations": load_translations(args.translations) if args.translations else [],
+            "qa": load_qa(args.qa) if args.qa else None,
+        }
+    configs = args.config or [parse_config("baseline")]
+    options = {
+        "stub": args.stub,
+        "cache": None if args.no_cache else os.path.abspath(args.cache),
+        "ks": sorted({int(k) for k in args.k.split(",")}),
+        "batch_size": args.batch_size,
+        "sample": args.sample,
+    }
+
+    started = time.perf_counter()
+    if args.workers <= 1:
+        results = [run_isolated(config, data, options, ("quality", "throughput")) for config in configs]
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(lambda config: run_isolated(config, data, options, ("quality",)), configs))
+        # Timed one at a time, so the configurations do not compete for the CPU
+        for result, config in zip(results, configs):
+            for section, metrics in run_isolated(config, data, options, ("throughput",)).items():
+                result[section].update(metrics)
+
+    report = {
+        "meta": {"commit": git_commit(), "seconds": round(time.perf_counter() - started, 2),
+                 "args": {key: value for key, value in vars(args).items() if key != "config"}},
+        "configs": [],
+    }
+    for config, result in zip(configs, results):
+        entry = {"name": config["name"], "env": config["env"], **result}
+        if config is not configs[0]:
+            entry[f"delta_vs_{configs[0]['name']}"] = deltas(results[0], result)
+        report["configs"].append(entry)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
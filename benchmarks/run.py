@@ -0,0 +1,284 @@
+"""
+Offline benchmark for ingestion, retrieval and generation.
+
+Runs the real pipeline (splitting, FAISS, context building, streaming) with deterministic
+stand-ins for Tesseract, IndicTrans2, the e5 embedder and the Ollama server, so it works
+on a plain CPU box without network access. Results are printed (or written) as JSON.
+
+Usage:
+    python -m benchmarks.run --docs 50 --sizes 10000,100000,1000000 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import stubs  # noqa: E402
+from benchmarks.corpus import make_corpus  # noqa: E402
+
+CHUNKS_PER_SYNTHETIC_DOC = 20
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    if not samples:
+        return {}
+    values = np.array(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def write_page(path: str, text: str) -> None:
+    """A tiny PNG carrying its OCR text in an iTXt chunk, read back by the pytesseract stand-in."""
+    from PIL import Image, PngImagePlugin
+
+    info = PngImagePlugin.PngInfo()
+    info.add_itxt(stubs.OCR_TEXT_KEY, text)
+    Image.new("L", (64, 64), color=255).save(path, pnginfo=info)
+
+
+class MatrixEmbedder(Embeddings):
+    """Embedder over a precomputed matrix: the text "synthetic chunk <i>" maps to row i."""
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def embed_documents(self, texts):
+        return self.matrix[[int(text.rsplit(" ", 1)[-1]) for text in texts]]
+
+    def embed_query(self, text):
+        return self.matrix[int(text.rsplit(" ", 1)[-1])]
+
+
+def random_unit_vectors(count: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def bench_startup() -> Dict:
+    start = time.perf_counter()
+    import services  # noqa: F401
+    return {"import_services_s": round(time.perf_counter() - start, 3), "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def bench_ingestion(args, workdir: str) -> Dict:
+    import services
+
+    pages = make_corpus(args.docs, sentences_per_document=args.sentences, seed=args.seed)
+    paths = []
+    for text in pages:
+        doc_uuid = str(uuid.uuid4())
+        path = os.path.join(workdir, "data", f"{doc_uuid}.png")
+        write_page(path, text)
+        paths.append((path, doc_uuid))
+
+    async def ingest_all():
+        durations, chunks = [], 0
+        for path, doc_uuid in paths:
+            start = time.perf_counter()
+            chunks += await services.add_document(path, doc_uuid)
+            durations.append(time.perf_counter() - start)
+        return durations, chunks
+
+    start = time.perf_counter()
+    durations, chunks = asyncio.run(ingest_all())
+    total = time.perf_counter() - start
+    return {
+        "documents": len(paths),
+        "chunks": chunks,
+        "characters": sum(len(page) for page in pages),
+        "total_s": round(total, 3),
+        "docs_per_s": round(len(paths) / total, 3),
+        "chunks_per_s": round(chunks / total, 3),
+        "per_document": summarize(durations),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def bench_generation(args) -> Dict:
+    import services
+    from RAG.generation import OllamaAnswerGenerator
+
+    pages = make_corpus(args.queries_llm, sentences_per_document=2, seed=args.seed + 1)
+    with stubs.FakeOllamaServer(tokens=args.llm_tokens, token_ms=args.llm_token_ms) as server:
+        services.answer_generator = OllamaAnswerGenerator(
+            model_name=services.llm_model_name, ollama_base_url=server.base_url
+        )
+
+        async def ask_all():
+            results = []
+            for question in pages:
+                async for event in services.query_chatbot_events(question[:120], "punjabi", args.k):
+                    if event["event"] == "done":
+                        results.append(event)
+            return results
+
+        events = asyncio.run(ask_all())
+
+    timings = {name: [e["timings"][name] / 1000 for e in events if name in e["timings"]]
+               for name in ("embed_ms", "search_ms", "ttft_ms", "total_ms")}
+    saved = [e["context"].get("tokens_saved", 0) for e in events]
+    return {
+        "queries": len(events),
+        **{name.replace("_ms", ""): summarize(values) for name, values in timings.items()},
+        "context_tokens_saved_mean": round(float(np.mean(saved)), 1) if saved else 0,
+        "prompt_chars_mean": round(float(np.mean(server.prompt_chars)), 1) if server.prompt_chars else 0,
+    }
+
+
+def bench_search_scale(size: int, args, workdir: str) -> Dict:
+    from RAG.embeddings import FaissEmbeddingStore
+
+    dim = stubs.EMBEDDING_DIM
+    vectors = random_unit_vectors(size + args.queries, dim, args.seed)
+    persist_dir = os.path.join(workdir, f"scale_{size}")
+    store = FaissEmbeddingStore(persist_dir=persist_dir, num_shards=args.shards)
+    store.embedder = MatrixEmbedder(vectors)
+
+    chunks = [
+        {
+            "doc_id": f"doc_{i // CHUNKS_PER_SYNTHETIC_DOC}",
+            "chunk_id": f"doc_{i // CHUNKS_PER_SYNTHETIC_DOC}_{i % CHUNKS_PER_SYNTHETIC_DOC}",
+            "chunk_idx": i % CHUNKS_PER_SYNTHETIC_DOC,
+            "text": f"synthetic chunk {i}",
+        }
+        for i in range(size)
+    ]
+    start = time.perf_counter()
+    store.add_documents({"punjabi": chunks})
+    build_s = time.perf_counter() - start
+    del chunks
+
+    queries = vectors[size:]
+    by_vector, by_text = [], []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        store.search_by_vector(query, "punjabi", args.k)
+        by_vector.append(time.perf_counter() - start)
+        if i < args.queries // 4:
+            start = time.perf_counter()
+            store.search(f"synthetic chunk {size + i}", "punjabi", args.k)
+            by_text.append(time.perf_counter() - start)
+
+    result = {
+        "vectors": size,
+        "shards": args.shards,
+        "build_and_persist_s": round(build_s, 3),
+        "search_by_vector": summarize(by_vector),
+        "search": summarize(by_text),
+    }
+
+    if size <= args.max_delete_size:
+        start = time.perf_counter()
+        store.delete_document_by_id("1")  # doc_1, deleted from the middle of the index
+        result["delete_document_s"] = round(time.perf_counter() - start, 3)
+
+    del store
+    start = time.perf_counter()
+    reloaded = FaissEmbeddingStore(persist_dir=persist_dir)
+    result["load_s"] = round(time.perf_counter() - start, 3)
+    del reloaded
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return ""
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Offline ingestion/retrieval/generation benchmark")
+    parser.add_argument("--docs", type=int, default=20, help="Synthetic pages to ingest")
+    parser.add_argument("--sentences", type=int, default=40, help="Average sentences per page")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma separated index sizes for the search benchmark")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per index size")
+    parser.add_argument("--queries-llm", type=int, default=20, help="End-to-end queries against the fake Ollama server")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--shards", type=int, default=1, help="Index shards per language for the search benchmark")
+    parser.add_argument("--max-delete-size", type=int, default=100000, help="Largest index size to measure delete on")
+    parser.add_argument("--ocr-ms", type=float, default=0.0, help="Simulated Tesseract time per page")
+    parser.add_argument("--translate-ms", type=float, default=0.0, help="Simulated translation time per chunk")
+    parser.add_argument("--llm-tokens", type=int, default=64)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--real-embedder", action="store_true", help="Use the real e5 model from the local cache")
+    parser.add_argument("--skip", default="", help="Comma separated phases to skip: ingestion,generation,search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON result here instead of stdout")
+    args = parser.parse_args(argv)
+    skip = {phase for phase in args.skip.split(",") if phase}
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    # Batch size calibration would measure the stand-in embedder, use the library default instead
+    os.environ.setdefault("EMBEDDING_BATCH_SIZE", "32")
+    stubs.install(ocr_ms=args.ocr_ms, translate_ms_per_chunk=args.translate_ms, real_embedder=args.real_embedder)
+
+    # Everything the pipeline writes (indexes, data, logs, caches) goes to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="pdl-bench-")
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    os.chdir(workdir)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "startup": bench_startup(),
+    }
+    if "ingestion" not in skip:
+        results["ingestion"] = bench_ingestion(args, workdir)
+    if "generation" not in skip:
+        results["generation"] = bench_generation(args)
+    if "search" not in skip:
+        results["search"] = [
+            bench_search_scale(int(size), args, workdir) for size in args.sizes.split(",") if size
+        ]
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark of the token-budget splitter against the previous character splitter.
+
+Splits large synthetic OCR pages with both and reports split time, chunk counts, the token
+length distribution of the chunks (under the splitter's tokenizer, or a character estimate if it
+is not available), how many chunks exceed the translation model's input limit, and chunk id
+hashing cost (md5 vs xxhash).
+
+Usage:
+    python -m benchmarks.splitter --docs 20 --sentences 400 --output splitter.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import xxhash
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.corpus import make_corpus  # noqa: E402
+from benchmarks.run import git_commit  # noqa: E402
+from RAG.TextSplitter import MultilingualTextSplitter  # noqa: E402
+
+TRANSLATION_MAX_TOKENS = 256  # IndicTrans2 source length limit, longer inputs are truncated
+
+
+def bench_splitter(name: str, split: Callable[[str], List[str]], pages: List[str],
+                   splitter: MultilingualTextSplitter, budget: int) -> Dict:
+    start = time.perf_counter()
+    chunks = [chunk for page in pages for chunk in split(page)]
+    seconds = time.perf_counter() - start
+    tokens = np.array(splitter.count_tokens(chunks))
+    megabytes = sum(len(page.encode("utf-8")) for page in pages) / 1e6
+    return {
+        "splitter": name,
+        "split_s": round(seconds, 3),
+        "mb_per_s": round(megabytes / seconds, 2),
+        "chunks": len(chunks),
+        "tokens_p50": int(np.percentile(tokens, 50)),
+        "tokens_p99": int(np.percentile(tokens, 99)),
+        "tokens_max": int(tokens.max()),
+        "over_translation_limit": int((tokens > TRANSLATION_MAX_TOKENS).sum()),
+        "under_quarter_budget": int((tokens < budget / 4).sum()),
+    }
+
+
+def bench_hashing(chunks: List[str], rounds: int = 20) -> Dict:
+    encoded = [chunk.encode() for chunk in chunks]
+    results = {}
+    for name, digest in (("md5", lambda data: hashlib.md5(data).hexdigest()),
+                         ("xxh64", xxhash.xxh64_hexdigest)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for data in encoded:
+                digest(data)
+        results[f"{name}_us_per_chunk"] = round((time.perf_counter() - start) / (rounds * len(encoded)) * 1e6, 3)
+    return results
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Text splitter benchmark")
+    parser.add_argument("--docs", type=int, default=20, help="Synthetic OCR pages")
+    parser.add_argument("--sentences", type=int, default=400, help="Average sentences per page")
+    parser.add_argument("--chunk-size", type=int, default=400, help="Characters per chunk for the character splitter")
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON result here instead of stdout")
+    args = parser.parse_args(argv)
+
+    pages = make_corpus(args.docs, sentences_per_document=args.sentences, seed=args.seed)
+    splitter = MultilingualTextSplitter()
+    splitter.count_tokens(["warm up"])  # load the tokenizer outside the timings
+    character_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        separators=["\n\n", "\n", "।", ".", "!", "?"],
+    )
+
+    results = {
+        "meta": {"commit": git_commit(), "tokenizer": splitter.tokenizer_name, "args": vars(args)},
+        "splitters": [
+            bench_splitter("character", character_splitter.split_text, pages, splitter, splitter.chunk_size),
+            bench_splitter("token", splitter.split_text, pages, splitter, splitter.chunk_size),
+        ],
+        "hashing": bench_hashing(splitter.split_text(pages[0])),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Deterministic stand-ins for the heavy or networked parts of the pipeline.
+
+install() must run before `services` (or anything under RAG/, OCR/, Translation/) is imported.
+The stand-ins keep the interfaces the pipeline uses, so everything in between (splitting,
+FAISS, context building, streaming) runs for real.
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+import types
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+
+EMBEDDING_DIM = 384
+OCR_TEXT_KEY = "ocr_text"
+
+
+# === Tesseract ===
+
+def _image_to_string(image, lang=None, **kwargs) -> str:
+    """Synthetic pages carry their "OCR" text in a PNG text chunk."""
+    return image.info.get(OCR_TEXT_KEY, "")
+
+
+def make_pytesseract(ocr_ms: float = 0.0) -> types.ModuleType:
+    module = types.ModuleType("pytesseract")
+
+    def image_to_string(image, lang=None, **kwargs):
+        if ocr_ms:
+            time.sleep(ocr_ms / 1000)
+        return _image_to_string(image, lang, **kwargs)
+
+    module.image_to_string = image_to_string
+    return module
+
+
+# === IndicTrans2 ===
+
+def gurmukhi_to_devanagari(text: str) -> str:
+    """The Gurmukhi and Devanagari Unicode blocks are aligned, which makes a cheap stand-in for Hindi output."""
+    return "".join(chr(ord(ch) - 0x100) if 0x0A00 <= ord(ch) <= 0x0A7F else ch for ch in text)
+
+
+def pseudo_english(text: str) -> str:
+    """Deterministic Latin pseudo-translation: one token per source word."""
+    words = []
+    for word in text.split():
+        digest = zlib.crc32(word.encode("utf-8"))
+        words.append("w" + format(digest % 50000, "x"))
+    return " ".join(words)
+
+
+def make_translate_module(translate_ms_per_chunk: float = 0.0) -> types.ModuleType:
+    module = types.ModuleType("Translation.translate")
+    module.src_lang = "pan_Guru"
+    module.model_name_en = "stub/indictrans2-indic-en"
+    module.model_name_hi = "stub/indictrans2-indic-indic"
+
+    def translate(sentences: List[str], tgt: str) -> List[str]:
+        if translate_ms_per_chunk:
+            time.sleep(translate_ms_per_chunk * len(sentences) / 1000)
+        if tgt == "hin_Deva":
+            return [gurmukhi_to_devanagari(s) for s in sentences]
+        return [pseudo_english(s) for s in sentences]
+
+    async def translate_punjabi_to_HindiEnglish(input_sentences, **kwargs):
+        return {
+            "punjabi": list(input_sentences),
+            "english": translate(input_sentences, "eng_Latn"),
+            "hindi": translate(input_sentences, "hin_Deva"),
+        }
+
+    module.translate = translate
+    module.translate_punjabi_to_HindiEnglish = translate_punjabi_to_HindiEnglish
+    return module
+
+
+# === e5 embedder ===
+
+class HashingSentenceTransformer:
+    """
+    Stand-in for SentenceTransformer: hashed character trigrams, L2-normalized.
+    Similar texts get similar vectors, so retrieval results stay meaningful.
+    """
+
+    def __init__(self, model_name_or_path: str = "stub", *args, **kwargs):
+        self.model_name = model_name_or_path
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return EMBEDDING_DIM
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for i in range(max(len(text) - 2, 1)):
+            digest = zlib.crc32(text[i:i + 3].encode("utf-8"))
+            vector[digest % EMBEDDING_DIM] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.stack([self._embed(text) for text in texts]) if texts else np.zeros((0, EMBEDDING_DIM), np.float32)
+        return vectors[0] if single else vectors
+
+
+def make_sentence_transformers() -> types.ModuleType:
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = HashingSentenceTransformer
+    return module
+
+
+# === Ollama server ===
+
+class FakeOllamaServer:
+    """
+    Minimal Ollama HTTP API (/api/tags, /api/generate, /api/chat) streaming a canned answer
+    at a fixed token rate, with a fixed prompt evaluation delay per 1000 prompt characters.
+    """
+
+    def __init__(self, tokens: int = 64, token_ms: float = 5.0, prompt_ms_per_kchar: float = 20.0):
+        self.tokens = tokens
+        self.token_ms = token_ms
+        self.prompt_ms_per_kchar = prompt_ms_per_kchar
+        self.prompt_chars: List[int] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/api/tags"):
+                    self._send_json({"models": [{"name": "pdlRAG:latest", "model": "pdlRAG:latest"}]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                prompt = request.get("prompt") or "".join(m.get("content", "") for m in request.get("messages", []))
+                server.prompt_chars.append(len(prompt))
+                time.sleep(len(prompt) / 1000 * server.prompt_ms_per_kchar / 1000)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                seed = hashlib.md5(prompt.encode("utf-8")).hexdigest()
+                for i in range(server.tokens):
+                    time.sleep(server.token_ms / 1000)
+                    piece = f"{seed[i % len(seed)]}{i} "
+                    if self.path.startswith("/api/chat"):
+                        payload = {"model": request.get("model"), "message": {"role": "assistant", "content": piece}, "done": False}
+                    else:
+                        payload = {"model": request.get("model"), "response": piece, "done": False}
+                    self._write_chunk(json.dumps(payload) + "\n")
+                final = {"model": request.get("model"), "done": True, "done_reason": "stop"}
+                if self.path.startswith("/api/chat"):
+                    final["message"] = {"role": "assistant", "content": ""}
+                else:
+                    final["response"] = ""
+                self._write_chunk(json.dumps(final) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text: str):
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeOllamaServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def install(ocr_ms: float = 0.0, translate_ms_per_chunk: float = 0.0, real_embedder: bool = False) -> None:
+    """
+    Register the stand-ins in sys.modules.
+
+    Args:
+        ocr_ms: Simulated Tesseract time per page
+        translate_ms_per_chunk: Simulated IndicTrans2 time per chunk and target language
+        real_embedder: Keep the real sentence_transformers (needs the e5 model in the local cache)
+    """
+    sys.modules["pytesseract"] = make_pytesseract(ocr_ms)
+    sys.modules["Translation.translate"] = make_translate_module(translate_ms_per_chunk)
+    if not real_embedder:
+        sys.modules["sentence_transformers"] = make_sentence_transformers()
+
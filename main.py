@@ -6,17 +6,40 @@ from routes.query_chatbot import query_chatbot_router
 from routes.generate_audio import generate_audio_router
 from routes.delete_doc_by_id import delete_document_router
 from routes.delete_all_docs import delete_all_docs_router
+from routes.list_documents import list_documents_router
+from routes.metrics import metrics_router
+from routes.profiles import profiles_router
+from routes.snapshot import snapshot_router
+from routes.reembed import reembed_router
+from tracing import TracingMiddleware
+from TTS.tts_engine import load_backend
+from uploads import UploadLimitMiddleware
 
 app = FastAPI()
+
+
+@app.on_event("startup")
+async def load_tts_backend():
+    # Load the TTS engine (a local model for Parler-TTS) before serving, not on the first audio request
+    await load_backend()
+
+app.add_middleware(TracingMiddleware)
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["Server-Timing", "X-Trace-Id", "X-Profile-Id"],
 )
 app.include_router(add_document_router)
 app.include_router(query_chatbot_router)
 app.include_router(generate_audio_router)
 app.include_router(delete_document_router)
-app.include_router(delete_all_docs_router)
\ No newline at end of file
+app.include_router(delete_all_docs_router)
+app.include_router(list_documents_router)
+app.include_router(metrics_router)
+app.include_router(profiles_router)
+app.include_router(snapshot_router)
+app.include_router(reembed_router)
\ No newline at end of file
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from metrics import ingestion_deferred_seconds
+from utils import logger, log_event
+
+# === CPU allocation per engine ===
+#
+# Torch (the two IndicTrans2 models and the embedder), Tesseract and Ollama each default to one
+# thread per core, so on a shared CPU box they oversubscribe it. Every engine gets a thread count
+# and, when there are enough cores, a disjoint set of cores:
+#
+#     llm             Ollama (num_thread, and its cores via `taskset` in start.sh)
+#     translation_en  IndicTrans2 indic-en, torch threads of its worker thread
+#     translation_hi  IndicTrans2 indic-indic, same
+#     embedding       SentenceTransformer encodes, pinned around every call
+#     ocr             Tesseract processes, pool size = threads, each inheriting the pool's cores
+#                     and single-threaded (OMP_THREAD_LIMIT=1)
+#
+# Defaults split the cores by ENGINE_WEIGHTS; CPU_THREADS_<ENGINE> fixes an engine's thread count
+# and CPU_AFFINITY_<ENGINE> (e.g. "0-3,8") its cores. Ingestion stages also wait while
+# interactive queries are embedding or searching, so they do not take CPU from them (see ResourceGovernor).
+
+ENGINES = ("llm", "translation_en", "translation_hi", "embedding", "ocr")
+ENGINE_WEIGHTS = {"llm": 6, "translation_en": 3, "translation_hi": 3, "embedding": 2, "ocr": 2}
+TORCH_ENGINES = ("translation_en", "translation_hi", "embedding")
+INTEROP_THREADS = int(os.getenv("CPU_INTEROP_THREADS", "1"))  # torch inter-op pool, process-wide
+# Ingestion waits before each stage while this many interactive queries are embedding or searching
+# (0: never). Queries waiting for or running LLM generation do not count.
+INGEST_PAUSE_QUERIES = int(os.getenv("INGEST_PAUSE_QUERIES", "2"))
+INGEST_MAX_DEFER_SECONDS = float(os.getenv("INGEST_MAX_DEFER_SECONDS", "30"))  # then it runs anyway
+INGEST_POLL_SECONDS = 0.05
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """Cores of a Linux CPU list such as "0-3,8,10-11"."""
+    cores = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cores.update(range(int(first), int(last) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def format_cpu_list(cores: Sequence[int]) -> str:
+    """Inverse of parse_cpu_list, with runs of cores collapsed to ranges."""
+    parts = []
+    cores = sorted(cores)
+    start = 0
+    for i in range(1, len(cores) + 1):
+        if i == len(cores) or cores[i] != cores[i - 1] + 1:
+            run = cores[start:i]
+            parts.append(str(run[0]) if len(run) == 1 else f"{run[0]}-{run[-1]}")
+            start = i
+    return ",".join(parts)
+
+
+def available_cores() -> List[int]:
+    """Cores this process may run on (its affinity mask, or all of them where that is unknown)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _split_threads(total: int, weights: Dict[str, int]) -> Dict[str, int]:
+    # Shares of `total` by weight, at least one each, rounded by largest remainder
+    weight_sum = sum(weights.values())
+    shares = {engine: total * weight / weight_sum for engine, weight in weights.items()}
+    counts = {engine: max(1, int(share)) for engine, share in shares.items()}
+    remaining = total - sum(counts.values())
+    for engine in sorted(shares, key=lambda engine: int(shares[engine]) - shares[engine]):
+        if remaining <= 0:
+            break
+        counts[engine] += 1
+        remaining -= 1
+    return counts
+
+
+class EngineAllocation:
+    """Threads and cores assigned to one engine; `pinned` is False when it shares all cores."""
+
+    def __init__(self, engine: str, threads: int, cores: List[int], pinned: bool, source: str):
+        self.engine = engine
+        self.threads = threads
+        self.cores = cores
+        self.pinned = pinned
+        self.source = source  # "env" when set by CPU_THREADS_/CPU_AFFINITY_, else "default"
+
+    def to_dict(self) -> Dict:
+        return {
+            "engine": self.engine,
+            "threads": self.threads,
+            "cores": format_cpu_list(self.cores),
+            "pinned": self.pinned,
+            "source": self.source,
+        }
+
+
+def allocate(cores: Sequence[int], env=os.environ) -> Dict[str, EngineAllocation]:
+    """
+    Thread counts and cores of every engine on `cores`.
+
+    Engines without overrides share the cores left by the overridden ones, by ENGINE_WEIGHTS.
+    Cores are handed out as consecutive disjoint slices; if there are fewer cores than
+    engines, the engines without an explicit affinity share the remaining cores instead.
+    """
+    cores = sorted(cores)
+    fixed_threads: Dict[str, int] = {}
+    fixed_cores: Dict[str, List[int]] = {}
+    for engine in ENGINES:
+        affinity = env.get(f"CPU_AFFINITY_{engine.upper()}")
+        if affinity:
+            fixed_cores[engine] = [core for core in parse_cpu_list(affinity) if core in cores] or cores
+        threads = env.get(f"CPU_THREADS_{engine.upper()}")
+        if threads:
+            fixed_threads[engine] = max(1, int(threads))
+        elif engine in fixed_cores:
+            fixed_threads[engine] = len(fixed_cores[engine])
+
+    taken = {core for engine_cores in fixed_cores.values() for core in engine_cores}
+    free = [core for core in cores if core not in taken] or cores
+    flexible = {engine: ENGINE_WEIGHTS[engine] for engine in ENGINES if engine not in fixed_threads}
+    threads = dict(fixed_threads)
+    # Free cores minus the threads reserved by CPU_THREADS_* of engines without their own cores
+    free_for_flexible = max(1, len(free) - sum(fixed_threads[engine] for engine in fixed_threads
+                                                if engine not in fixed_cores))
+    if flexible:
+        threads.update(_split_threads(free_for_flexible, flexible))
+
+    unpinned = [engine for engine in ENGINES if engine not in fixed_cores]
+    pinned = sum(threads[engine] for engine in unpinned) <= len(free)
+    if not pinned:
+        # Sharing the cores anyway, round the shares instead of giving every engine at least one core
+        weight_sum = sum(flexible.values())
+        for engine, weight in flexible.items():
+            threads[engine] = max(1, int(free_for_flexible * weight / weight_sum + 0.5))
+    allocations = {}
+    offset = 0
+    for engine in ENGINES:
+        source = "env" if engine in fixed_threads or engine in fixed_cores else "default"
+        if engine in fixed_cores:
+            allocations[engine] = EngineAllocation(engine, threads[engine], fixed_cores[engine], True, source)
+        elif pinned:
+            engine_cores = free[offset:offset + threads[engine]]
+            offset += threads[engine]
+            allocations[engine] = EngineAllocation(engine, threads[engine], engine_cores, True, source)
+        else:
+            allocations[engine] = EngineAllocation(engine, threads[engine], list(free), False, source)
+    return allocations
+
+
+def _torch():
+    # Torch is only configured in processes that already use it
+    return sys.modules.get("torch")
+
+
+class ResourceGovernor:
+    """
+    Applies the engine allocations and throttles ingestion against interactive load.
+
+    Work of an engine runs either on its executor, whose threads are pinned to the engine's
+    cores and torch thread count once (OCR, translation), or inside `pinned(engine)`, which pins
+    the calling thread for the duration of a call (embedding, called from several threads).
+    Torch thread counts are per thread in its OpenMP builds, so each engine keeps its own.
+    """
+
+    def __init__(self, cores: Optional[Sequence[int]] = None, env=os.environ):
+        self.cores = list(cores) if cores is not None else available_cores()
+        self.allocations = allocate(self.cores, env)
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+        self.active_queries = 0
+        self.deferred_seconds = 0.0
+
+    def allocation(self, engine: str) -> EngineAllocation:
+        return self.allocations[engine]
+
+    def pin_current_thread(self, engine: str) -> None:
+        """Restrict the calling thread (and processes it starts) to the engine's cores and threads."""
+        allocation = self.allocations[engine]
+        if allocation.pinned and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, allocation.cores)
+        torch = _torch()
+        if torch is not None and engine in TORCH_ENGINES:
+            torch.set_num_threads(allocation.threads)
+
+    @contextmanager
+    def pinned(self, engine: str) -> Iterator[None]:
+        """Run a block pinned as `engine`, restoring the thread's previous cores and torch threads."""
+        previous_cores = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+        torch = _torch()
+        previous_threads = torch.get_num_threads() if torch is not None else None
+        self.pin_current_thread(engine)
+        try:
+            yield
+        finally:
+            if previous_cores is not None and self.allocations[engine].pinned:
+                os.sched_setaffinity(0, previous_cores)
+            if previous_threads is not None and engine in TORCH_ENGINES:
+                torch.set_num_threads(previous_threads)
+
+    def pool_size(self, engine: str) -> int:
+        # One Tesseract process per OCR thread; a model serves one call at a time with all its threads
+        return self.allocations[engine].threads if engine == "ocr" else 1
+
+    def executor(self, engine: str) -> ThreadPoolExecutor:
+        """Executor of `engine`, its threads pinned to the engine's allocation."""
+        with self._lock:
+            executor = self._executors.get(engine)
+            if executor is None:
+                if engine == "ocr":
+                    # Tesseract's own OpenMP threads would multiply the pool size. Only processes
+                    # started from now on read it: torch and faiss initialized OpenMP at import.
+                    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+                executor = ThreadPoolExecutor(max_workers=self.pool_size(engine), thread_name_prefix=engine,
+                                              initializer=self.pin_current_thread, initargs=(engine,))
+                self._executors[engine] = executor
+        return executor
+
+    def configure_torch(self) -> None:
+        """Process-wide torch settings: the inter-op pool size, settable only before it is first used."""
+        torch = _torch()
+        if torch is None:
+            return
+        try:
+            torch.set_num_interop_threads(INTEROP_THREADS)
+        except RuntimeError as e:
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+
+    # --- Interactive load and ingestion throttling ---
+
+    def query_started(self, queries: int = 1) -> None:
+        """Count `queries` interactive queries as in flight, until query_finished."""
+        with self._lock:
+            self.active_queries += queries
+
+    def query_finished(self, queries: int = 1) -> None:
+        with self._lock:
+            self.active_queries -= queries
+
+    @contextmanager
+    def interactive(self, queries: int = 1) -> Iterator[None]:
+        """Count `queries` interactive queries as in flight for the duration of the block."""
+        self.query_started(queries)
+        try:
+            yield
+        finally:
+            self.query_finished(queries)
+
+    def _ingestion_blocked(self) -> bool:
+        return INGEST_PAUSE_QUERIES > 0 and self.active_queries >= INGEST_PAUSE_QUERIES
+
+    def _record_deferral(self, stage: str, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            self.deferred_seconds += waited
+        ingestion_deferred_seconds.inc(waited, stage=stage)
+        if timed_out:
+            logger.warning(f"Ingestion stage {stage} ran after waiting {waited:.1f}s for queries to finish")
+        else:
+            log_event("ingestion_deferred", stage=stage, waited_ms=round(waited * 1000, 1))
+
+    async def ingestion_slot(self, stage: str) -> float:
+        """
+        Wait, up to INGEST_MAX_DEFER_SECONDS, until fewer than INGEST_PAUSE_QUERIES
+        interactive queries are embedding or searching. Ingestion calls this before each stage.
+
+        Returns:
+            Seconds waited
+        """
+        if not self._ingestion_blocked():
+            return 0.0
+        start = time.monotonic()
+        deadline = start + INGEST_MAX_DEFER_SECONDS
+        while self._ingestion_blocked() and time.monotonic() < deadline:
+            await asyncio.sleep(INGEST_POLL_SECONDS)
+        waited = time.monotonic() - start
+        self._record_deferral(stage, waited, self._ingestion_blocked())
+        return waited
+
+    def wait_for_ingestion_slot(self, stage: str) -> float:
+        """Same as ingestion_slot, for background work running in a thread (e.g. re-embedding)."""
+        if not self._ingestion_blocked():
+            return 0.0
+        start = time.monotonic()
+        deadline = start + INGEST_MAX_DEFER_SECONDS
+        while self._ingestion_blocked() and time.monotonic() < deadline:
+            time.sleep(INGEST_POLL_SECONDS)
+        waited = time.monotonic() - start
+        self._record_deferral(stage, waited, self._ingestion_blocked())
+        return waited
+
+    # --- Report ---
+
+    def report(self) -> Dict:
+        """Effective allocation: cores available, every engine's threads and cores, and throttling."""
+        torch = _torch()
+        return {
+            "cores": format_cpu_list(self.cores),
+            "engines": [self.allocations[engine].to_dict() for engine in ENGINES],
+            "torch_interop_threads": torch.get_num_interop_threads() if torch is not None else None,
+            "ingest_pause_queries": INGEST_PAUSE_QUERIES,
+            "ingest_max_defer_seconds": INGEST_MAX_DEFER_SECONDS,
+            "active_queries": self.active_queries,
+            "ingestion_deferred_seconds": round(self.deferred_seconds, 3),
+        }
+
+    def log_report(self) -> None:
+        report = self.report()
+        lines = [f"CPU allocation on cores {report['cores']} ({len(self.cores)}):"]
+        for engine in report["engines"]:
+            placement = f"cores {engine['cores']}" if engine["pinned"] else "shared cores"
+            lines.append(f"  {engine['engine']:<15} {engine['threads']:>3} threads, {placement} ({engine['source']})")
+        if report["torch_interop_threads"] is not None:
+            lines.append(f"  torch inter-op threads: {report['torch_interop_threads']}")
+        if INGEST_PAUSE_QUERIES > 0:
+            lines.append(f"  ingestion waits while {INGEST_PAUSE_QUERIES}+ queries embed or search "
+                         f"(at most {INGEST_MAX_DEFER_SECONDS:g}s per stage)")
+        logger.info("\n".join(lines))
+
+
+governor = ResourceGovernor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the CPU allocation of each engine.")
+    parser.add_argument("--cores", metavar="ENGINE", choices=ENGINES,
+                        help="Only print the engine's core list (for taskset)")
+    parser.add_argument("--threads", metavar="ENGINE", choices=ENGINES, help="Only print the engine's thread count")
+    args = parser.parse_args()
+    if args.cores:
+        print(format_cpu_list(governor.allocation(args.cores).cores))
+    elif args.threads:
+        print(governor.allocation(args.threads).threads)
+    else:
+        print(json.dumps(governor.report(), indent=2))
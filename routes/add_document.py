@@ -1,8 +1,9 @@
 import os
-import shutil
 import asyncio
-from fastapi import FastAPI, UploadFile, File, HTTPException,APIRouter
-from services import add_document
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException,APIRouter
+from services import add_document, reingest_document
+from uploads import UploadError, store_upload
 import uuid
 from utils import DATA_DIR
 
@@ -12,21 +13,20 @@ os.makedirs(DATA_DIR, exist_ok=True)
 add_document_router = APIRouter()
 
 @add_document_router.post("/add_document")
-async def add_document_endpoint(file: UploadFile = File(...)):
-    # Validate uploaded file
-    if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
-
+async def add_document_endpoint(file: UploadFile = File(...), collection: Optional[str] = Form(None)):
+    """
+    Store an uploaded image and ingest it. The upload is streamed to disk in chunks, checked for
+    type and size and hashed as it is written, then handed to the pipeline without a second read.
+    """
     doc_uuid = str(uuid.uuid4())
-    # Save file to data directory
-    file_path = os.path.join(DATA_DIR, doc_uuid + os.path.splitext(file.filename)[-1])
-    if os.path.exists(file_path):
-        raise HTTPException(status_code=400, detail="File already exists.")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        upload = await store_upload(file, doc_uuid)
+    except UploadError as ue:
+        raise HTTPException(status_code=ue.status_code, detail=ue.detail)
+    file_path = upload.path
 
     try:
-        result = await add_document(file_path, doc_uuid)
+        result = await add_document(file_path, doc_uuid, collection=collection, upload=upload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing document: {e}")
 
@@ -34,4 +34,26 @@ async def add_document_endpoint(file: UploadFile = File(...)):
         "status": "success",
         "chunks_added": result,
         "doc_uuid": doc_uuid
-    }
\ No newline at end of file
+    }
+
+
+@add_document_router.post("/reingest/{doc_id}")
+async def reingest_document_endpoint(doc_id: str):
+    """
+    Ingest a stored document again, resuming a failed ingestion or picking up new model versions.
+    Stages whose checkpointed output is still valid are skipped.
+    """
+    try:
+        result = await reingest_document(doc_id)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except FileNotFoundError as fe:
+        raise HTTPException(status_code=404, detail=str(fe))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing document: {e}")
+
+    return {
+        "status": "success",
+        "chunks_added": result,
+        "doc_uuid": doc_id
+    }
@@ -1,9 +1,12 @@
 import asyncio
 from gtts import gTTS
 import io
-from fastapi.responses import StreamingResponse
-from fastapi import FastAPI,HTTPException,APIRouter
-from TTS.tts_engine import generate_audio
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi import FastAPI,HTTPException,APIRouter,Request
+from TTS.tts_engine import tts_pool, audio_cache_key, load_backend, stream_audio, stream_audio_from_text_stream
+from services import query_chatbot, generation_scheduler
+from RAG.scheduler import QueueFullError
+from typing import Optional
 
 generate_audio_router = APIRouter()
 
@@ -14,27 +17,71 @@ valid_languages = {
 }
 
 @generate_audio_router.get("/generate_audio")
-async def generate_audio_endpoint(answer: str, language: str):
+async def generate_audio_endpoint(answer: str, language: str, request: Request):
     """Endpoint to query the RAG store and get an answer."""
     if not answer:
         raise HTTPException(status_code=400, detail="Answer cannot be empty.")
     if language not in valid_languages:
         raise HTTPException(status_code=400, detail=f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+
+    backend = await load_backend()
+    etag = f'"{audio_cache_key(answer, language, backend)}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "public, max-age=86400", "language": language}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
     try:
-        audio_data = generate_audio(answer, language)
-        if audio_data is None:
+        # Synthesis runs on the TTS worker pool so the event loop stays free for other requests
+        audio_path = await tts_pool.generate_cached(answer, language)
+        if audio_path is None:
             raise HTTPException(
                 status_code=400,
                 detail="Failed to generate audio. Check logs for details."
             )
-        buffer = io.BytesIO(audio_data)
+    except HTTPException:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating answer: {e}")
 
+    # FileResponse lets the server send the cached file with sendfile instead of copying it through Python
+    return FileResponse(
+        audio_path,
+        media_type=backend.media_type,
+        headers={**cache_headers, "Content-Disposition": f"inline; filename=answer.{backend.extension}"}
+    )
+
+
+@generate_audio_router.get("/generate_audio_stream")
+async def generate_audio_stream_endpoint(answer: str, language: str):
+    """Stream the audio of an answer sentence by sentence, so playback starts after the first one."""
+    if not answer:
+        raise HTTPException(status_code=400, detail="Answer cannot be empty.")
+    if language not in valid_languages:
+        raise HTTPException(status_code=400, detail=f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+
+    backend = await load_backend()
+    return StreamingResponse(
+        stream_audio(answer, language),
+        media_type=backend.media_type,
+        headers={"language": language, "Cache-Control": "no-cache"}
+    )
+
+
+@generate_audio_router.get("/query_audio")
+async def query_audio_endpoint(query: str, language: str, k: int = 6, priority: int = 0, timeout: Optional[float] = None):
+    """Answer a query as speech, synthesizing each sentence while the LLM is still generating the rest."""
+    if language not in valid_languages:
+        raise HTTPException(status_code=400, detail=f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+    try:
+        generation_scheduler.check_capacity()
+    except QueueFullError as qe:
+        raise HTTPException(status_code=429, detail=str(qe), headers={"Retry-After": str(qe.retry_after)})
+
+    backend = await load_backend()
     return StreamingResponse(
-        content=buffer,
-        media_type="audio/mpeg",
-        headers={"language":language,"Content-Disposition": "inline; filename=answer.mp3"}
-    )
\ No newline at end of file
+        stream_audio_from_text_stream(query_chatbot(query, language, k, priority=priority, timeout=timeout), language),
+        media_type=backend.media_type,
+        headers={"language": language, "Cache-Control": "no-cache"}
+    )
@@ -0,0 +1,32 @@
+import os
+from datetime import datetime
+
+from fastapi import APIRouter
+
+from utils import DATA_DIR
+
+list_documents_router = APIRouter()
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+
+@list_documents_router.get("/documents")
+async def list_documents_endpoint():
+    """
+    List the stored source images (one per document), newest first.
+    """
+    documents = []
+    if os.path.isdir(DATA_DIR):
+        for entry in os.scandir(DATA_DIR):
+            doc_id, extension = os.path.splitext(entry.name)
+            if not entry.is_file() or extension.lower() not in IMAGE_EXTENSIONS:
+                continue
+            stat = entry.stat()
+            documents.append({
+                "doc_id": doc_id,
+                "filename": entry.name,
+                "size_bytes": stat.st_size,
+                "created_time": datetime.fromtimestamp(stat.st_ctime).strftime("%Y-%m-%d %H:%M:%S"),
+            })
+    documents.sort(key=lambda doc: doc["created_time"], reverse=True)
+    return {"documents": documents}
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+import tracing
+
+profiles_router = APIRouter()
+
+@profiles_router.get("/traces/{trace_id}")
+async def get_trace_endpoint(trace_id: str):
+    """Spans of a recent request, by the X-Trace-Id it was answered with."""
+    trace = tracing.get_finished_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No recent trace with ID: {trace_id}")
+    return trace.to_dict()
+
+@profiles_router.get("/profiles")
+async def list_profiles_endpoint():
+    """Stored CPU profiles, newest first, and the current sampling rate."""
+    return {"sample_rate": tracing.PROFILE_SAMPLE_RATE, "profiles": tracing.list_profiles()}
+
+@profiles_router.get("/profiles/{profile_id}")
+async def download_profile_endpoint(profile_id: str):
+    """Download a CPU profile in pstats format (open with snakeviz or `python -m pstats`)."""
+    path = tracing.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No profile with ID: {profile_id}")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+@profiles_router.post("/profiles/sampling")
+async def set_profile_sampling_endpoint(rate: float):
+    """Profile this share (0..1) of all requests from now on. 0 disables sampling."""
+    if not 0 <= rate <= 1:
+        raise HTTPException(status_code=400, detail="rate must be between 0 and 1.")
+    tracing.set_sample_rate(rate)
+    return {"status": "success", "sample_rate": tracing.PROFILE_SAMPLE_RATE}
@@ -1,15 +1,58 @@
 import os
 import shutil
 import asyncio
-from fastapi import FastAPI,HTTPException,APIRouter
-from services import query_chatbot
+import json
+from fastapi import FastAPI,HTTPException,APIRouter,Query
+from services import query_chatbot, query_chatbot_events, query_batch_events, generation_scheduler, MAX_BATCH_QUERIES
+from utils import valid_languages
+from RAG.filters import SearchFilter
+from RAG.scheduler import QueueFullError
 from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Optional
+from contextlib import aclosing
+from pydantic import BaseModel
 
 query_chatbot_router = APIRouter()
 
+
+class BatchQueryItem(BaseModel):
+    query: str
+    language: str
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem]
+    k: int = 6
+    score_threshold: Optional[float] = None
+    priority: int = 0
+    timeout: Optional[float] = None
+
+
+def make_search_filter(doc_id: Optional[List[str]], collection: Optional[List[str]],
+                       ingested_after: Optional[datetime], ingested_before: Optional[datetime]) -> Optional[SearchFilter]:
+    """SearchFilter from the query parameters, None if none of them is set."""
+    search_filter = SearchFilter(doc_ids=doc_id, collections=collection,
+                                 ingested_after=ingested_after, ingested_before=ingested_before)
+    return None if search_filter.is_empty else search_filter
+
+
 @query_chatbot_router.get("/query")
-async def query_endpoint(query: str, language: str):
-    """Endpoint to query the RAG store and get an answer."""
+async def query_endpoint(query: str, language: str, k: int = 6, priority: int = 0, timeout: Optional[float] = None,
+                         doc_id: Optional[List[str]] = Query(None), collection: Optional[List[str]] = Query(None),
+                         ingested_after: Optional[datetime] = None, ingested_before: Optional[datetime] = None):
+    """
+    Endpoint to query the RAG store and get an answer.
+
+    Retrieval can be restricted to documents (`doc_id`, repeatable), collections (`collection`,
+    repeatable) and an ingestion time range (ISO 8601 `ingested_after` / `ingested_before`;
+    times without a UTC offset are taken as UTC).
+    """
+    search_filter = make_search_filter(doc_id, collection, ingested_after, ingested_before)
+    try:
+        generation_scheduler.check_capacity()
+    except QueueFullError as qe:
+        raise HTTPException(status_code=429, detail=str(qe), headers={"Retry-After": str(qe.retry_after)})
     try:
         # answer_generator = query_chatbot(query, language)
 
@@ -19,7 +62,7 @@ async def query_endpoint(query: str, language: str):
         #         yield chunk.encode("utf-8")
 
         return StreamingResponse(
-            query_chatbot(query, language),
+            query_chatbot(query, language, k, priority=priority, timeout=timeout, search_filter=search_filter),
             media_type="text/plain",  # or "application/json" if you want JSON chunks
             headers={"Cache-Control": "no-cache"},
         )
@@ -39,4 +82,89 @@ async def query_endpoint(query: str, language: str):
 #         content=buffer,
 #         media_type="audio/wav",
 #         headers={"answer": answer, "query":query,"language":language,"Content-Disposition": "inline; filename=answer.wav"}
-#     )
\ No newline at end of file
+#     )
+
+
+@query_chatbot_router.get("/generation_stats")
+async def generation_stats_endpoint():
+    """Queue depth, in-flight generations and queue wait times of the LLM scheduler."""
+    return generation_scheduler.stats()
+
+
+@query_chatbot_router.get("/query_stream")
+async def query_stream_endpoint(query: str, language: str, k: int = 6, score_threshold: Optional[float] = None,
+                                fetch_k: int = 20, priority: int = 0, timeout: Optional[float] = None,
+                                format: str = "ndjson", doc_id: Optional[List[str]] = Query(None),
+                                collection: Optional[List[str]] = Query(None), ingested_after: Optional[datetime] = None,
+                                ingested_before: Optional[datetime] = None):
+    """
+    Endpoint to query the RAG store with a structured event stream.
+
+    Sends the retrieved chunks (ids, doc ids, scores) first, then the answer as token
+    events, then a final event with the embed/search/time-to-first-token/total timings.
+    `format` is either "ndjson" (one JSON object per line) or "sse" (Server-Sent Events).
+    Takes the same document/collection/ingestion date filters as /query (times without a
+    UTC offset are taken as UTC).
+    """
+    if language not in valid_languages:
+        raise HTTPException(status_code=400, detail=f"Invalid language. Supported languages: {', '.join(valid_languages.keys())}")
+    if k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+    if format not in {"ndjson", "sse"}:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
+    search_filter = make_search_filter(doc_id, collection, ingested_after, ingested_before)
+    try:
+        generation_scheduler.check_capacity()
+    except QueueFullError as qe:
+        raise HTTPException(status_code=429, detail=str(qe), headers={"Retry-After": str(qe.retry_after)})
+
+    async def event_stream():
+        events = query_chatbot_events(query, language, k, score_threshold, fetch_k, priority=priority,
+                                      timeout=timeout, search_filter=search_filter)
+        async with aclosing(events):
+            async for event in events:
+                data = json.dumps(event, ensure_ascii=False)
+                if format == "sse":
+                    yield f"event: {event['event']}\ndata: {data}\n\n"
+                else:
+                    yield data + "\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@query_chatbot_router.post("/query_batch")
+async def query_batch_endpoint(request: BatchQueryRequest):
+    """
+    Answer many queries in one request.
+
+    The queries are embedded together and searched with one FAISS call per language; answers are
+    generated a few at a time and streamed back as NDJSON, one line per query as it completes
+    (lines carry the query's `index` in the request, since they arrive out of order).
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty.")
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch.")
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+    for item in request.queries:
+        if item.language not in valid_languages:
+            raise HTTPException(status_code=400, detail=f"Invalid language '{item.language}'. Supported languages: {', '.join(valid_languages.keys())}")
+
+    async def result_stream():
+        items = [{"query": item.query, "language": item.language} for item in request.queries]
+        results = query_batch_events(items, request.k, request.score_threshold,
+                                     priority=request.priority, timeout=request.timeout)
+        async with aclosing(results):
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,57 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from RAG.embedding_backends import BACKENDS
+from RAG.reembed import REEMBED_BATCH_SIZE, REEMBED_MAX_RATE
+from services import cancel_reembed, reembed_status, rollback_index, start_reembed
+
+reembed_router = APIRouter()
+
+
+@reembed_router.post("/reembed")
+async def start_reembed_endpoint(model_name: Optional[str] = None, backend: Optional[str] = None,
+                                 shards: Optional[int] = None, max_rate: float = REEMBED_MAX_RATE,
+                                 batch_size: int = REEMBED_BATCH_SIZE):
+    """
+    Re-embed all stored chunks into a new index generation in the background, with another
+    model, backend or shard count. Queries keep using the live generation until the new one
+    is complete and verified; progress is reported by GET /reembed.
+    """
+    if backend is not None and backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"backend must be one of {', '.join(BACKENDS)}.")
+    if (shards is not None and shards < 1) or batch_size < 1 or max_rate < 0:
+        raise HTTPException(status_code=400, detail="shards and batch_size must be positive, max_rate not negative.")
+    try:
+        return await start_reembed(model_name, backend, shards, batch_size=batch_size, max_rate=max_rate)
+    except RuntimeError as re:
+        raise HTTPException(status_code=409, detail=str(re))
+
+
+@reembed_router.get("/reembed")
+async def reembed_status_endpoint():
+    """Progress, ETA and verification results of the current or last re-embedding job."""
+    status = reembed_status()
+    if status is None:
+        raise HTTPException(status_code=404, detail="No re-embedding job has run.")
+    return status
+
+
+@reembed_router.delete("/reembed")
+async def cancel_reembed_endpoint():
+    """Cancel the running re-embedding job; the live generation is left as it is."""
+    if not cancel_reembed():
+        raise HTTPException(status_code=404, detail="No re-embedding job is running.")
+    return {"status": "cancelling"}
+
+
+@reembed_router.post("/reembed/rollback")
+async def rollback_endpoint():
+    """Serve the previous index generation again."""
+    try:
+        generation = await rollback_index()
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except RuntimeError as re:
+        raise HTTPException(status_code=409, detail=str(re))
+    return {"status": "success", **generation}
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+
+from RAG.snapshot import SnapshotError
+from services import export_snapshot, import_snapshot
+
+snapshot_router = APIRouter()
+
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+
+@snapshot_router.get("/snapshot/export")
+async def export_snapshot_endpoint():
+    """
+    Download a checksummed snapshot of all language indexes as a tar archive,
+    to seed a new replica with POST /snapshot/import.
+    """
+    workdir = tempfile.mkdtemp(prefix="snapshot-export-")
+    archive_path = os.path.join(workdir, "index_snapshot.tar")
+    try:
+        manifest = await export_snapshot(archive_path)
+    except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Error exporting snapshot: {e}")
+
+    return FileResponse(
+        archive_path,
+        media_type="application/x-tar",
+        filename=f"index_snapshot_v{manifest['index_version']}.tar",
+        background=BackgroundTask(shutil.rmtree, workdir, ignore_errors=True),
+    )
+
+
+@snapshot_router.post("/snapshot/import")
+async def import_snapshot_endpoint(file: UploadFile = File(...), verify: bool = True):
+    """
+    Replace all language indexes with an uploaded snapshot archive.
+    """
+    workdir = tempfile.mkdtemp(prefix="snapshot-import-")
+    archive_path = os.path.join(workdir, "index_snapshot.tar")
+    try:
+        # Copy the upload in fixed-size pieces, the archive can be larger than memory
+        with open(archive_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                buffer.write(chunk)
+        manifest = await import_snapshot(archive_path, verify=verify)
+    except SnapshotError as se:
+        raise HTTPException(status_code=400, detail=str(se))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing snapshot: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "status": "success",
+        "index_version": manifest["index_version"],
+        "created_at": manifest["created_at"],
+        "vectors": {name: entry["rows"] for name, entry in manifest["stores"].items()},
+    }
@@ -1,54 +1,140 @@
 import asyncio
-from OCR.ocr import read_image, image_to_text
+import time
+from OCR.ocr import read_image, image_to_text, engine_version
+import Translation.translate as translation_models
 from Translation.translate import translate_punjabi_to_HindiEnglish
 from RAG.TextSplitter import MultilingualTextSplitter, CHUNK_SIZE, CHUNK_OVERLAP
 from RAG.embeddings import FaissEmbeddingStore
+from RAG.reembed import ReembedJob
 from RAG.generation import OllamaAnswerGenerator
-from typing import List, Dict, AsyncGenerator
+from RAG.batcher import QueryEmbeddingBatcher, embed_queries
+from RAG.filters import SearchFilter
+from RAG.scheduler import GenerationScheduler, GenerationTicket, DeadlineExceededError, QueueFullError
+from typing import List, Dict, AsyncGenerator, Optional
 # from TTS.tts_engine import synthesize_speech
-from utils import logger
+from utils import logger, log_event, DATA_DIR
+from artifacts import ArtifactStore, content_hash, file_hash, stage_key
+from uploads import StoredUpload
+from resources import governor
+import tracing
+from metrics import Gauge, time_stage, stage_seconds, documents_ingested, queries_total
 import copy
+import logging
+import os
+from contextlib import aclosing
+
+governor.configure_torch()
+governor.log_report()
 
 store = FaissEmbeddingStore()
+artifacts = ArtifactStore()
+reembed_job: Optional[ReembedJob] = None
 text_splitter = MultilingualTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
 
 llm_model_name = "pdlRAG"
 llm_base_url = "http://localhost:11434"
-answer_generator = OllamaAnswerGenerator(model_name=llm_model_name, ollama_base_url=llm_base_url)
-async def add_document(file_path: str, doc_uuid: str) -> int:
+answer_generator = OllamaAnswerGenerator(model_name=llm_model_name, ollama_base_url=llm_base_url,
+                                         num_thread=governor.allocation("llm").threads)
+generation_scheduler = GenerationScheduler()
+query_batcher = QueryEmbeddingBatcher(lambda: store.embedder, model_name=store.model_name)
+
+# Answers of one /query_batch request generated at the same time; the scheduler still bounds the total
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "4"))
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "64"))
+
+Gauge("pdl_index_vectors", "Vectors in the FAISS index, by language.", ("language",),
+      callback=lambda: {(lang,): size for lang, size in store.index_sizes().items()})
+Gauge("pdl_generation_queue_depth", "Queries waiting for a generation slot.",
+      callback=lambda: {(): generation_scheduler.queue_depth})
+Gauge("pdl_generation_in_flight", "Generations currently running.",
+      callback=lambda: {(): generation_scheduler.in_flight})
+Gauge("pdl_interactive_queries", "Queries embedding or searching; ingestion waits while INGEST_PAUSE_QUERIES are.",
+      callback=lambda: {(): governor.active_queries})
+Gauge("pdl_generation_queue_wait_seconds", "Recent queue wait time percentiles.", ("quantile",),
+      callback=lambda: {
+          ("0.5",): generation_scheduler.stats()["wait_seconds_p50"],
+          ("0.99",): generation_scheduler.stats()["wait_seconds_p99"],
+      })
+
+async def add_document(file_path: str, doc_uuid: str, collection: Optional[str] = None,
+                       upload: Optional[StoredUpload] = None) -> int:
     """
     Pipeline to process an image document:
     1. Perform OCR to extract text
     2. Translate extracted text to Hindi and English
     3. Split multilingual text into chunks
     4. Generate embeddings and add to Faiss store
+
+    The optional collection is stored with every chunk (and decides the index shard when SHARD_BY=collection).
+
+    Each stage's output is checkpointed in `artifacts` under doc_uuid, keyed by its input and the
+    version of the model that produced it. Stages with a checkpoint are skipped, so running this
+    again for the same document resumes after the last completed stage, and after a model change
+    only the stages from that model on are redone.
+
+    A fresh upload passes its StoredUpload, whose hash and bytes were taken while it was written,
+    so the file is not read again.
+
+    OCR and translation run on their engines' pinned pools (see resources), and each heavy
+    stage first waits while interactive queries are embedding or searching.
     """
+    if upload is not None:
+        image_hash = upload.content_hash
+    else:
+        image_hash = await tracing.to_thread(file_hash, file_path)
+    await tracing.to_thread(artifacts.write_info, doc_uuid, {"file": os.path.basename(file_path),
+                                                             "image_hash": image_hash, "collection": collection})
+
     # 1. Read and OCR (synchronous)
-    logger.info("Reading Images")
-    image = await asyncio.to_thread(read_image, file_path)
-    raw_text = await asyncio.to_thread(image_to_text, image)
+    version = engine_version()
+    key = stage_key(version, image_hash)
+    raw_text = await tracing.to_thread(artifacts.load, doc_uuid, "ocr", key)
+    if raw_text is None:
+        await governor.ingestion_slot("ocr")
+        logger.info("Reading Images")
+        with time_stage("image_read"):
+            image = await tracing.to_thread(read_image, upload.open() if upload is not None else file_path)
+        with time_stage("ocr"):
+            raw_text = await tracing.run_in_executor(governor.executor("ocr"), image_to_text, image)
+        await tracing.to_thread(artifacts.save, doc_uuid, "ocr", key, raw_text, version)
+    else:
+        logger.info(f"Reusing OCR text of {doc_uuid}")
 
     # 2. Split into chunks (sync) -> wrap in thread
-    logger.info("Splitting text into chunks")
-    punjabi_chunked_docs = await asyncio.to_thread(text_splitter.split_documents, raw_text, doc_uuid)
+    version = f"{text_splitter.tokenizer_name}:{text_splitter.chunk_size}:{text_splitter.chunk_overlap}"
+    key = stage_key(version, content_hash(raw_text))
+    punjabi_chunked_docs = await tracing.to_thread(artifacts.load, doc_uuid, "split", key)
+    if punjabi_chunked_docs is None:
+        logger.info("Splitting text into chunks")
+        with time_stage("split"):
+            punjabi_chunked_docs = await tracing.to_thread(text_splitter.split_documents, raw_text, doc_uuid)
+        await tracing.to_thread(artifacts.save, doc_uuid, "split", key, punjabi_chunked_docs, version)
 
     if not punjabi_chunked_docs:
         logger.warning("No text chunks generated from the document.")
         return 0
     logger.info(f"Generated {len(punjabi_chunked_docs)} Punjabi chunks")
+    if collection:
+        for chunk in punjabi_chunked_docs:
+            chunk["collection"] = collection
 
     # 3. Translate (async)
     docs = [chunk["text"] for chunk in punjabi_chunked_docs]
-    logger.info("Translating text")
-    translations = await translate_punjabi_to_HindiEnglish(docs)
-    logger.info(translations)
-
-    # Prepare a unified document structure
-    doc = {
-        "punjabi": [raw_text],
-        "hindi": translations.get("hindi", ""),
-        "english": translations.get("english", "")
-    }
+    version = f"{translation_models.model_name_en}:{translation_models.model_name_hi}"
+    key = stage_key(version, content_hash(docs))
+    translations = await tracing.to_thread(artifacts.load, doc_uuid, "translate", key)
+    if translations is None:
+        await governor.ingestion_slot("translate")
+        logger.info("Translating text")
+        translations = await translate_punjabi_to_HindiEnglish(docs)
+        await tracing.to_thread(artifacts.save, doc_uuid, "translate", key, translations, version)
+        logger.info(f"Translated {len(docs)} chunks")
+    else:
+        logger.info(f"Reusing translations of {doc_uuid}")
+    if logger.isEnabledFor(logging.DEBUG):
+        for idx, chunk in enumerate(punjabi_chunked_docs):
+            log_event("chunk_translated", doc_id=chunk["doc_id"], chunk_idx=idx,
+                      english=translations["english"][idx][:80], hindi=translations["hindi"][idx][:80])
 
     # Create chunked documents for each language
     chunked_docs = {
@@ -62,29 +148,262 @@ async def add_document(file_path: str, doc_uuid: str) -> int:
         chunked_docs['english'][idx]['text'] = translations['english'][idx]
 
     # 4. Generate embeddings and store (sync) -> wrap in thread
+    version = f"{store.model_name}:{store.backend}"
+    key = stage_key(version, content_hash(chunked_docs))
+    indexed = any((await tracing.to_thread(store.document_chunk_counts, doc_uuid)).values())
+    if indexed and await tracing.to_thread(artifacts.load, doc_uuid, "index", key) is not None:
+        logger.info(f"{doc_uuid} is already indexed with {version}")
+        return len(chunked_docs['punjabi'])
+    await governor.ingestion_slot("index")
     logger.info("Adding documents to store")
-    await asyncio.to_thread(store.add_documents, chunked_docs)
+    # Vectors of an earlier ingestion of this document are replaced in the same index update
+    await tracing.to_thread(store.add_documents, chunked_docs, indexed)
+    await tracing.to_thread(artifacts.save, doc_uuid, "index", key,
+                            {"chunks": len(chunked_docs['punjabi']), "index_version": store.version}, version)
+    documents_ingested.inc()
     
     return len(chunked_docs['punjabi'])
 
-async def query_chatbot(query: str, language: str, k: int = 6) -> AsyncGenerator[str, None]:
+async def reingest_document(doc_uuid: str) -> int:
     """
-    Retrieve relevant chunks from store and generate an answer.
+    Run the ingestion of a stored document again, e.g. after it failed or a model changed.
+    Completed stages whose inputs and model versions are unchanged are skipped.
+    """
+    info = await tracing.to_thread(artifacts.read_info, doc_uuid) or {}
+    file_path = os.path.join(DATA_DIR, info["file"]) if info.get("file") else None
+    if file_path is None or not os.path.exists(file_path):
+        file_path = next((os.path.join(DATA_DIR, f"{doc_uuid}.{ext}") for ext in ("png", "jpg", "jpeg")
+                          if os.path.exists(os.path.join(DATA_DIR, f"{doc_uuid}.{ext}"))), None)
+    if file_path is None:
+        raise FileNotFoundError(f"No stored image for document {doc_uuid}")
+    logger.info(f"Re-ingesting document {doc_uuid}")
+    return await add_document(file_path, doc_uuid, collection=info.get("collection"))
+
+async def query_chatbot_events(query: str, language: str, k: int = 6, score_threshold: Optional[float] = None,
+                               fetch_k: int = 20, priority: int = 0, timeout: Optional[float] = None,
+                               search_filter: Optional[SearchFilter] = None) -> AsyncGenerator[Dict, None]:
+    """
+    Retrieve relevant chunks and generate an answer, as a stream of structured events.
+
+    Events, in order:
+    - {"event": "retrieval", "results": [...], "timings": {...}} once, before any token
+    - {"event": "token", "text": ...} for every generated piece of the answer
+    - {"event": "error", "message": ...} if the answer could not be generated
+    - {"event": "done", "timings": {...}, "context": {...}} last, with embed_ms, search_ms,
+      ttft_ms (time to first token) and total_ms measured from the start of the request
+
+    Generation waits for a slot from `generation_scheduler` (with `priority` and `timeout`),
+    taken only once retrieval is done and released as soon as the answer is generated or the
+    stream is closed. Callers that need to reject early (HTTP 429) call
+    `generation_scheduler.check_capacity()` first. `search_filter` restricts retrieval to
+    some documents, collections or an ingestion date range.
     """
+    started = time.perf_counter()
+    timings = {}
+
+    def elapsed_ms(since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 2)
+
     # Validate language
     if language not in {"punjabi", "hindi", "english"}:
         raise ValueError(f"Unsupported language '{language}'. Valid options are punjabi, hindi, english.")
 
     logger.info(f"Querying chatbot in {language} for: {query}")
-    # Search the FAISS store (sync -> thread)
-    results = await asyncio.to_thread(store.search, query, language, k)
+    # Embed and search the FAISS store (sync -> thread)
+    queries_total.inc(language=language)
+    phase = time.perf_counter()
+    # Embed with the model of the index searched below, even if a generation swap happens in between
+    serving = await tracing.to_thread(store.serving)
+    # Ingestion yields to the CPU-bound embed and search, not to the wait for the LLM
+    with governor.interactive():
+        with time_stage("query_embed", model=serving.model_name):
+            embedding = await query_batcher.embed(query, serving.embedder)
+        timings["embed_ms"] = elapsed_ms(phase)
+        phase = time.perf_counter()
+        try:
+            with time_stage("search"):
+                scored = await tracing.to_thread(store.search_by_vector, embedding, language, k, score_threshold,
+                                                fetch_k, search_filter, serving)
+        except ValueError as ve:
+            # No index for this language yet
+            logger.warning(str(ve))
+            scored = []
+        timings["search_ms"] = elapsed_ms(phase)
+
+    results = [doc for doc, _ in scored]
+    yield {
+        "event": "retrieval",
+        "results": [
+            {
+                "chunk_id": doc.metadata.get("chunk_id"),
+                "doc_id": doc.metadata.get("doc_id"),
+                "chunk_idx": doc.metadata.get("chunk_idx"),
+                "score": float(score),
+                "text": doc.page_content,
+            }
+            for doc, score in scored
+        ],
+        "timings": dict(timings),
+    }
+
+    context_stats = {}
     if not results:
-        yield "No relevant documents found to answer your question."
+        yield {"event": "token", "text": "No relevant documents found to answer your question."}
+    else:
+        logger.info(f"Found {len(results)} relevant documents for query '{query}' in {language}")
+        context, context_stats = answer_generator.build_context(results)
+        # Generate answer from RAG model once a generation slot is free
+        ticket: Optional[GenerationTicket] = None
+        try:
+            ticket = generation_scheduler.submit(priority=priority, timeout=timeout)
+            async with ticket:
+                timings["queue_ms"] = round((ticket.started_at - ticket.enqueued_at) * 1000, 2)
+                with time_stage("llm_generation", model=llm_model_name):
+                    async for chunk in answer_generator.generate_answer(query, results, language, context=context):
+                        if "ttft_ms" not in timings:
+                            timings["ttft_ms"] = elapsed_ms(started)
+                            stage_seconds.observe(time.perf_counter() - ticket.started_at,
+                                                  stage="llm_ttft", model=llm_model_name)
+                        yield {"event": "token", "text": chunk}
+        except QueueFullError as qe:
+            yield {"event": "error", "message": f"Error: {qe}"}
+        except DeadlineExceededError:
+            logger.warning(f"Query '{query}' timed out waiting for a generation slot")
+            yield {"event": "error", "message": "Error: The server is busy. Please try again shortly."}
+        finally:
+            if ticket is not None:
+                ticket.cancel()
+
+    timings["total_ms"] = elapsed_ms(started)
+    yield {"event": "done", "timings": timings, "context": context_stats}
+
+
+async def query_chatbot(query: str, language: str, k: int = 6, priority: int = 0, timeout: Optional[float] = None,
+                        search_filter: Optional[SearchFilter] = None) -> AsyncGenerator[str, None]:
+    """
+    Retrieve relevant chunks from store and generate an answer.
+    """
+    events = query_chatbot_events(query, language, k, priority=priority, timeout=timeout, search_filter=search_filter)
+    async with aclosing(events) as events:
+        async for event in events:
+            if event["event"] == "token":
+                yield event["text"]
+            elif event["event"] == "error":
+                yield event["message"]
+
+async def query_batch_events(items: List[Dict], k: int = 6, score_threshold: Optional[float] = None,
+                             priority: int = 0, timeout: Optional[float] = None,
+                             concurrency: int = BATCH_GENERATION_CONCURRENCY) -> AsyncGenerator[Dict, None]:
+    """
+    Answer several queries at once, yielding one result per query as soon as its answer is complete.
+
+    All query texts are embedded in a single encoder call and each language is searched with one
+    multi-query FAISS search, then the answers are generated with at most `concurrency` running
+    at a time (each still takes a slot from `generation_scheduler`).
+
+    Args:
+        items: Queries as {"query": ..., "language": ...}
+        k: Number of chunks retrieved per query
+        score_threshold: Drop chunks with an L2 distance above this value
+        priority: Scheduler priority of the generations
+        timeout: Seconds each generation may wait for a slot
+        concurrency: Generations of this batch running at the same time
+
+    Yields:
+        {"index", "query", "language", "answer", "results", "timings"} per query, in completion
+        order, or {"index", "query", "language", "error"} if it could not be answered
+    """
+    if not items:
         return
-    logger.info(f"Found {len(results)} relevant documents for query '{query}' in {language}")
-    # Generate answer from RAG model (sync -> thread)
-    async for chunk in answer_generator.generate_answer(query, results, language):
-        yield chunk
+    for item in items:
+        if item["language"] not in {"punjabi", "hindi", "english"}:
+            raise ValueError(f"Unsupported language '{item['language']}'. Valid options are punjabi, hindi, english.")
+
+    started = time.perf_counter()
+    logger.info(f"Batch query of {len(items)} queries")
+    for item in items:
+        queries_total.inc(language=item["language"])
+
+    # One encoder pass for every query of the batch
+    serving = await tracing.to_thread(store.serving)
+    with governor.interactive(len(items)), time_stage("query_embed_batch", model=serving.model_name):
+        embeddings = await tracing.to_thread(embed_queries, serving.embedder, [item["query"] for item in items])
+    embed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    # One multi-query search per language
+    by_language: Dict[str, List[int]] = {}
+    for index, item in enumerate(items):
+        by_language.setdefault(item["language"], []).append(index)
+    scored: List[list] = [[] for _ in items]
+    phase = time.perf_counter()
+    with governor.interactive(len(items)), time_stage("search"):
+        for language, indexes in by_language.items():
+            try:
+                hits = await tracing.to_thread(store.search_by_vectors, embeddings[indexes], language, k, score_threshold,
+                                               serving)
+            except ValueError as ve:
+                # No index for this language yet
+                logger.warning(str(ve))
+                continue
+            for index, query_hits in zip(indexes, hits):
+                scored[index] = query_hits
+    search_ms = round((time.perf_counter() - phase) * 1000, 2)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(index: int) -> Dict:
+        item = items[index]
+        result = {"index": index, "query": item["query"], "language": item["language"]}
+        hits = scored[index]
+        documents = [doc for doc, _ in hits]
+        timings = {"embed_ms": embed_ms, "search_ms": search_ms}
+        if not documents:
+            result.update(answer="No relevant documents found to answer your question.", results=[], timings=timings)
+            return result
+        async with semaphore:
+            try:
+                ticket = generation_scheduler.submit(priority=priority, timeout=timeout)
+            except QueueFullError as qe:
+                result["error"] = str(qe)
+                return result
+            try:
+                async with ticket:
+                    context, _ = answer_generator.build_context(documents)
+                    with time_stage("llm_generation", model=llm_model_name):
+                        pieces = [piece async for piece in answer_generator.generate_answer(
+                            item["query"], documents, item["language"], context=context)]
+            except DeadlineExceededError:
+                result["error"] = "Error: The server is busy. Please try again shortly."
+                return result
+            except Exception as e:
+                logger.error(f"Batch query {index} failed: {e}")
+                result["error"] = f"Error generating answer: {e}"
+                return result
+            finally:
+                ticket.cancel()
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        result.update(
+            answer="".join(pieces),
+            results=[
+                {
+                    "chunk_id": doc.metadata.get("chunk_id"),
+                    "doc_id": doc.metadata.get("doc_id"),
+                    "chunk_idx": doc.metadata.get("chunk_idx"),
+                    "score": float(score),
+                }
+                for doc, score in hits
+            ],
+            timings=timings,
+        )
+        return result
+
+    tasks = [asyncio.ensure_future(answer(index)) for index in range(len(items))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
 
 # async def generate_audio(text: str, language: str) -> str:
 #     """
@@ -101,12 +420,14 @@ async def delete_doc_by_id(doc_id: str) -> bool:
     """
     Delete a document by its ID.
     """
-    # Validate document ID
+    # Validate document ID before anything is deleted
     if not doc_id:
         raise ValueError("Invalid document ID.")
+    artifacts.check_id(doc_id)
     logger.info(f"Deleting document with ID: {doc_id}")
     # Delete the document (sync -> thread)
-    result = await asyncio.to_thread(store.delete_document_by_id, doc_id)
+    result = await tracing.to_thread(store.delete_document_by_id, doc_id)
+    await tracing.to_thread(artifacts.delete, doc_id)
     if not result:
         logger.warning(f"Document with ID {doc_id} not found.")
     else:
@@ -118,9 +439,58 @@ async def delete_all_docs() -> bool:
     Asynchronously delete all documents from all language FAISS indexes.
     """
     logger.info("Deleting all documents from the store")
-    result = await asyncio.to_thread(store.delete_all_documents)
+    result = await tracing.to_thread(store.delete_all_documents)
+    await tracing.to_thread(artifacts.clear)
     if not result:
         logger.warning("No documents found to delete.")
     else:
         logger.info("All documents deleted successfully.")
-    return result
\ No newline at end of file
+    return result
+
+async def export_snapshot(path: str) -> Dict:
+    """
+    Write a checksummed snapshot of all language indexes to a directory or .tar archive.
+    """
+    logger.info(f"Exporting index snapshot to {path}")
+    return await tracing.to_thread(store.export_snapshot, path)
+
+async def import_snapshot(path: str, verify: bool = True) -> Dict:
+    """
+    Replace all language indexes with the contents of a snapshot directory or .tar archive.
+    """
+    logger.info(f"Importing index snapshot from {path}")
+    return await tracing.to_thread(store.import_snapshot, path, verify)
+
+async def start_reembed(model_name: Optional[str] = None, backend: Optional[str] = None,
+                        num_shards: Optional[int] = None, **options) -> Dict:
+    """
+    Start re-embedding all indexes into a new generation in the background (see RAG.reembed).
+    Unset arguments keep the live model, backend and shard count.
+
+    Raises:
+        RuntimeError: if a re-embedding job is already running
+    """
+    global reembed_job
+    if reembed_job is not None and reembed_job.running:
+        raise RuntimeError("A re-embedding job is already running")
+    reembed_job = ReembedJob(store, model_name or store.model_name, backend or store.backend,
+                             num_shards, **options).start()
+    return reembed_job.status()
+
+def reembed_status() -> Optional[Dict]:
+    """Progress of the current or last re-embedding job, None if there was none."""
+    return reembed_job.status() if reembed_job is not None else None
+
+def cancel_reembed() -> bool:
+    if reembed_job is None or not reembed_job.running:
+        return False
+    reembed_job.cancel()
+    return True
+
+async def rollback_index() -> Dict:
+    """
+    Serve the previous index generation again.
+    """
+    if reembed_job is not None and reembed_job.running:
+        raise RuntimeError("A re-embedding job is running")
+    return await tracing.to_thread(store.rollback)
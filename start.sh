@@ -1,13 +1,20 @@
 #!/bin/bash
 
-# Start Ollama
-ollama serve &
+# Start Ollama, on the cores allocated to the LLM (see resources.py)
+LLM_CORES=$(python -m resources --cores llm 2>/dev/null)
+if [ -n "$LLM_CORES" ] && command -v taskset > /dev/null; then
+    taskset -c "$LLM_CORES" ollama serve &
+else
+    ollama serve &
+fi
 sleep 5
 # Start FastAPI
 uvicorn main:app --host 0.0.0.0 --port 8000 &
 
 # Start Streamlit
-streamlit run app.py --server.port 8501 --server.headless true
+# Uploads over the API limit are refused by the browser already (MB)
+streamlit run app.py --server.port 8501 --server.headless true \
+    --server.maxUploadSize $(( ${MAX_UPLOAD_BYTES:-26214400} / 1048576 ))
 
 # Wait to keep container running
 wait
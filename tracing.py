@@ -0,0 +1,294 @@
+import asyncio
+import cProfile
+import contextvars
+import functools
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from utils import logger, request_id
+
+# === Per-request tracing and on-demand profiling ===
+
+PROFILE_DIR = "profiles"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # share of requests profiled automatically
+MAX_PROFILES = 50  # profile files kept on disk
+MAX_TRACES = 256  # finished traces kept in memory for /traces/{trace_id}
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_profile_lock = threading.Lock()  # one profiled request at a time, profilers cannot be nested
+_finished_traces: "OrderedDict[str, Trace]" = OrderedDict()
+_finished_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "thread")
+
+    def __init__(self, name: str, start: float, duration: float, thread: str):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.thread = thread
+
+
+class Trace:
+    """
+    Spans recorded while handling one request, shared by all threads working on it.
+
+    `trace_id` is always generated here, so it is unique among the kept traces; an id sent by
+    the client is kept as `client_trace_id` for correlating with its own logs.
+    """
+
+    def __init__(self, name: str = "", profile: bool = False, client_trace_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.client_trace_id = client_trace_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.profile = profile
+        self.profiler: Optional[cProfile.Profile] = None
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.profile_id: Optional[str] = None
+
+    def add_span(self, name: str, start: float, duration: float) -> None:
+        # list.append is atomic, worker threads can record concurrently
+        self.spans.append(Span(name, start - self.start, duration, threading.current_thread().name))
+
+    def durations(self) -> "OrderedDict[str, float]":
+        """Total duration per span name, in order of first appearance."""
+        totals: "OrderedDict[str, float]" = OrderedDict()
+        for recorded in list(self.spans):
+            totals[recorded.name] = totals.get(recorded.name, 0.0) + recorded.duration
+        return totals
+
+    def server_timing(self) -> str:
+        """Value of the Server-Timing header summarizing the spans finished so far."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations().items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "client_trace_id": self.client_trace_id,
+            "name": self.name,
+            "profile_id": self.profile_id,
+            "spans": [
+                {
+                    "name": recorded.name,
+                    "start_ms": round(recorded.start * 1000, 3),
+                    "duration_ms": round(recorded.duration * 1000, 3),
+                    "thread": recorded.thread,
+                }
+                for recorded in sorted(self.spans, key=lambda s: s.start)
+            ],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def get_finished_trace(trace_id: str) -> Optional[Trace]:
+    with _finished_lock:
+        return _finished_traces.get(trace_id)
+
+
+@contextmanager
+def span(name: str):
+    """Record the enclosed block as a span of the current request, if there is one."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter() - start)
+
+
+def traced(name: str):
+    """Decorator recording every call of a sync or async function as a span."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _run_profiled(trace: Trace, func, *args, **kwargs):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ profiles all threads from the request's main profiler already
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        trace.thread_profiles.append(profiler)
+
+
+async def to_thread(func, *args, **kwargs):
+    """
+    asyncio.to_thread that keeps the request trace and, for profiled requests, also
+    profiles the work done in the worker thread.
+    """
+    trace = _current_trace.get()
+    if trace is None or trace.profiler is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(_run_profiled, trace, func, *args, **kwargs)
+
+
+async def run_in_executor(executor, func, *args, **kwargs):
+    """to_thread on a given executor (e.g. an engine's pinned pool), keeping the request trace."""
+    trace = _current_trace.get()
+    if trace is not None and trace.profiler is not None:
+        func = functools.partial(_run_profiled, trace, func)
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def set_sample_rate(rate: float) -> None:
+    global PROFILE_SAMPLE_RATE
+    PROFILE_SAMPLE_RATE = min(max(rate, 0.0), 1.0)
+
+
+def list_profiles() -> List[Dict]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        path = os.path.join(PROFILE_DIR, name)
+        if name.endswith(".prof") and os.path.isfile(path):
+            profiles.append({"profile_id": name[:-len(".prof")], "size_bytes": os.path.getsize(path)})
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Path of a stored profile, or None if there is no such profile."""
+    if not profile_id.replace("-", "").replace("_", "").isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.isfile(path) else None
+
+
+def _save_profile(trace: Trace) -> None:
+    """Write a finished request's profile and drop the oldest ones, then allow the next profiled request."""
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stats = pstats.Stats(trace.profiler)
+        for profiler in trace.thread_profiles:
+            stats.add(profiler)
+        path = os.path.join(PROFILE_DIR, f"{trace.profile_id}.prof")
+        stats.dump_stats(path)
+        logger.info(f"Saved CPU profile of {trace.name} ({trace.trace_id}) to {path}")
+
+        for old in list_profiles()[MAX_PROFILES:]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{old['profile_id']}.prof"))
+            except OSError:
+                pass
+    except Exception as e:
+        trace.profile_id = None
+        logger.error(f"Failed to save profile for {trace.trace_id}: {e}")
+    finally:
+        _profile_lock.release()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that traces every HTTP request.
+
+    Adds `X-Trace-Id` (generated per request; an `X-Trace-Id` sent by the client is recorded in
+    the trace as `client_trace_id`) and a `Server-Timing` header summarizing the spans finished before the
+    response started (for streamed responses that is retrieval, not generation; the full trace
+    is available from /traces/{trace_id} afterwards). A request is profiled when it has
+    `?profile=1` or an `X-Profile: 1` header, or is picked by PROFILE_SAMPLE_RATE. The profile
+    covers the event loop thread, which may include other requests running concurrently, and
+    the worker threads started through tracing.to_thread. Profiles are written by a background
+    thread once the request has finished.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        query_string = scope.get("query_string", b"").decode("latin-1")
+        wants_profile = (
+            headers.get("x-profile") == "1"
+            or "profile=1" in query_string.split("&")
+            or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+        )
+        client_trace_id = headers.get("x-trace-id", "")
+        if not (client_trace_id.isalnum() and len(client_trace_id) <= 64):
+            client_trace_id = None
+        trace = Trace(name=f"{scope.get('method')} {scope.get('path')}", profile=wants_profile,
+                      client_trace_id=client_trace_id)
+        token = _current_trace.set(trace)
+        request_token = request_id.set(trace.trace_id)
+
+        profiling = wants_profile and _profile_lock.acquire(blocking=False)
+        if profiling:
+            trace.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{trace.trace_id}"
+            trace.profiler = cProfile.Profile()
+            try:
+                trace.profiler.enable()
+            except ValueError:
+                trace.profiler = None
+                trace.profile_id = None
+                _profile_lock.release()
+                profiling = False
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                extra = [
+                    (b"x-trace-id", trace.trace_id.encode("latin-1")),
+                    (b"server-timing", trace.server_timing().encode("latin-1")),
+                ]
+                if profiling:
+                    # The profile can be downloaded from /profiles/{id} once the response has finished
+                    extra.append((b"x-profile-id", trace.profile_id.encode("latin-1")))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            with span("request"):
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            if profiling:
+                trace.profiler.disable()
+                # Aggregating and dumping the stats takes a while, keep it off the event loop
+                threading.Thread(target=_save_profile, args=(trace,), name="profile-save", daemon=True).start()
+            _current_trace.reset(token)
+            with _finished_lock:
+                _finished_traces[trace.trace_id] = trace
+                while len(_finished_traces) > MAX_TRACES:
+                    _finished_traces.popitem(last=False)
+            client = f" (client trace {trace.client_trace_id})" if trace.client_trace_id else ""
+            logger.info(f"Trace {trace.trace_id}{client} {trace.name}: {trace.server_timing()}")
+            request_id.reset(request_token)
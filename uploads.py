@@ -0,0 +1,205 @@
+import io
+import json
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Optional
+
+import xxhash
+
+import tracing
+from utils import DATA_DIR, logger
+
+# === Streaming, bounded document uploads ===
+#
+# An upload is written to a temporary file next to its destination while its size is checked
+# and its content hash computed, in one pass over the bytes, then renamed into place. The bytes
+# stay available in memory for the image decoder, so OCR does not read the file back.
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))  # per image
+UPLOAD_CHUNK_BYTES = 1 << 20
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # form fields and part headers allowed on top of the file
+# File signatures of the accepted image types, by extension
+IMAGE_SIGNATURES = {
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".jpg": (b"\xff\xd8\xff",),
+    ".jpeg": (b"\xff\xd8\xff",),
+}
+
+
+class UploadError(Exception):
+    """The upload is rejected; `status_code` is the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredUpload:
+    """An upload moved into place: its path, xxh64 content hash (as artifacts.file_hash), size and bytes."""
+
+    def __init__(self, path: str, content_hash: str, size: int, data: bytes):
+        self.path = path
+        self.content_hash = content_hash
+        self.size = size
+        self.data = data
+
+    def open(self) -> BinaryIO:
+        """The uploaded bytes as a file object, for the image decoder."""
+        return io.BytesIO(self.data)
+
+
+class UploadWriter:
+    """
+    Receives an upload chunk by chunk. The first chunk must carry the image signature matching
+    the file extension, and the total size must stay within `max_bytes`; otherwise UploadError
+    is raised as soon as that is known and the temporary file is removed.
+    """
+
+    def __init__(self, filename: str, doc_uuid: str, directory: str = DATA_DIR, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.extension = os.path.splitext(filename or "")[-1].lower()
+        if self.extension not in IMAGE_SIGNATURES:
+            raise UploadError(400, "Invalid file type. Please upload an image.")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, doc_uuid + self.extension)
+        if os.path.exists(self.path):
+            raise UploadError(400, "File already exists.")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.digest = xxhash.xxh64()
+        self.chunks = []
+        # Same directory as the destination, so the final rename is atomic
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        try:
+            if self.size == 0 and not chunk.startswith(IMAGE_SIGNATURES[self.extension]):
+                raise UploadError(400, f"File content is not a {self.extension[1:].upper()} image.")
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise UploadError(413, f"File is larger than {self.max_bytes // (1024 * 1024)} MB.")
+            self.digest.update(chunk)
+            self.chunks.append(chunk)
+            self.file.write(chunk)
+        except BaseException:
+            self.abort()
+            raise
+
+    def commit(self) -> StoredUpload:
+        try:
+            if self.size == 0:
+                raise UploadError(400, "Empty file.")
+            self.file.close()
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        return StoredUpload(self.path, self.digest.hexdigest(), self.size, b"".join(self.chunks))
+
+    def abort(self) -> None:
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+async def store_upload(file, doc_uuid: str, directory: str = DATA_DIR, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredUpload:
+    """
+    Stream a FastAPI UploadFile into `directory` as `{doc_uuid}{extension}`.
+
+    Raises:
+        UploadError: for a wrong type or signature, an empty file, or one over `max_bytes`
+    """
+    size = getattr(file, "size", None)  # known to recent Starlette versions once the form is parsed
+    if size is not None and size > max_bytes:
+        raise UploadError(413, f"File is larger than {max_bytes // (1024 * 1024)} MB.")
+    writer = UploadWriter(file.filename, doc_uuid, directory, max_bytes)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            await tracing.to_thread(writer.write, chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return await tracing.to_thread(writer.commit)
+
+
+def store_upload_file(source: BinaryIO, filename: str, doc_uuid: str, directory: str = DATA_DIR,
+                      max_bytes: int = MAX_UPLOAD_BYTES) -> StoredUpload:
+    """Same as store_upload, from a synchronous file object (the Streamlit app in local mode)."""
+    writer = UploadWriter(filename, doc_uuid, directory, max_bytes)
+    try:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_BYTES), b""):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware answering 413 for request bodies over the upload limit on `paths`, before
+    the multipart body is parsed: from Content-Length when sent, otherwise by counting the body
+    as it arrives and stopping the request once it is too large.
+    """
+
+    def __init__(self, app, paths: Iterable[str] = ("/add_document",),
+                 max_bytes: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": f"Request body is larger than {self.max_bytes // (1024 * 1024)} MB."}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        content_length: Optional[int] = None
+        try:
+            content_length = int(headers[b"content-length"])
+        except (KeyError, ValueError):
+            pass
+        if content_length is not None and content_length > self.max_bytes:
+            logger.warning(f"Rejected {scope['path']} upload of {content_length} bytes")
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Ends the body for the app, which then stops parsing it
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if exceeded and not response_started:
+                return  # the 413 below replaces whatever the app answers to the cut-off body
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            logger.warning(f"Rejected {scope['path']} upload over {self.max_bytes} bytes")
+            await self._reject(send)
@@ -1,28 +1,132 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
 
 # === Logger Configuration ===
 
 LOG_NAME = "myapp"
 LOG_FILE = f"logs/{LOG_NAME}.log"
-LOG_LEVEL = logging.INFO
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" (one object per line) or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records waiting for the writer thread; beyond that they are dropped
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))  # share of per-item debug events kept
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "10"))  # per-item debug events per second, per event name
 MAX_BYTES = 10 * 1024 * 1024  # 10 MB
 BACKUP_COUNT = 5
 
+# Id of the request being handled (the trace id, set by tracing.TracingMiddleware), added to every record
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
 # Ensure log directory exists
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the request id and any structured `fields`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "fields", None):
+            entry.update(record.fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The previous plain-text format, with the request id and fields appended."""
+
+    def __init__(self):
+        super().__init__(fmt='%(asctime)s | %(levelname)s | %(name)s | %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extras = dict(getattr(record, "fields", None) or {})
+        if getattr(record, "request_id", None):
+            extras["request_id"] = record.request_id
+        return text + "".join(f" {key}={value}" for key, value in extras.items())
+
+
+class AsyncLogHandler(QueueHandler):
+    """
+    Hands records to a background writer thread. The calling thread only captures the
+    message, request id and traceback; formatting and I/O happen on the writer thread.
+    When the queue is full, records below WARNING are dropped (and counted) instead of waiting.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        record.request_id = request_id.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+            else:
+                self.queue.put(record)
+
+
+class EventSampler:
+    """
+    Cheap decision whether to log one of a high-volume stream of per-item events: a random
+    sample of them, capped per event name by a token bucket.
+    """
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE, rate_limit: float = LOG_RATE_LIMIT):
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._buckets: Dict[str, list] = {}  # event -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def should_log(self, event: str) -> bool:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(event, [self.rate_limit, now])
+            bucket[0] = min(self.rate_limit, bucket[0] + (now - bucket[1]) * self.rate_limit)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                return False
+            bucket[0] -= 1.0
+            return True
+
+
 # Create logger
 logger = logging.getLogger(LOG_NAME)
 logger.setLevel(LOG_LEVEL)
 logger.propagate = False  # Prevent logs from being handled by root logger multiple times
 
 # Formatter
-formatter = logging.Formatter(
-    fmt='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
 
 # File handler (UTF-8 encoded, rotating)
 file_handler = RotatingFileHandler(
@@ -32,12 +136,30 @@ file_handler = RotatingFileHandler(
     encoding='utf-8'
 )
 file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 
 # Optional: Console handler
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+
+# Both handlers run on the listener thread, request handlers only enqueue
+log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+log_handler = AsyncLogHandler(log_queue)
+logger.addHandler(log_handler)
+log_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)  # flush what is still queued on exit
+
+event_sampler = EventSampler()
+
+
+def log_event(event: str, level: int = logging.DEBUG, **fields) -> None:
+    """
+    Log a per-item event (one per chunk, per vector, ...) as structured fields, sampled and
+    rate limited by `event_sampler`. Costs one level check when the level is disabled.
+    """
+    if not logger.isEnabledFor(level) or not event_sampler.should_log(event):
+        return
+    logger.log(level, event, extra={"fields": {"event": event, **fields}})
 
 # === Example Logs ===
 